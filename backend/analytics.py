@@ -0,0 +1,287 @@
+"""
+Аналитика для админки: освоение программ, воронка по дням, активность по датам.
+
+Агрегаты считаются в SQL (GROUP BY по user_progress) обычными SELECT, без
+блокировки записи, и только затем готовые строки (их порядка числа программ
+и дней) заменяют содержимое сводных таблиц analytics_* короткой транзакцией.
+Запросы дашборда читают только сводные таблицы, поэтому сколько бы раз их ни
+открывали, полный проход по user_progress выполняется лишь при обновлении —
+раз в ANALYTICS_REFRESH_SECONDS или по POST /analytics/refresh (с заголовком
+X-Analytics-Token: ANALYTICS_REFRESH_TOKEN).
+
+Плановое обновление выполняет один процесс из всех воркеров: тот, кто держит
+аренду в job_leases (claim_lease). Аренда продлевается при каждом обновлении,
+а если владелец пропал, после ее истечения обновление подхватывает другой.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Date, cast, delete, distinct, func, insert, select
+from sqlalchemy.orm import Session
+
+import crud
+import models
+import schemas
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "600"))
+# За сколько последних дней считать ежедневную активность
+ANALYTICS_DAYS = int(os.getenv("ANALYTICS_DAYS", "90"))
+# Токен для POST /analytics/refresh; пустое значение — ручное обновление выключено
+ANALYTICS_REFRESH_TOKEN = os.getenv("ANALYTICS_REFRESH_TOKEN", "")
+
+REFRESH_LEASE = "analytics_refresh"
+
+summary_table = models.AnalyticsProgramSummary.__table__
+funnel_table = models.AnalyticsDayFunnel.__table__
+daily_table = models.AnalyticsDailyActive.__table__
+
+
+def _date(db: Session, column):
+    # CAST(... AS DATE) в SQLite дает число, а не дату
+    if db.get_bind().dialect.name == "sqlite":
+        return func.date(column, type_=Date)
+    return cast(column, Date)
+
+
+def refresh_analytics(db: Session, days: int = ANALYTICS_DAYS) -> datetime:
+    """
+    Пересобирает все сводные таблицы. Агрегаты читаются до начала записи, а
+    замена строк идет одной транзакцией: читатели видят либо старый, либо
+    новый срез, а блокировка записи SQLite не держится на время прохода по
+    user_progress.
+    """
+    progress = models.UserProgress
+    workout = models.Workout
+    refreshed_at = datetime.utcnow()
+
+    total_days = (
+        select(workout.program_id, func.count().label("total_days"))
+        .group_by(workout.program_id)
+        .subquery()
+    )
+    per_user = (
+        select(
+            progress.program_id,
+            progress.user_id,
+            func.count(distinct(progress.workout_id)).filter(progress.is_completed.is_(True)).label("completed"),
+        )
+        .group_by(progress.program_id, progress.user_id)
+        .subquery()
+    )
+    per_program = (
+        select(
+            per_user.c.program_id,
+            func.count().label("users_started"),
+            func.sum(per_user.c.completed).label("completed_workouts"),
+            func.count().filter(
+                (per_user.c.completed >= total_days.c.total_days) & (total_days.c.total_days > 0)
+            ).label("users_completed"),
+        )
+        .select_from(per_user.outerjoin(total_days, total_days.c.program_id == per_user.c.program_id))
+        .group_by(per_user.c.program_id)
+        .subquery()
+    )
+    program = models.WorkoutProgram
+    summary_select = (
+        select(
+            program.id.label("program_id"),
+            func.coalesce(total_days.c.total_days, 0).label("total_days"),
+            func.coalesce(per_program.c.users_started, 0).label("users_started"),
+            func.coalesce(per_program.c.users_completed, 0).label("users_completed"),
+            func.coalesce(per_program.c.completed_workouts, 0).label("completed_workouts"),
+        )
+        .select_from(program)
+        .outerjoin(total_days, total_days.c.program_id == program.id)
+        .outerjoin(per_program, per_program.c.program_id == program.id)
+    )
+
+    funnel_select = (
+        select(
+            workout.program_id,
+            workout.id.label("workout_id"),
+            workout.day_number,
+            func.count(distinct(progress.user_id)).label("completed_users"),
+        )
+        .select_from(workout)
+        .outerjoin(progress, (progress.workout_id == workout.id) & progress.is_completed.is_(True))
+        .group_by(workout.id)
+    )
+
+    completed_on = _date(db, progress.completed_at)
+    daily_select = (
+        select(
+            completed_on.label("day"),
+            func.count(distinct(progress.user_id)).label("active_users"),
+            func.count().label("completions"),
+        )
+        .where(progress.is_completed.is_(True), progress.completed_at >= refreshed_at - timedelta(days=days))
+        .group_by(completed_on)
+    )
+
+    # Чтение: в SQLite SELECT не берет блокировку записи, в PostgreSQL не мешает писателям
+    rows = {
+        summary_table: [{**row._mapping, "refreshed_at": refreshed_at} for row in db.execute(summary_select)],
+        funnel_table: [dict(row._mapping) for row in db.execute(funnel_select)],
+        daily_table: [dict(row._mapping) for row in db.execute(daily_select)],
+    }
+    # Запись: только замена готовых строк
+    for table, table_rows in rows.items():
+        db.execute(delete(table))
+        if table_rows:
+            db.execute(insert(table), table_rows)
+    db.commit()
+    return refreshed_at
+
+
+def _refreshed_at(db: Session) -> Optional[datetime]:
+    return db.scalar(select(func.max(summary_table.c.refreshed_at)))
+
+
+def _rate(part: int, whole: int) -> float:
+    return round(part / whole, 4) if whole else 0.0
+
+
+def get_program_report(db: Session) -> schemas.AnalyticsReport:
+    summary = models.AnalyticsProgramSummary
+    rows = db.execute(
+        select(summary, models.WorkoutProgram.name)
+        .join(models.WorkoutProgram, models.WorkoutProgram.id == summary.program_id)
+        .order_by(summary.users_started.desc(), summary.program_id)
+    ).all()
+    return schemas.AnalyticsReport(
+        refreshed_at=max((row[0].refreshed_at for row in rows), default=None),
+        programs=[
+            schemas.ProgramAnalytics(
+                program_id=row[0].program_id,
+                name=row.name,
+                total_days=row[0].total_days,
+                users_started=row[0].users_started,
+                users_completed=row[0].users_completed,
+                completed_workouts=row[0].completed_workouts,
+                completion_rate=_rate(row[0].users_completed, row[0].users_started),
+            )
+            for row in rows
+        ],
+    )
+
+
+def get_program_funnel(db: Session, program_id: int) -> Optional[schemas.ProgramFunnel]:
+    summary = db.get(models.AnalyticsProgramSummary, program_id)
+    if summary is None:
+        return None
+    steps = db.scalars(
+        select(models.AnalyticsDayFunnel)
+        .where(models.AnalyticsDayFunnel.program_id == program_id)
+        .order_by(models.AnalyticsDayFunnel.day_number, models.AnalyticsDayFunnel.workout_id)
+    ).all()
+    return schemas.ProgramFunnel(
+        refreshed_at=summary.refreshed_at,
+        program_id=program_id,
+        users_started=summary.users_started,
+        days=[
+            schemas.DayFunnelStep(
+                day_number=step.day_number,
+                workout_id=step.workout_id,
+                completed_users=step.completed_users,
+                rate=_rate(step.completed_users, summary.users_started),
+            )
+            for step in steps
+        ],
+    )
+
+
+def get_daily_active(db: Session, days: int) -> schemas.DailyActiveReport:
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+    rows = db.scalars(
+        select(models.AnalyticsDailyActive)
+        .where(models.AnalyticsDailyActive.day >= since)
+        .order_by(models.AnalyticsDailyActive.day)
+    ).all()
+    return schemas.DailyActiveReport(
+        refreshed_at=_refreshed_at(db),
+        days=[schemas.DailyActive.model_validate(row, from_attributes=True) for row in rows],
+    )
+
+
+def claim_lease(db: Session, name: str, owner: str, ttl: float) -> bool:
+    """
+    Берет или продлевает аренду name на ttl секунд; False — ее держит другой
+    владелец. Одна строка на аренду, условный upsert атомарен в SQLite и PostgreSQL.
+    """
+    now = datetime.utcnow()
+    table = models.JobLease.__table__
+    statement = crud.dialect_insert(db, table).values(name=name, owner=owner, expires_at=now + timedelta(seconds=ttl))
+    statement = statement.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"owner": statement.excluded.owner, "expires_at": statement.excluded.expires_at},
+        where=(table.c.owner == statement.excluded.owner) | (table.c.expires_at < now),
+    )
+    claimed = db.execute(statement.returning(table.c.owner)).first() is not None
+    db.commit()
+    return claimed
+
+
+class AnalyticsRefresher:
+    """Фоновое обновление сводных таблиц каждые interval секунд (0 — только вручную)."""
+
+    def __init__(self, interval: float = ANALYTICS_REFRESH_SECONDS):
+        self.interval = interval
+        self.last_refresh_ms = 0.0
+        # Владелец аренды: этот процесс
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def refresh(self) -> datetime:
+        from database import run_in_session
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Параллельные ручные и плановые обновления не пересобирают таблицы дважды одновременно
+        async with self._lock:
+            started = time.perf_counter()
+            refreshed_at = await run_in_session(refresh_analytics)
+            self.last_refresh_ms = (time.perf_counter() - started) * 1000
+            return refreshed_at
+
+    def start(self):
+        if self.interval > 0:
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def refresh_if_leader(self) -> Optional[datetime]:
+        """Плановое обновление: только в процессе, который держит аренду; иначе None."""
+        from database import run_in_session
+
+        # Срок больше периода: владелец продлевает аренду раньше, чем она истечет
+        if not await run_in_session(claim_lease, REFRESH_LEASE, self.owner, self.interval * 1.5):
+            return None
+        return await self.refresh()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_if_leader()
+            except Exception:
+                logger.exception("Analytics refresh failed")
+            await asyncio.sleep(self.interval)
+
+
+analytics_refresher = AnalyticsRefresher()
@@ -0,0 +1,326 @@
+"""
+Нагрузочный прогон API: реалистичная смесь сценариев с метриками по эндпоинтам.
+
+Приложение вызывается в процессе через httpx.ASGITransport (--transport asgi)
+и/или через отдельный uvicorn (--transport uvicorn). Каждый транспорт получает
+свою копию временной SQLite базы заданного размера, сгенерированной
+dataset.py. Сценарии, веса задаются --mix:
+
+  browse   каталог: страница кратких карточек, затем программа целиком
+  tracker  запуск мини-приложения: /bootstrap, прогресс и сводка по программе
+  toggle   отметка дня: POST /progress
+  admin    правка упражнения в админке (сбрасывает кэш программы)
+
+Для каждого эндпоинта выводятся число запросов и ошибок, p50/p95/p99 и число
+SQL-запросов на запрос (из заголовка Server-Timing, который отдает само приложение).
+--save записывает результат в JSON, --compare сравнивает с сохраненным
+прогоном и завершается с кодом 1, если p95 или число SQL эндпоинта выросли
+либо пропускная способность упала больше чем в --threshold раз.
+
+    python bench_api.py --programs 200 --users 2000 --requests 5000 --save baseline.json
+    python bench_api.py --programs 200 --users 2000 --requests 5000 --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+from sqlalchemy import create_engine
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("browse", "tracker", "toggle", "admin")
+DEFAULT_MIX = "browse=50,tracker=30,toggle=15,admin=5"
+
+def seed(path: str, config):
+    # Импорт после выставления DATABASE_URL в main(): database.py читает его при импорте
+    from sqlalchemy.orm import Session
+
+    import dataset
+    import migrations
+
+    engine = create_engine(f"sqlite:///{path}")
+    migrations.create_schema(engine)
+    with Session(engine) as db:
+        dataset.generate(db, config)
+    engine.dispose()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statements = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        from metrics import parse_server_timing
+
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[name].append(time.perf_counter() - started)
+        # desc="queries: N"; без заголовка (SERVER_TIMING=0) число SQL неизвестно
+        database_timing = parse_server_timing(response.headers.get("server-timing")).get("db")
+        if database_timing is not None:
+            self.statements[name].append(int(database_timing["desc"].rsplit(" ", 1)[-1]))
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+
+class Scenarios:
+    def __init__(self, config):
+        import dataset
+
+        self.dataset = dataset
+        self.config = config
+        self.programs, self.days, self.exercises, self.users = config.programs, config.days, config.exercises, config.users
+
+    async def browse(self, client, rng, recorder: Recorder):
+        after_id = rng.randrange(0, max(self.programs - 20, 1))
+        await recorder.call(client, "GET /programs/summary", "GET", "/programs/summary", params={"after_id": after_id, "limit": 20})
+        program_id = rng.randint(1, self.programs)
+        await recorder.call(client, "GET /programs/{program_id}", "GET", f"/programs/{program_id}")
+
+    async def tracker(self, client, rng, recorder: Recorder):
+        user = rng.randint(1, self.users)
+        response = await recorder.call(
+            client, "GET /bootstrap", "GET", "/bootstrap", params={"telegram_id": self.dataset.telegram_id(user)},
+        )
+        program = response.json().get("program") if response.status_code == 200 else None
+        program_id = program["id"] if program else rng.randint(1, self.programs)
+        await recorder.call(
+            client, "GET /users/{user_id}/programs/{program_id}/progress", "GET",
+            f"/users/{user}/programs/{program_id}/progress",
+        )
+        await recorder.call(
+            client, "GET /users/{user_id}/programs/{program_id}/stats", "GET",
+            f"/users/{user}/programs/{program_id}/stats",
+        )
+
+    async def toggle(self, client, rng, recorder: Recorder):
+        program_id = rng.randint(1, self.programs)
+        await recorder.call(client, "POST /progress", "POST", "/progress", json={
+            "user_id": rng.randint(1, self.users),
+            "program_id": program_id,
+            "workout_id": self.dataset.workout_id(self.config, program_id, rng.randint(1, self.days)),
+            "is_completed": rng.random() < 0.8,
+        })
+
+    async def admin(self, client, rng, recorder: Recorder):
+        workout_id = rng.randint(1, self.programs * self.days)
+        exercise_id = self.dataset.exercise_id(self.config, workout_id, rng.randint(1, self.exercises))
+        await recorder.call(client, "PUT /exercises/{exercise_id}", "PUT", f"/exercises/{exercise_id}", json={
+            "workout_id": workout_id, "name": f"Упражнение {rng.randint(1, 99)}", "sets": rng.randint(2, 5),
+            "reps": "8-10", "rest_time": 90, "description": "Описание упражнения",
+        })
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {SCENARIOS}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def run_load(client: httpx.AsyncClient, scenarios: Scenarios, mix: dict, total: int, concurrency: int, seed_value: int):
+    recorder = Recorder()
+    names, weights = list(mix), list(mix.values())
+    remaining = [total]
+
+    async def worker(rng: random.Random):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            scenario = rng.choices(names, weights)[0]
+            await getattr(scenarios, scenario)(client, rng, recorder)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(random.Random(seed_value * 1000 + i)) for i in range(concurrency)))
+    return recorder, time.perf_counter() - started
+
+
+def percentile(values, q: float) -> float:
+    # Ближайший ранг: для малых выборок без интерполяции
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for name, latencies in sorted(recorder.latencies.items()):
+        statements = recorder.statements[name]
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": recorder.errors[name],
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "sql_per_request": round(sum(statements) / len(statements), 2) if statements else None,
+        }
+    requests_total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {
+        "requests": requests_total,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests_total / elapsed, 1),
+        "endpoints": endpoints,
+    }
+
+
+async def run_asgi(args, scenarios: Scenarios, mix: dict) -> dict:
+    import main as app_module
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with app_module.app.router.lifespan_context(app_module.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            recorder, elapsed = await run_load(client, scenarios, mix, args.requests, args.concurrency, args.seed)
+    return summarize(recorder, elapsed)
+
+
+def free_port() -> int:
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_path: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health").raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def run_uvicorn(args, scenarios: Scenarios, mix: dict, database_path: str) -> dict:
+    port = free_port()
+    server = start_server(database_path, port)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            recorder, elapsed = await run_load(client, scenarios, mix, args.requests, args.concurrency, args.seed)
+    finally:
+        server.terminate()
+        server.wait()
+    return summarize(recorder, elapsed)
+
+
+def print_report(transport: str, result: dict):
+    print(f"\n[{transport}] {result['requests']} requests in {result['seconds']} s, {result['throughput_rps']} req/s")
+    print(f"{'endpoint':<52} {'reqs':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql/req':>8}")
+    for name, endpoint in result["endpoints"].items():
+        sql = "-" if endpoint["sql_per_request"] is None else f"{endpoint['sql_per_request']:.2f}"
+        print(
+            f"{name:<52} {endpoint['requests']:>6} {endpoint['errors']:>6} {endpoint['p50_ms']:>8.1f} "
+            f"{endpoint['p95_ms']:>8.1f} {endpoint['p99_ms']:>8.1f} {sql:>8}"
+        )
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Список регрессий относительно baseline: p95 выше или пропускная способность ниже в threshold раз."""
+    regressions = []
+    for transport, result in results.items():
+        previous = baseline.get("results", {}).get(transport)
+        if previous is None:
+            continue
+        if result["throughput_rps"] * threshold < previous["throughput_rps"]:
+            regressions.append(f"{transport}: throughput {previous['throughput_rps']} -> {result['throughput_rps']} req/s")
+        for name, endpoint in result["endpoints"].items():
+            before = previous["endpoints"].get(name)
+            if before and endpoint["p95_ms"] > before["p95_ms"] * threshold:
+                regressions.append(f"{transport} {name}: p95 {before['p95_ms']} -> {endpoint['p95_ms']} ms")
+            # Доля попаданий в кэш от прогона к прогону немного плавает, поэтому тот же порог
+            if before and endpoint["sql_per_request"] is not None and before["sql_per_request"] is not None \
+                    and endpoint["sql_per_request"] > before["sql_per_request"] * threshold:
+                regressions.append(
+                    f"{transport} {name}: SQL per request {before['sql_per_request']} -> {endpoint['sql_per_request']}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=("asgi", "uvicorn", "both"), default="both")
+    parser.add_argument("--programs", type=int, default=100)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--exercises", type=int, default=6)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=3000, help="Number of scenarios to run")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Compare with a JSON file written by --save")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_api_")
+    template = os.path.join(workdir, "template.db")
+    paths = {transport: os.path.join(workdir, f"{transport}.db") for transport in ("asgi", "uvicorn")}
+    # Приложение в процессе импортируется уже с базой своей копии
+    os.environ["DATABASE_URL"] = f"sqlite:///{paths['asgi']}"
+    os.environ.setdefault("ANALYTICS_REFRESH_SECONDS", "0")
+
+    config = {
+        key: value for key, value in vars(args).items() if key not in ("transport", "save", "compare", "threshold")
+    }
+    results = {}
+    try:
+        import dataset
+
+        config_dataset = dataset.DatasetConfig(
+            programs=args.programs, days=args.days, exercises=args.exercises, users=args.users, seed=args.seed,
+        )
+        seed(template, config_dataset)
+        scenarios = Scenarios(config_dataset)
+        transports = ("asgi", "uvicorn") if args.transport == "both" else (args.transport,)
+        for transport in transports:
+            shutil.copy(template, paths[transport])
+            if transport == "asgi":
+                results[transport] = asyncio.run(run_asgi(args, scenarios, args.mix))
+            else:
+                results[transport] = asyncio.run(run_uvicorn(args, scenarios, args.mix, paths[transport]))
+            print_report(transport, results[transport])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"created_at": datetime.utcnow().isoformat(), "config": config, "results": results}, f, indent=2)
+        print(f"\nSaved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"\nWarning: baseline was recorded with different settings: {baseline.get('config')}")
+        regressions = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {args.compare}: " + ("no regressions" if not regressions else "REGRESSIONS"))
+        for line in regressions:
+            print(f"  {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Сравнение sync- и async-режима работы с БД (DB_ASYNC=0/1).
+
+Для каждого режима поднимается отдельный uvicorn на временной SQLite базе,
+после чего N параллельных клиентов гоняют смесь запросов чтения и записи.
+Кэш каталога выключен, чтобы каждый запрос доходил до БД.
+
+    python bench_db_modes.py --concurrency 100 --requests 3000
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def seed(database_url: str, programs: int, days: int, users: int):
+    # database.py читает DATABASE_URL при импорте
+    os.environ["DATABASE_URL"] = database_url
+    from database import Base, SessionLocal, engine
+    import models
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        for p in range(programs):
+            program = models.WorkoutProgram(
+                difficulty="beginner", goal="weight_loss", location="home", name=f"Программа {p + 1}",
+            )
+            for d in range(days):
+                workout = models.Workout(day_number=d + 1, title=f"День {d + 1}")
+                workout.exercises = [
+                    models.Exercise(name=f"Упражнение {e + 1}", sets=3, reps="10", rest_time=60)
+                    for e in range(5)
+                ]
+                program.workouts.append(workout)
+            db.add(program)
+        db.add_all([models.User(telegram_id=str(100000 + u)) for u in range(users)])
+        db.commit()
+    finally:
+        db.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url: str, db_async: bool, port: int) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=database_url, DB_ASYNC="1" if db_async else "0", CATALOG_CACHE_SIZE="0")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health").raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def run_load(base_url: str, concurrency: int, total: int, programs: int, days: int, users: int):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(client: httpx.AsyncClient, rng: random.Random):
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            program_id = rng.randint(1, programs)
+            user_id = rng.randint(1, users)
+            roll = rng.random()
+            started = time.perf_counter()
+            if roll < 0.6:
+                response = await client.get(f"/programs/{program_id}")
+            elif roll < 0.85:
+                response = await client.get(f"/users/{user_id}/progress")
+            else:
+                workout_id = (program_id - 1) * days + rng.randint(1, days)
+                response = await client.post("/progress", json={
+                    "user_id": user_id, "program_id": program_id, "workout_id": workout_id,
+                })
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, random.Random(i)) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "rps": total / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--programs", type=int, default=20)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_db_modes_")
+    database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    seed(database_url, args.programs, args.days, args.users)
+
+    print(f"{'mode':<6} {'req/s':>9} {'p50, ms':>9} {'p95, ms':>9} {'errors':>7}")
+    for db_async in (False, True):
+        port = free_port()
+        server = start_server(database_url, db_async, port)
+        try:
+            result = asyncio.run(run_load(
+                f"http://127.0.0.1:{port}", args.concurrency, args.requests, args.programs, args.days, args.users,
+            ))
+        finally:
+            server.terminate()
+            server.wait()
+        mode = "async" if db_async else "sync"
+        print(f"{mode:<6} {result['rps']:>9.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Сериализация каталога: ORM + pydantic против строк SELECT + orjson.
+
+На временной SQLite базе с синтетическим каталогом сравниваются три пути
+получения JSON для GET /programs (без кэша ответа):
+
+  orm+response_model  ORM-объекты -> валидация response_model -> json (как было до
+                      перехода на готовые байты: проверка и сериализация FastAPI)
+  orm+dump_json       ORM-объекты -> TypeAdapter.validate_python -> dump_json
+  rows+orjson         crud.get_program_documents -> orjson.dumps
+
+Для каждого пути выводятся медиана и минимум по повторам, размер ответа и
+совпадение JSON с путем rows+orjson.
+
+    python bench_serialization.py --programs 1000 --days 14 --exercises 6 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+import crud
+import models
+import schemas
+
+program_list_adapter = TypeAdapter(List[schemas.WorkoutProgram])
+
+
+def seed(engine, programs: int, days: int, exercises: int):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.WorkoutProgram), [
+            {
+                "id": p + 1, "difficulty": ("beginner", "intermediate", "advanced")[p % 3],
+                "goal": ("weight_loss", "muscle_gain", "endurance")[p % 3], "location": ("home", "gym")[p % 2],
+                "name": f"Программа {p + 1}", "description": "Описание программы",
+            }
+            for p in range(programs)
+        ])
+        conn.execute(insert(models.Workout), [
+            {
+                "id": p * days + d + 1, "program_id": p + 1, "day_number": d + 1,
+                "title": f"День {d + 1}", "description": "Описание дня",
+            }
+            for p in range(programs) for d in range(days)
+        ])
+        conn.execute(insert(models.Exercise), [
+            {
+                "workout_id": w + 1, "name": f"Упражнение {e + 1}", "sets": 3, "reps": "10-12",
+                "rest_time": 60, "description": "Описание упражнения",
+            }
+            for w in range(programs * days) for e in range(exercises)
+        ])
+
+
+def orm_response_model(db) -> bytes:
+    # Путь FastAPI для return <ORM> с response_model: валидация, затем json-совместимый dict и рендер
+    programs = program_list_adapter.validate_python(crud.get_programs(db), from_attributes=True)
+    return json.dumps(jsonable_encoder(programs), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def orm_dump_json(db) -> bytes:
+    return program_list_adapter.dump_json(program_list_adapter.validate_python(crud.get_programs(db), from_attributes=True))
+
+
+def rows_orjson(db) -> bytes:
+    return orjson.dumps(crud.get_program_documents(db))
+
+
+PATHS = {
+    "orm+response_model": orm_response_model,
+    "orm+dump_json": orm_dump_json,
+    "rows+orjson": rows_orjson,
+}
+
+
+def measure(Session, fn, repeat: int):
+    timings, body = [], b""
+    for _ in range(repeat):
+        # Новая сессия на каждый повтор: identity map не должна ускорять ORM-путь
+        db = Session()
+        try:
+            started = time.perf_counter()
+            body = fn(db)
+            timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            db.close()
+    return timings, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--programs", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--exercises", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(prefix="bench_serialization_", suffix=".db")
+    os.close(fd)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        seed(engine, args.programs, args.days, args.exercises)
+        Session = sessionmaker(bind=engine, autoflush=False)
+
+        results = {name: measure(Session, fn, args.repeat) for name, fn in PATHS.items()}
+        reference = results["rows+orjson"][1]
+        baseline = statistics.median(results["orm+response_model"][0])
+
+        print(f"{args.programs} programs x {args.days} days x {args.exercises} exercises, {args.repeat} runs")
+        print(f"{'path':<20} {'median ms':>10} {'min ms':>9} {'speedup':>8} {'KiB':>8} {'same json':>10}")
+        for name, (timings, body) in results.items():
+            median = statistics.median(timings)
+            print(
+                f"{name:<20} {median:>10.1f} {min(timings):>9.1f} {baseline / median:>7.1f}x "
+                f"{len(body) / 1024:>8.0f} {str(orjson.loads(body) == orjson.loads(reference)):>10}"
+            )
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
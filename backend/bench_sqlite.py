@@ -0,0 +1,131 @@
+"""
+Конкурентная нагрузка на SQLite до и после применения SQLITE_PRAGMAS.
+
+Несколько потоков-писателей отмечают прогресс (INSERT + COMMIT), потоки-читатели
+в это время загружают программы с днями и упражнениями. Для каждого профиля
+создается своя копия базы и свой движок.
+
+    python bench_sqlite.py --readers 8 --writers 4 --seconds 5
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, SQLITE_PRAGMAS, apply_sqlite_pragmas
+import crud
+import models
+import schemas
+
+
+def seed(path: str, programs: int, days: int, users: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    for p in range(programs):
+        program = models.WorkoutProgram(difficulty="beginner", goal="weight_loss", location="home", name=f"P{p}")
+        for d in range(days):
+            workout = models.Workout(day_number=d + 1, title=f"День {d + 1}")
+            workout.exercises = [models.Exercise(name="E", sets=3, reps="10", rest_time=60) for _ in range(5)]
+            program.workouts.append(workout)
+        db.add(program)
+    db.add_all([models.User(telegram_id=str(u)) for u in range(users)])
+    db.commit()
+    db.close()
+    engine.dispose()
+
+
+def run_profile(path: str, tuned: bool, readers: int, writers: int, seconds: float, programs: int, days: int, users: int):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=readers + writers)
+    if tuned:
+        apply_sqlite_pragmas(engine, SQLITE_PRAGMAS)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    counts = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + seconds
+
+    def reader(n: int):
+        db = Session()
+        done = 0
+        try:
+            while time.monotonic() < stop_at:
+                crud.get_program(db, n % programs + 1)
+                db.expunge_all()
+                done += 1
+        finally:
+            db.close()
+        with lock:
+            counts["reads"] += done
+
+    def writer(n: int):
+        db = Session()
+        done = locked = 0
+        i = 0
+        try:
+            while time.monotonic() < stop_at:
+                i += 1
+                program_id = (n + i) % programs + 1
+                try:
+                    crud.upsert_progress(db, schemas.UserProgressCreate(
+                        user_id=(n * 7919 + i) % users + 1,
+                        program_id=program_id,
+                        workout_id=(program_id - 1) * days + i % days + 1,
+                        is_completed=i % 2 == 0,
+                    ))
+                    done += 1
+                except OperationalError:
+                    db.rollback()
+                    locked += 1
+        finally:
+            db.close()
+        with lock:
+            counts["writes"] += done
+            counts["locked"] += locked
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {key: value / seconds if key != "locked" else value for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--programs", type=int, default=20)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_sqlite_")
+    template = os.path.join(workdir, "template.db")
+    seed(template, args.programs, args.days, args.users)
+
+    print(f"{'profile':<8} {'reads/s':>9} {'writes/s':>9} {'locked':>7}")
+    for tuned in (False, True):
+        path = os.path.join(workdir, f"{'tuned' if tuned else 'default'}.db")
+        shutil.copy(template, path)
+        result = run_profile(
+            path, tuned, args.readers, args.writers, args.seconds, args.programs, args.days, args.users,
+        )
+        name = "tuned" if tuned else "default"
+        print(f"{name:<8} {result['reads']:>9.0f} {result['writes']:>9.0f} {result['locked']:>7}")
+
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
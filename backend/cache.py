@@ -0,0 +1,226 @@
+"""
+Кэш готовых JSON-ответов каталога (программы, дни, упражнения).
+
+Каталог меняется только из админки, поэтому ответы сериализуются один раз и
+хранятся в памяти процесса в виде байтов. Ключ включает номер ревизии:
+каталога целиком (для списков) или конкретной программы (для её дней).
+Изменение программы увеличивает её ревизию — старые записи становятся
+недостижимыми и вытесняются по LRU/TTL, остальные программы не затрагиваются.
+
+Из тех же ревизий строятся ETag для условных GET-запросов. В ETag входит
+случайная метка процесса: счётчики живут в памяти, и после перезапуска или в
+другом воркере одинаковый номер ревизии не должен давать ложный 304.
+
+Источник правды — таблица catalog_revisions: каждое изменение каталога
+(API любого воркера, catalog_cli.py import, init_db.py) увеличивает в ней
+ревизию в своей транзакции. Воркер сверяется с ней сразу после собственных
+изменений и раз в CATALOG_REVISION_POLL_MS (CatalogRevisionPoller), поэтому
+чужие изменения перестают отдаваться из кэша и через 304 не позже чем через
+этот интервал. При CATALOG_REVISION_POLL_MS=0 опроса нет — это годится только
+для одного воркера без правок каталога в обход API.
+
+Здесь же — LRU-отображение telegram_id -> пользователь: пользователи не
+меняются и не удаляются через API, поэтому запись не устаревает.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "512"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+CATALOG_REVISION_POLL_MS = float(os.getenv("CATALOG_REVISION_POLL_MS", "1000"))
+
+# scope строки catalog_revisions для каталога целиком
+CATALOG_SCOPE = 0
+
+logger = logging.getLogger(__name__)
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    headers: Optional[Dict[str, str]] = None
+    # Сжатые варианты тела по кодировке, заполняются при первой отдаче (compression.encoded_body)
+    encoded: Optional[Dict[str, bytes]] = None
+
+
+class CatalogCache:
+    def __init__(self, max_entries: int = CATALOG_CACHE_SIZE, ttl: float = CATALOG_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._epoch = secrets.token_hex(4)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._catalog_revision = 0
+        self._program_revisions: Dict[int, int] = {}
+        # workout_id -> program_id, чтобы ключ отдельного дня зависел от ревизии программы
+        self._workout_programs: Dict[int, int] = {}
+        # Последние увиденные ревизии из catalog_revisions по scope
+        self._stored_revisions: Dict[int, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def catalog_revision(self) -> int:
+        return self._catalog_revision
+
+    def program_revision(self, program_id: int) -> int:
+        return self._program_revisions.get(program_id, 0)
+
+    def catalog_etag(self) -> str:
+        return f'"c-{self._epoch}-{self._catalog_revision}"'
+
+    def program_etag(self, program_id: int) -> str:
+        return f'"p-{self._epoch}-{program_id}-{self.program_revision(program_id)}"'
+
+    def workout_program(self, workout_id: int) -> Optional[int]:
+        return self._workout_programs.get(workout_id)
+
+    def remember_workout(self, workout_id: int, program_id: int):
+        with self._lock:
+            self._workout_programs[workout_id] = program_id
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: CachedBody):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_catalog(self):
+        """Списки программ устарели (создание программы, изменение состава)."""
+        with self._lock:
+            self._catalog_revision += 1
+
+    def invalidate_program(self, program_id: int):
+        """Изменилась программа, её дни или упражнения."""
+        with self._lock:
+            self._catalog_revision += 1
+            self._program_revisions[program_id] = self._program_revisions.get(program_id, 0) + 1
+
+    def stored_revision(self) -> int:
+        """Ревизия каталога в БД, до которой кэш уже сверен (курсор для crud.get_catalog_revisions)."""
+        return self._stored_revisions.get(CATALOG_SCOPE, 0)
+
+    def apply_revisions(self, rows: Iterable[Tuple[int, int]]):
+        """Инвалидирует то, что изменилось в БД: строки (scope, revision) из catalog_revisions."""
+        with self._lock:
+            for scope, revision in rows:
+                # Результат более раннего чтения, пришедший позже, ничего не откатывает
+                if revision <= self._stored_revisions.get(scope, 0):
+                    continue
+                self._stored_revisions[scope] = revision
+                self._catalog_revision += 1
+                if scope != CATALOG_SCOPE:
+                    self._program_revisions[scope] = self._program_revisions.get(scope, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._workout_programs.clear()
+            # Базу могли пересоздать: ревизии в ней начнутся заново
+            self._stored_revisions.clear()
+            self._catalog_revision += 1
+            for program_id in self._program_revisions:
+                self._program_revisions[program_id] += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+catalog_cache = CatalogCache()
+
+
+class CatalogRevisionPoller:
+    """Сверка catalog_cache с catalog_revisions каждые interval_ms (0 — только после своих изменений)."""
+
+    def __init__(self, cache: CatalogCache, interval_ms: float = CATALOG_REVISION_POLL_MS):
+        self.cache = cache
+        self.interval_ms = interval_ms
+        self._task: Optional[asyncio.Task] = None
+
+    async def poll(self):
+        from database import run_in_session
+        import crud
+
+        self.cache.apply_revisions(await run_in_session(crud.get_catalog_revisions, self.cache.stored_revision()))
+
+    def start(self):
+        if self.interval_ms > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Catalog revision poll failed")
+            await asyncio.sleep(self.interval_ms / 1000)
+
+
+catalog_revision_poller = CatalogRevisionPoller(catalog_cache)
+
+
+class UserCache:
+    def __init__(self, max_entries: int = USER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, Any]" = OrderedDict()
+
+    def get(self, telegram_id: str):
+        with self._lock:
+            user = self._users.get(telegram_id)
+            if user is not None:
+                self._users.move_to_end(telegram_id)
+            return user
+
+    def set(self, telegram_id: str, user):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._users[telegram_id] = user
+            self._users.move_to_end(telegram_id)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def __len__(self):
+        return len(self._users)
+
+
+user_cache = UserCache()
@@ -0,0 +1,89 @@
+"""
+Перенос каталога программ между окружениями в формате NDJSON.
+
+    python catalog_cli.py export programs.ndjson             # весь каталог
+    python catalog_cli.py export - --program-id 1 --program-id 3
+    python catalog_cli.py import programs.ndjson             # upsert по id
+    python catalog_cli.py import programs.ndjson --new-ids   # всё создать заново
+
+Работает с базой из DATABASE_URL, как init_db.py. Вместо файла можно указать
+"-" — stdout для экспорта, stdin для импорта.
+"""
+import argparse
+import sys
+import time
+
+from database import SessionLocal, engine
+import catalog_io
+import migrations
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_chunks(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_command(args):
+    output = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+    db = SessionLocal()
+    started = time.perf_counter()
+    count = 0
+    try:
+        for line in catalog_io.export_catalog(db, args.program_id, args.batch_size):
+            output.write(line)
+            count += 1
+    finally:
+        db.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+    print(f"Exported {count} programs in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+
+def import_command(args):
+    source = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        totals = catalog_io.import_catalog(db, read_chunks(source), keep_ids=not args.new_ids, batch_size=args.batch_size)
+    except catalog_io.CatalogFormatError as e:
+        db.rollback()
+        sys.exit(f"Import stopped, {e}")
+    finally:
+        db.close()
+        if source is not sys.stdin.buffer:
+            source.close()
+    print(
+        f"Imported {totals['programs']} programs, {totals['workouts']} workouts, "
+        f"{totals['exercises']} exercises in {time.perf_counter() - started:.2f}s",
+        file=sys.stderr,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Выгрузить каталог в NDJSON")
+    export_parser.add_argument("path", help="Файл или - для stdout")
+    export_parser.add_argument("--program-id", type=int, action="append", help="Только эти программы")
+    export_parser.add_argument("--batch-size", type=int, default=catalog_io.EXPORT_BATCH_SIZE)
+    export_parser.set_defaults(handler=export_command)
+
+    import_parser = commands.add_parser("import", help="Загрузить каталог из NDJSON")
+    import_parser.add_argument("path", help="Файл или - для stdin")
+    import_parser.add_argument("--new-ids", action="store_true", help="Не сохранять id, создавать записи заново")
+    import_parser.add_argument("--batch-size", type=int, default=catalog_io.IMPORT_BATCH_SIZE)
+    import_parser.set_defaults(handler=import_command)
+
+    args = parser.parse_args()
+    migrations.upgrade(engine)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
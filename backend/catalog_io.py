@@ -0,0 +1,234 @@
+"""
+Экспорт и импорт каталога программ в формате NDJSON.
+
+Каждая строка — одна программа целиком (поля программы, дни, упражнения):
+
+    {"id": 1, "name": "...", ..., "workouts": [{"id": 1, "day_number": 1, ..., "exercises": [...]}]}
+
+Экспорт читает программы батчами через yield_per, а дни и упражнения батча
+подгружает двумя запросами IN (...), поэтому память не зависит от размера
+каталога и ORM-объекты не создаются. Импорт группирует строки в батчи и
+вставляет каждый уровень одним executemany в отдельной транзакции.
+"""
+import json
+from collections import defaultdict
+from typing import Iterable, Iterator, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+import crud
+import models
+import schemas
+
+EXPORT_BATCH_SIZE = 500
+IMPORT_BATCH_SIZE = 500
+
+programs_table = models.WorkoutProgram.__table__
+workouts_table = models.Workout.__table__
+exercises_table = models.Exercise.__table__
+CATALOG_TABLES = (programs_table, workouts_table, exercises_table)
+
+
+def export_catalog(
+    db: Session, program_ids: Optional[List[int]] = None, batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """Генератор строк NDJSON (bytes, с переводом строки) для всего каталога или выбранных программ."""
+    query = select(programs_table).order_by(programs_table.c.id)
+    if program_ids:
+        query = query.where(programs_table.c.id.in_(program_ids))
+
+    result = db.execute(query.execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        batch_ids = [row.id for row in batch]
+
+        workouts_by_program = defaultdict(list)
+        workout_rows = db.execute(
+            select(workouts_table)
+            .where(workouts_table.c.program_id.in_(batch_ids))
+            .order_by(workouts_table.c.program_id, workouts_table.c.day_number, workouts_table.c.id)
+        ).all()
+        for workout in workout_rows:
+            workouts_by_program[workout.program_id].append(workout)
+
+        exercises_by_workout = defaultdict(list)
+        if workout_rows:
+            exercise_rows = db.execute(
+                select(exercises_table)
+                .where(exercises_table.c.workout_id.in_([workout.id for workout in workout_rows]))
+                .order_by(exercises_table.c.id)
+            )
+            for exercise in exercise_rows:
+                exercises_by_workout[exercise.workout_id].append(exercise)
+
+        for program in batch:
+            document = dict(program._mapping)
+            document["workouts"] = [
+                {
+                    **{key: value for key, value in workout._mapping.items() if key != "program_id"},
+                    "exercises": [
+                        {key: value for key, value in exercise._mapping.items() if key != "workout_id"}
+                        for exercise in exercises_by_workout[workout.id]
+                    ],
+                }
+                for workout in workouts_by_program[program.id]
+            ]
+            yield json.dumps(document, ensure_ascii=False).encode() + b"\n"
+
+
+def _has_ids(document: dict) -> bool:
+    return document.get("id") is not None and all(
+        workout.get("id") is not None and all(exercise.get("id") is not None for exercise in workout.get("exercises") or [])
+        for workout in document.get("workouts") or []
+    )
+
+
+def _program_row(document: dict, keep_ids: bool) -> dict:
+    row = {column.name: document.get(column.name) for column in programs_table.c if column.name != "id"}
+    if keep_ids and document.get("id") is not None:
+        row["id"] = document["id"]
+    return row
+
+
+def import_batch(db: Session, documents: List[dict], keep_ids: bool = True) -> dict:
+    """
+    Импортирует батч программ одной транзакцией.
+
+    keep_ids=True — upsert по id (INSERT ... ON CONFLICT DO UPDATE) на каждом
+    уровне: повторный импорт того же файла обновляет данные, а не дублирует.
+    Дни и упражнения, которых нет в документе, не удаляются. На PostgreSQL
+    последовательности id сдвигаются за максимальный импортированный id.
+
+    keep_ids=False (или в батче есть записи без id) — все записи создаются
+    заново с новыми id.
+    """
+    stats = {"programs": 0, "workouts": 0, "exercises": 0}
+    documents = [document for document in documents if document]
+    if not documents:
+        return stats
+
+    if keep_ids and all(_has_ids(document) for document in documents):
+        program_ids = [document["id"] for document in documents]
+        db.execute(crud.upsert_statement(db, programs_table), [_program_row(d, True) for d in documents])
+    else:
+        keep_ids = False
+        # Новые id выдаются по порядку строк батча, порядок RETURNING не гарантирован
+        program_ids = sorted(db.execute(
+            insert(programs_table).returning(programs_table.c.id),
+            [_program_row(d, False) for d in documents],
+        ).scalars().all())
+    stats["programs"] = len(documents)
+
+    workout_rows, workout_exercises = [], []
+    for program_id, document in zip(program_ids, documents):
+        for workout in document.get("workouts") or []:
+            row = {
+                "program_id": program_id,
+                "day_number": workout["day_number"],
+                "title": workout["title"],
+                "description": workout.get("description"),
+            }
+            if keep_ids:
+                row["id"] = workout["id"]
+            workout_rows.append(row)
+            workout_exercises.append(workout.get("exercises") or [])
+    if not workout_rows:
+        if keep_ids:
+            crud.sync_sequences(db, CATALOG_TABLES)
+        crud.bump_catalog_revision(db, program_ids)
+        db.commit()
+        return stats
+
+    if keep_ids:
+        db.execute(crud.upsert_statement(db, workouts_table), workout_rows)
+        workout_ids = [row["id"] for row in workout_rows]
+    else:
+        workout_ids = sorted(db.execute(insert(workouts_table).returning(workouts_table.c.id), workout_rows).scalars().all())
+    stats["workouts"] = len(workout_rows)
+
+    exercise_rows = []
+    for workout_id, exercises in zip(workout_ids, workout_exercises):
+        for exercise in exercises:
+            row = {
+                "workout_id": workout_id,
+                "name": exercise["name"],
+                "sets": exercise["sets"],
+                "reps": exercise["reps"],
+                "rest_time": exercise["rest_time"],
+                "description": exercise.get("description"),
+            }
+            if keep_ids:
+                row["id"] = exercise["id"]
+            exercise_rows.append(row)
+    if exercise_rows:
+        statement = crud.upsert_statement(db, exercises_table) if keep_ids else insert(exercises_table)
+        db.execute(statement, exercise_rows)
+    stats["exercises"] = len(exercise_rows)
+
+    if keep_ids:
+        crud.sync_sequences(db, CATALOG_TABLES)
+    # Воркеры API увидят импорт по ревизии в БД (опрос CATALOG_REVISION_POLL_MS)
+    crud.bump_catalog_revision(db, program_ids)
+    db.commit()
+    return stats
+
+
+class CatalogFormatError(ValueError):
+    pass
+
+
+class NDJSONBatcher:
+    """
+    Собирает поток байтов произвольной нарезки в батчи провалидированных
+    документов. Используется и для файла (CLI), и для тела HTTP-запроса.
+    """
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._buffer = b""
+        self._batch: List[dict] = []
+        self._line_number = 0
+
+    def _add_line(self, line: bytes) -> Optional[List[dict]]:
+        self._line_number += 1
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            document = schemas.WorkoutProgramDocument.model_validate_json(line)
+        except ValidationError as e:
+            raise CatalogFormatError(f"line {self._line_number}: {e.errors()[0]['msg']}") from e
+        self._batch.append(document.model_dump())
+        if len(self._batch) >= self.batch_size:
+            batch, self._batch = self._batch, []
+            return batch
+        return None
+
+    def feed(self, chunk: bytes) -> List[List[dict]]:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return [batch for batch in map(self._add_line, lines) if batch]
+
+    def close(self) -> List[List[dict]]:
+        batches = [batch for batch in [self._add_line(self._buffer)] if batch]
+        self._buffer = b""
+        if self._batch:
+            batches.append(self._batch)
+            self._batch = []
+        return batches
+
+
+def parse_batches(chunks: Iterable[bytes], batch_size: int = IMPORT_BATCH_SIZE) -> Iterator[List[dict]]:
+    batcher = NDJSONBatcher(batch_size)
+    for chunk in chunks:
+        yield from batcher.feed(chunk)
+    yield from batcher.close()
+
+
+def import_catalog(db: Session, chunks: Iterable[bytes], keep_ids: bool = True, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    totals = {"programs": 0, "workouts": 0, "exercises": 0}
+    for batch in parse_batches(chunks, batch_size):
+        for key, value in import_batch(db, batch, keep_ids).items():
+            totals[key] += value
+    return totals
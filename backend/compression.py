@@ -0,0 +1,245 @@
+"""
+Сжатие ответов API (brotli/gzip) и учет размера ответов по эндпоинтам.
+
+CompressionMiddleware сжимает ответы JSON/NDJSON от COMPRESSION_MIN_BYTES
+кодировкой, которую принимает клиент (Accept-Encoding), в порядке
+предпочтения из RESPONSE_COMPRESSION. Потоковые ответы (экспорт каталога)
+сжимаются по частям. Brotli используется, только если установлен пакет
+brotli, иначе остается gzip.
+
+Ответы из кэша каталога сжимаются один раз: сжатые варианты хранятся рядом
+с телом в CachedBody.encoded (encoded_body), обработчик сразу отдает их с
+Content-Encoding, и middleware такой ответ уже не трогает.
+
+Для каждого маршрута (шаблон пути, например /programs/{program_id})
+накапливаются байты до и после сжатия; ответы тяжелее PAYLOAD_BUDGET_BYTES
+после сжатия считаются в over_budget и пишутся в лог.
+"""
+import gzip
+import logging
+import os
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него остается gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Кодировки в порядке предпочтения; пустое значение выключает сжатие
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "br,gzip")
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+PAYLOAD_BUDGET_BYTES = int(os.getenv("PAYLOAD_BUDGET_BYTES", "262144"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def available_encodings(setting: str = RESPONSE_COMPRESSION) -> List[str]:
+    encodings = [encoding.strip().lower() for encoding in setting.split(",") if encoding.strip()]
+    return [encoding for encoding in encodings if encoding == "gzip" or (encoding == "br" and brotli is not None)]
+
+
+ENCODINGS = available_encodings()
+
+
+def negotiate(accept_encoding: Optional[str], encodings: Iterable[str] = ENCODINGS) -> Optional[str]:
+    """Первая из encodings, которую клиент принимает (q > 0), или None."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def encoded_body(cached, encoding: str) -> bytes:
+    """Сжатое тело записи кэша; вариант вычисляется один раз на запись и кодировку."""
+    if cached.encoded is None:
+        return compress(cached.body, encoding)
+    body = cached.encoded.get(encoding)
+    if body is None:
+        # Гонка двух запросов дает лишь повторное сжатие одних и тех же байтов
+        body = cached.encoded[encoding] = compress(cached.body, encoding)
+    return body
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._compress, self._finish = self._compressor.process, self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress, self._finish = self._compressor.compress, self._compressor.flush
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compress(chunk)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class PayloadStats:
+    """Размеры ответов по маршрутам: сколько байт отдано до и после сжатия."""
+
+    def __init__(self, budget_bytes: int = PAYLOAD_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._routes: Dict[str, dict] = {}
+
+    def record(self, route: str, raw_bytes: int, sent_bytes: int, encoding: Optional[str]):
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = {
+                    "responses": 0, "compressed": 0, "over_budget": 0,
+                    "raw_bytes": 0, "sent_bytes": 0, "max_sent_bytes": 0,
+                }
+            entry["responses"] += 1
+            entry["compressed"] += encoding is not None
+            entry["raw_bytes"] += raw_bytes
+            entry["sent_bytes"] += sent_bytes
+            entry["max_sent_bytes"] = max(entry["max_sent_bytes"], sent_bytes)
+            over_budget = self.budget_bytes > 0 and sent_bytes > self.budget_bytes
+            entry["over_budget"] += over_budget
+        if over_budget:
+            logger.warning("Response of %s is %d bytes, budget is %d", route, sent_bytes, self.budget_bytes)
+
+    def stats(self) -> dict:
+        with self._lock:
+            routes = {route: dict(entry) for route, entry in self._routes.items()}
+        for entry in routes.values():
+            responses = entry["responses"]
+            entry["avg_raw_bytes"] = round(entry["raw_bytes"] / responses)
+            entry["avg_sent_bytes"] = round(entry["sent_bytes"] / responses)
+            entry["compression_ratio"] = (
+                round(entry["sent_bytes"] / entry["raw_bytes"], 4) if entry["raw_bytes"] else 1.0
+            )
+        return {"budget_bytes": self.budget_bytes, "encodings": ENCODINGS, "routes": routes}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+payload_stats = PayloadStats()
+
+
+def route_name(scope) -> str:
+    # FastAPI кладет найденный маршрут в scope; без него (404) — общий ключ
+    route = scope.get("route")
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+class CompressionMiddleware:
+    """ASGI middleware: сжатие ответов и учет их размера в payload_stats."""
+
+    def __init__(
+        self,
+        app,
+        encodings: Iterable[str] = ENCODINGS,
+        minimum_size: int = COMPRESSION_MIN_BYTES,
+        stats: PayloadStats = payload_stats,
+    ):
+        self.app = app
+        self.encodings = list(encodings)
+        self.minimum_size = minimum_size
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = negotiate(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        start_message = None
+        # "raw" — байты до сжатия, "sent" — отправленные клиенту
+        state = {"raw": 0, "sent": 0, "encoding": None, "compressor": None, "passthrough": True}
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                compressible = is_compressible(headers.get("content-type"))
+                if headers.get("content-encoding"):
+                    # Уже сжато обработчиком (кэш каталога): считаем исходный размер из state запроса
+                    state["encoding"] = headers["content-encoding"]
+                elif compressible and accepted and (more_body or len(body) >= self.minimum_size):
+                    state["encoding"] = accepted
+                    state["compressor"] = StreamCompressor(accepted) if more_body else None
+                    state["passthrough"] = False
+                    headers["Content-Encoding"] = accepted
+                    if "content-length" in headers:
+                        del headers["content-length"]
+                if compressible:
+                    headers.add_vary_header("Accept-Encoding")
+
+                if not state["passthrough"] and not more_body:
+                    raw_length = len(body)
+                    body = compress(body, accepted)
+                    headers["Content-Length"] = str(len(body))
+                    state["raw"] += raw_length
+                    state["sent"] += len(body)
+                    await send(start_message)
+                    start_message = None
+                    await send({"type": "http.response.body", "body": body})
+                    self._record(scope, state)
+                    return
+                await send(start_message)
+                start_message = None
+
+            state["raw"] += len(body)
+            compressor = state["compressor"]
+            if compressor is not None:
+                body = compressor.compress(body)
+                if not more_body:
+                    body += compressor.finish()
+            state["sent"] += len(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+            if not more_body:
+                self._record(scope, state)
+
+        await self.app(scope, receive, send_compressed)
+
+    def _record(self, scope, state):
+        raw = state["raw"]
+        if state["passthrough"] and state["encoding"] is not None:
+            raw = scope.get("state", {}).get("uncompressed_bytes", raw)
+        self.stats.record(route_name(scope), raw, state["sent"], state["encoding"])
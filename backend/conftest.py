@@ -0,0 +1,136 @@
+import os
+import tempfile
+
+import pytest
+
+# База для тестов создаётся во временной директории, чтобы не трогать workout_app.db.
+# Переменная должна быть выставлена до импорта database.py.
+_TEST_DB_DIR = tempfile.mkdtemp(prefix="workout_app_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DB_DIR, 'test.db')}"
+# Плановое обновление аналитики в тестах выключено, они вызывают его явно
+os.environ["ANALYTICS_REFRESH_SECONDS"] = "0"
+# Ревизии каталога тесты сверяют явно (cache.catalog_revision_poller.poll)
+os.environ["CATALOG_REVISION_POLL_MS"] = "0"
+# Профилирование по запросу подключается только при заданном токене
+os.environ["PROFILING_TOKEN"] = "test-profiling-token"
+os.environ["ANALYTICS_REFRESH_TOKEN"] = "test-analytics-token"
+
+from sqlalchemy import event  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+import models  # noqa: E402,F401
+
+
+collect_ignore = ["test_api.py"]  # требует запущенного сервера, см. README
+
+
+@pytest.fixture
+def db():
+    import migrations
+
+    Base.metadata.drop_all(bind=engine)
+    migrations.create_schema(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+class StatementCounter:
+    def __init__(self):
+        self.executed = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.executed.append((statement, parameters))
+
+    @property
+    def statements(self):
+        return [statement for statement, _ in self.executed]
+
+    @property
+    def count(self):
+        return len(self.executed)
+
+
+@pytest.fixture
+def count_statements():
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+
+
+@pytest.fixture
+def make_catalog(db):
+    """Фабрика каталога: make_catalog(programs, days, exercises) -> список программ."""
+
+    def _make(programs=1, days=3, exercises=2, difficulty="beginner", goal="weight_loss", location="home"):
+        created = []
+        for p in range(programs):
+            program = models.WorkoutProgram(
+                difficulty=difficulty,
+                goal=goal,
+                location=location,
+                name=f"Программа {p + 1}",
+                description="Описание программы",
+            )
+            for d in range(days):
+                workout = models.Workout(day_number=d + 1, title=f"День {d + 1}", description="Описание дня")
+                for e in range(exercises):
+                    workout.exercises.append(models.Exercise(
+                        name=f"Упражнение {e + 1}",
+                        sets=3,
+                        reps="10-12",
+                        rest_time=60,
+                        description="Описание упражнения",
+                    ))
+                program.workouts.append(workout)
+            db.add(program)
+            created.append(program)
+        db.commit()
+        db.expire_all()
+        return created
+
+    return _make
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+
+    from cache import catalog_cache, user_cache
+    import main
+
+    catalog_cache.clear()
+    user_cache.clear()
+    with TestClient(main.app) as test_client:
+        yield test_client
+    catalog_cache.clear()
+    user_cache.clear()
+
+
+@pytest.fixture
+def async_client(client):
+    """Тот же клиент, но обработчики работают через AsyncSession (режим DB_ASYNC=1)."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from database import AsyncDB, apply_sqlite_pragmas, get_async_db, to_async_url
+    import main
+
+    async_engine = create_async_engine(to_async_url(os.environ["DATABASE_URL"]))
+    apply_sqlite_pragmas(async_engine.sync_engine)
+    session_factory = async_sessionmaker(async_engine, autoflush=False)
+
+    async def override():
+        async with session_factory() as session:
+            yield AsyncDB(session)
+
+    main.app.dependency_overrides[get_async_db] = override
+    try:
+        yield client
+    finally:
+        main.app.dependency_overrides.pop(get_async_db, None)
+        client.portal.call(async_engine.dispose)
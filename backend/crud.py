@@ -1,9 +1,44 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from collections import defaultdict
+from datetime import date, datetime
+from sqlalchemy import bindparam, case, distinct, func, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from typing import Dict, List, Optional, Set, Tuple
+from cache import CATALOG_SCOPE
 import models
 import schemas
 
 
+def dialect_insert(db: Session, table):
+    """INSERT с поддержкой ON CONFLICT для текущей СУБД (SQLite или PostgreSQL)."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_specific_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_specific_insert
+    return dialect_specific_insert(table)
+
+
+def upsert_statement(db: Session, table, index_elements=("id",)):
+    """INSERT ... ON CONFLICT (index_elements) DO UPDATE всех остальных колонок."""
+    statement = dialect_insert(db, table)
+    return statement.on_conflict_do_update(
+        index_elements=list(index_elements),
+        set_={column.name: statement.excluded[column.name] for column in table.c if column.name not in index_elements},
+    )
+
+
+def sync_sequences(db: Session, tables):
+    """После вставки с явными id: двигает serial-последовательности PostgreSQL за MAX(id)."""
+    # Без setval следующий обычный INSERT получил бы уже занятый id
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for table in tables:
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"
+        ))
+
+
 def get_user_by_telegram_id(db: Session, telegram_id: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.telegram_id == telegram_id).first()
 
@@ -20,36 +55,419 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
     return db_user
 
 
-def get_programs(db: Session, skip: int = 0, limit: int = 100) -> List[models.WorkoutProgram]:
-    return db.query(models.WorkoutProgram).offset(skip).limit(limit).all()
+def get_or_create_user(db: Session, telegram_id: str) -> models.User:
+    """
+    Возвращает пользователя по telegram_id, создавая его при необходимости.
+    Одновременное создание из двух запросов упирается в уникальный индекс:
+    проигравший откатывается и читает запись победителя.
+    """
+    db_user = get_user_by_telegram_id(db, telegram_id)
+    if db_user:
+        return db_user
+    try:
+        return create_user(db, schemas.UserCreate(telegram_id=telegram_id))
+    except IntegrityError:
+        db.rollback()
+        return get_user_by_telegram_id(db, telegram_id)
+
+
+def _program_tree_options():
+    # Загружаем программу -> дни -> упражнения фиксированным числом запросов
+    # (по одному SELECT ... IN на уровень) вместо ленивой подгрузки на каждый объект.
+    return selectinload(models.WorkoutProgram.workouts).selectinload(models.Workout.exercises)
+
+
+def _filter_programs(
+    db: Session,
+    query,
+    difficulty: Optional[str] = None,
+    goal: Optional[str] = None,
+    location: Optional[str] = None,
+    search: Optional[str] = None,
+    after_id: Optional[int] = None,
+):
+    if difficulty:
+        query = query.filter(models.WorkoutProgram.difficulty == difficulty)
+    if goal:
+        query = query.filter(models.WorkoutProgram.goal == goal)
+    if location:
+        query = query.filter(models.WorkoutProgram.location == location)
+
+    search = (search or "").strip()
+    if search:
+        # FTS5 с триграммами работает от трёх символов; короткие запросы и
+        # другие СУБД обрабатываются подстрочным LIKE без учета регистра.
+        # % и _ в запросе экранируются (autoescape).
+        dialect = db.get_bind().dialect.name
+        if dialect == "sqlite" and len(search) >= 3:
+            phrase = '"' + search.replace('"', '""') + '"'
+            matches = select(models.program_search.c.rowid).where(
+                models.program_search.c.name.op("MATCH")(phrase)
+            )
+            query = query.filter(models.WorkoutProgram.id.in_(matches))
+        elif dialect == "sqlite":
+            # ILIKE в SQLite не складывает регистр кириллицы, в отличие от FTS;
+            # unicode_lower регистрируется на каждом соединении (database.py)
+            query = query.filter(
+                func.unicode_lower(models.WorkoutProgram.name).contains(search.lower(), autoescape=True)
+            )
+        else:
+            query = query.filter(models.WorkoutProgram.name.icontains(search, autoescape=True))
+
+    # Keyset-пагинация: следующая страница начинается после последнего id,
+    # поэтому стоимость запроса не зависит от номера страницы.
+    if after_id is not None:
+        query = query.filter(models.WorkoutProgram.id > after_id)
+
+    return query.order_by(models.WorkoutProgram.id)
+
+
+def get_programs(
+    db: Session,
+    difficulty: Optional[str] = None,
+    goal: Optional[str] = None,
+    location: Optional[str] = None,
+    search: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> List[models.WorkoutProgram]:
+    query = db.query(models.WorkoutProgram).options(_program_tree_options())
+    query = _filter_programs(db, query, difficulty, goal, location, search, after_id)
+    return query.limit(limit).all()
 
 
 def get_program(db: Session, program_id: int) -> Optional[models.WorkoutProgram]:
-    return db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id == program_id).first()
+    return (
+        db.query(models.WorkoutProgram)
+        .options(_program_tree_options())
+        .filter(models.WorkoutProgram.id == program_id)
+        .first()
+    )
+
+
+def get_program_summaries(
+    db: Session,
+    difficulty: Optional[str] = None,
+    goal: Optional[str] = None,
+    location: Optional[str] = None,
+    search: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+):
+    """Программы со счётчиками дней, упражнений и подходов, посчитанными в SQL.
+
+    Агрегация идёт через JOIN по индексам program_id/workout_id с GROUP BY по
+    программе, поэтому с limit/after_id считается только текущая страница.
+    """
+    query = _filter_programs(db, _program_summary_query(db), difficulty, goal, location, search, after_id)
+    return query.limit(limit).all()
+
+
+def get_program_summary(db: Session, program_id: int):
+    return _program_summary_query(db).filter(models.WorkoutProgram.id == program_id).first()
+
+
+def _program_summary_query(db: Session):
+    return (
+        db.query(
+            # Порядок колонок — как у полей schemas.WorkoutProgramSummary
+            models.WorkoutProgram.difficulty,
+            models.WorkoutProgram.goal,
+            models.WorkoutProgram.location,
+            models.WorkoutProgram.name,
+            models.WorkoutProgram.description,
+            models.WorkoutProgram.id,
+            func.count(distinct(models.Workout.id)).label("days_count"),
+            func.count(models.Exercise.id).label("exercises_count"),
+            func.coalesce(func.sum(models.Exercise.sets), 0).label("total_sets"),
+        )
+        .outerjoin(models.Workout, models.Workout.program_id == models.WorkoutProgram.id)
+        .outerjoin(models.Exercise, models.Exercise.workout_id == models.Workout.id)
+        .group_by(models.WorkoutProgram.id)
+    )
+
+
+# Документы каталога для отдачи клиенту без ORM и повторной валидации:
+# плоские строки SELECT превращаются в словари с ключами в порядке полей схем
+# ответа и сериализуются orjson. Структура и порядок — как у get_programs /
+# get_program_workouts, сериализованных через schemas.WorkoutProgram / Workout.
+
+IN_BATCH_SIZE = 500
+
+
+def _schema_columns(model, schema) -> list:
+    table = model.__table__
+    return [table.c[name] for name in schema.model_fields if name in table.c]
+
+
+def _rows_in(db: Session, columns, key_column, keys: List[int], *order_by):
+    # Как selectinload: IN (...) порциями, чтобы не упереться в лимит параметров СУБД;
+    # ключи отсортированы, поэтому порядок строк сохраняется между порциями
+    keys = sorted(keys)
+    for start in range(0, len(keys), IN_BATCH_SIZE):
+        yield from db.execute(
+            select(*columns).where(key_column.in_(keys[start:start + IN_BATCH_SIZE])).order_by(*order_by)
+        )
+
+
+def _workout_documents(db: Session, key_column, keys: List[int], *order_by) -> List[dict]:
+    workouts = [
+        dict(row._mapping)
+        for row in _rows_in(db, _schema_columns(models.Workout, schemas.Workout), key_column, keys, *order_by)
+    ]
+    exercises_by_workout = defaultdict(list)
+    if workouts:
+        exercises = _rows_in(
+            db, _schema_columns(models.Exercise, schemas.Exercise), models.Exercise.workout_id,
+            [workout["id"] for workout in workouts], models.Exercise.workout_id, models.Exercise.id,
+        )
+        for exercise in exercises:
+            exercises_by_workout[exercise.workout_id].append(dict(exercise._mapping))
+    for workout in workouts:
+        workout["exercises"] = exercises_by_workout[workout["id"]]
+    return workouts
+
+
+def _program_documents(db: Session, rows) -> List[dict]:
+    programs = [dict(row._mapping) for row in rows]
+    workouts_by_program = defaultdict(list)
+    workouts = _workout_documents(
+        db, models.Workout.program_id, [program["id"] for program in programs],
+        models.Workout.program_id, models.Workout.id,
+    ) if programs else []
+    for workout in workouts:
+        workouts_by_program[workout["program_id"]].append(workout)
+    for program in programs:
+        program["workouts"] = workouts_by_program[program["id"]]
+    return programs
+
+
+def get_program_documents(
+    db: Session,
+    difficulty: Optional[str] = None,
+    goal: Optional[str] = None,
+    location: Optional[str] = None,
+    search: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    """То же, что get_programs, но словарями: программа -> workouts -> exercises."""
+    query = db.query(*_schema_columns(models.WorkoutProgram, schemas.WorkoutProgram))
+    query = _filter_programs(db, query, difficulty, goal, location, search, after_id)
+    return _program_documents(db, query.limit(limit).all())
+
+
+def get_program_document(db: Session, program_id: int) -> Optional[dict]:
+    row = (
+        db.query(*_schema_columns(models.WorkoutProgram, schemas.WorkoutProgram))
+        .filter(models.WorkoutProgram.id == program_id)
+        .first()
+    )
+    return _program_documents(db, [row])[0] if row else None
+
+
+def get_program_workout_documents(db: Session, program_id: int) -> List[dict]:
+    """Дни программы с упражнениями по порядку day_number, как get_program_workouts."""
+    return _workout_documents(db, models.Workout.program_id, [program_id], models.Workout.day_number, models.Workout.id)
+
+
+def get_workout_document(db: Session, workout_id: int) -> Optional[dict]:
+    workouts = _workout_documents(db, models.Workout.id, [workout_id])
+    return workouts[0] if workouts else None
+
+
+def get_program_summary_documents(db: Session, **filters) -> List[dict]:
+    return [dict(row._mapping) for row in get_program_summaries(db, **filters)]
+
+
+def get_program_summary_document(db: Session, program_id: int) -> Optional[dict]:
+    row = get_program_summary(db, program_id)
+    return dict(row._mapping) if row else None
+
+
+def bump_catalog_revision(db: Session, program_ids=()) -> int:
+    """
+    Увеличивает ревизию каталога (и записывает ее изменившимся программам)
+    без коммита — вызывается в транзакции, меняющей каталог. Строка каталога
+    заблокирована до коммита, поэтому ревизии выдаются в порядке коммитов.
+    """
+    table = models.CatalogRevision.__table__
+    statement = dialect_insert(db, table)
+    revision = db.execute(
+        statement.values(scope=CATALOG_SCOPE, revision=1)
+        .on_conflict_do_update(index_elements=["scope"], set_={"revision": table.c.revision + 1})
+        .returning(table.c.revision)
+    ).scalar_one()
+    if program_ids:
+        db.execute(
+            statement.on_conflict_do_update(index_elements=["scope"], set_={"revision": statement.excluded.revision}),
+            [{"scope": program_id, "revision": revision} for program_id in sorted(set(program_ids))],
+        )
+    return revision
+
+
+def get_catalog_revisions(db: Session, since: int) -> List[Tuple[int, int]]:
+    """(scope, revision) изменившиеся после ревизии каталога since — по индексу на revision."""
+    table = models.CatalogRevision.__table__
+    return [tuple(row) for row in db.execute(select(table.c.scope, table.c.revision).where(table.c.revision > since))]
+
+
+def program_exists(db: Session, program_id: int) -> bool:
+    return db.query(models.WorkoutProgram.id).filter(models.WorkoutProgram.id == program_id).first() is not None
 
 
 def create_program(db: Session, program: schemas.WorkoutProgramCreate) -> models.WorkoutProgram:
     db_program = models.WorkoutProgram(**program.dict())
     db.add(db_program)
+    bump_catalog_revision(db)
+    db.commit()
+    # Перечитываем вместе с (пустым) деревом дней: ответ сериализуется уже
+    # вне сессии, и в async-режиме ленивая подгрузка там недоступна
+    return get_program(db, db_program.id)
+
+
+def update_program(
+    db: Session, program_id: int, program_data: schemas.WorkoutProgramUpdate
+) -> Optional[models.WorkoutProgram]:
+    db_program = db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id == program_id).first()
+    if not db_program:
+        return None
+
+    db_program.name = program_data.name
+    if program_data.description is not None:
+        db_program.description = program_data.description
+    db_program.difficulty = program_data.difficulty
+    db_program.goal = program_data.goal
+    db_program.location = program_data.location
+
+    bump_catalog_revision(db, [program_id])
+    db.commit()
+    return get_program(db, program_id)
+
+
+def delete_program(db: Session, program_id: int) -> bool:
+    db_program = db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id == program_id).first()
+    if not db_program:
+        return False
+    try:
+        db.delete(db_program)
+        bump_catalog_revision(db, [program_id])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return True
+
+
+def create_program_full(db: Session, program: schemas.WorkoutProgramFullCreate) -> models.WorkoutProgram:
+    """
+    Создает программу с днями и упражнениями в одной транзакции:
+    по одному INSERT на уровень (executemany), без refresh каждой строки.
+    """
+    program_id = db.execute(
+        insert(models.WorkoutProgram)
+        .values(**program.model_dump(exclude={"workouts"}))
+        .returning(models.WorkoutProgram.id)
+    ).scalar_one()
+
+    if program.workouts:
+        # id выдаются по порядку строк в батче, а порядок строк RETURNING
+        # не гарантирован — сортируем, чтобы сопоставить дни с входными данными.
+        # (sort_by_parameter_order у SQLite откатывается на вставку по одной строке.)
+        workout_ids = sorted(db.execute(
+            insert(models.Workout).returning(models.Workout.id),
+            [
+                {**workout.model_dump(exclude={"exercises"}), "program_id": program_id}
+                for workout in program.workouts
+            ],
+        ).scalars().all())
+
+        exercise_rows = [
+            {**exercise.model_dump(), "workout_id": workout_id}
+            for workout_id, workout in zip(workout_ids, program.workouts)
+            for exercise in workout.exercises
+        ]
+        if exercise_rows:
+            db.execute(insert(models.Exercise), exercise_rows)
+
+    bump_catalog_revision(db)
     db.commit()
-    db.refresh(db_program)
-    return db_program
+    return get_program(db, program_id)
 
 
 def get_workout(db: Session, workout_id: int) -> Optional[models.Workout]:
-    return db.query(models.Workout).filter(models.Workout.id == workout_id).first()
+    return (
+        db.query(models.Workout)
+        .options(selectinload(models.Workout.exercises))
+        .filter(models.Workout.id == workout_id)
+        .first()
+    )
+
+
+def get_workout_program_id(db: Session, workout_id: int) -> Optional[int]:
+    return db.query(models.Workout.program_id).filter(models.Workout.id == workout_id).scalar()
+
+
+def get_workout_program_ids(db: Session, workout_ids: Set[int]) -> Dict[int, int]:
+    """workout_id -> program_id для существующих дней из набора (один запрос)."""
+    rows = db.query(models.Workout.id, models.Workout.program_id).filter(models.Workout.id.in_(workout_ids))
+    return {workout_id: program_id for workout_id, program_id in rows}
+
+
+def get_existing_program_ids(db: Session, program_ids: Set[int]) -> Set[int]:
+    rows = db.query(models.WorkoutProgram.id).filter(models.WorkoutProgram.id.in_(program_ids))
+    return {program_id for program_id, in rows}
 
 
 def get_program_workouts(db: Session, program_id: int) -> List[models.Workout]:
-    return db.query(models.Workout).filter(models.Workout.program_id == program_id).order_by(models.Workout.day_number).all()
+    return (
+        db.query(models.Workout)
+        .options(selectinload(models.Workout.exercises))
+        .filter(models.Workout.program_id == program_id)
+        .order_by(models.Workout.day_number)
+        .all()
+    )
 
 
 def create_workout(db: Session, workout: schemas.WorkoutCreate) -> models.Workout:
     db_workout = models.Workout(**workout.dict())
     db.add(db_workout)
+    bump_catalog_revision(db, [workout.program_id])
+    db.commit()
+    return get_workout(db, db_workout.id)
+
+
+def create_workouts_bulk(db: Session, workouts: List[schemas.WorkoutCreate]):
+    """
+    Вставляет дни одним executemany и возвращает созданные строки (RETURNING),
+    без refresh каждой строки. Существование программ проверяет вызывающий код.
+    """
+    table = models.Workout.__table__
+    rows = db.execute(insert(table).returning(*table.c), [workout.model_dump() for workout in workouts]).all()
+    bump_catalog_revision(db, [workout.program_id for workout in workouts])
+    db.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+def delete_workout(db: Session, workout_id: int) -> Optional[int]:
+    """Удаляет день вместе с упражнениями, возвращает program_id или None."""
+    db_workout = db.query(models.Workout).filter(models.Workout.id == workout_id).first()
+    if not db_workout:
+        return None
+    program_id = db_workout.program_id
+    # Записи прогресса дня удалятся каскадно — статистику этих пользователей нужно
+    # пересчитать, а дельты по курсору у них больше не годятся
+    user_ids = db.scalars(
+        select(models.UserProgress.user_id).where(models.UserProgress.workout_id == workout_id).distinct()
+    ).all()
+    pairs = [(user_id, program_id) for user_id in user_ids]
+    bump_progress_revisions(db, pairs, reset=True)
+    db.delete(db_workout)
+    db.flush()
+    refresh_program_stats(db, pairs)
+    bump_catalog_revision(db, [program_id])
     db.commit()
-    db.refresh(db_workout)
-    return db_workout
+    return program_id
 
 
 def get_exercise(db: Session, exercise_id: int) -> Optional[models.Exercise]:
@@ -63,28 +481,157 @@ def get_workout_exercises(db: Session, workout_id: int) -> List[models.Exercise]
 def create_exercise(db: Session, exercise: schemas.ExerciseCreate) -> models.Exercise:
     db_exercise = models.Exercise(**exercise.dict())
     db.add(db_exercise)
+    bump_catalog_revision(db, [get_workout_program_id(db, exercise.workout_id)])
     db.commit()
     db.refresh(db_exercise)
     return db_exercise
 
 
+def create_exercises_bulk(db: Session, exercises: List[schemas.ExerciseCreate]):
+    """Как create_workouts_bulk, но для упражнений."""
+    table = models.Exercise.__table__
+    rows = db.execute(insert(table).returning(*table.c), [exercise.model_dump() for exercise in exercises]).all()
+    bump_catalog_revision(db, get_workout_program_ids(db, {exercise.workout_id for exercise in exercises}).values())
+    db.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+def update_exercise(
+    db: Session, exercise_id: int, exercise: schemas.ExerciseCreate
+) -> Optional[Tuple[models.Exercise, int]]:
+    """Обновляет упражнение, возвращает (упражнение, program_id) или None."""
+    db_exercise = get_exercise(db, exercise_id)
+    if not db_exercise:
+        return None
+    program_id = get_workout_program_id(db, db_exercise.workout_id)
+
+    db_exercise.name = exercise.name
+    db_exercise.sets = exercise.sets
+    db_exercise.reps = exercise.reps
+    db_exercise.rest_time = exercise.rest_time
+    db_exercise.description = exercise.description
+
+    bump_catalog_revision(db, [program_id])
+    db.commit()
+    db.refresh(db_exercise)
+    return db_exercise, program_id
+
+
+def delete_exercise(db: Session, exercise_id: int) -> Optional[int]:
+    """Удаляет упражнение, возвращает program_id его дня или None."""
+    db_exercise = get_exercise(db, exercise_id)
+    if not db_exercise:
+        return None
+    program_id = get_workout_program_id(db, db_exercise.workout_id)
+    db.delete(db_exercise)
+    bump_catalog_revision(db, [program_id])
+    db.commit()
+    return program_id
+
+
 def get_user_progress(db: Session, user_id: int) -> List[models.UserProgress]:
     return db.query(models.UserProgress).filter(models.UserProgress.user_id == user_id).all()
 
 
-def get_user_program_progress(db: Session, user_id: int, program_id: int) -> List[models.UserProgress]:
-    return db.query(models.UserProgress).filter(
-        models.UserProgress.user_id == user_id,
-        models.UserProgress.program_id == program_id
+def get_user_progress_documents(db: Session, user_id: int) -> List[dict]:
+    rows = db.execute(
+        select(*_schema_columns(models.UserProgress, schemas.UserProgress))
+        .where(models.UserProgress.user_id == user_id)
+        .order_by(models.UserProgress.id)
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+def get_active_program_id(db: Session, user_id: int) -> Optional[int]:
+    """Программа, в которой пользователь отмечался последним."""
+    return db.scalar(
+        select(models.UserProgress.program_id)
+        .where(models.UserProgress.user_id == user_id)
+        .order_by(models.UserProgress.updated_at.desc())
+        .limit(1)
+    )
+
+
+def get_user_program_progress(
+    db: Session, user_id: int, program_id: int, since: Optional[int] = None
+) -> schemas.ProgramProgress:
+    """
+    Состояние дней программы по записям прогресса пользователя. Читает только
+    строки пары (user_id, program_id) по покрывающему индексу вместе с ревизией
+    пары — одним запросом, то есть из одного снимка. since (ревизия из прошлого
+    ответа) отсекает дни, не менявшиеся после нее; счётчики всегда считаются по
+    всей программе. Если после since записи пары удалялись (или since не
+    встречалась вовсе), возвращается полное состояние с full=True.
+    """
+    progress, stats = models.UserProgress, models.UserProgramStats
+    pair = (stats.user_id == user_id) & (stats.program_id == program_id)
+    rows = db.execute(
+        select(
+            progress.workout_id,
+            progress.is_completed,
+            progress.revision,
+            select(stats.revision).where(pair).scalar_subquery().label("pair_revision"),
+            select(stats.reset_revision).where(pair).scalar_subquery().label("reset_revision"),
+        )
+        .where(progress.user_id == user_id, progress.program_id == program_id)
     ).all()
-
-
-def create_progress(db: Session, progress: schemas.UserProgressCreate) -> models.UserProgress:
-    db_progress = models.UserProgress(**progress.dict())
-    db.add(db_progress)
+    total_workouts = db.scalar(
+        select(func.count()).select_from(models.Workout).where(models.Workout.program_id == program_id)
+    )
+
+    cursor = (rows[0].pair_revision or 0) if rows else None
+    full = since is None or not rows or since < (rows[0].reset_revision or 0) or since > cursor
+    changed = rows if full else [row for row in rows if row.revision > since]
+    return schemas.ProgramProgress(
+        program_id=program_id,
+        completed_workout_ids=[row.workout_id for row in changed if row.is_completed],
+        uncompleted_workout_ids=[row.workout_id for row in changed if not row.is_completed],
+        completed_count=sum(1 for row in rows if row.is_completed),
+        total_workouts=total_workouts,
+        cursor=cursor,
+        full=full,
+    )
+
+
+def upsert_progress(db: Session, progress: schemas.UserProgressCreate) -> Optional[schemas.UserProgress]:
+    """
+    Создает или обновляет запись (user_id, workout_id) одним INSERT ... ON CONFLICT DO UPDATE.
+    Повторная отметка выполнения сохраняет исходное completed_at, а без
+    is_completed отметка существующей записи не меняется. Несуществующего
+    пользователя отклоняет сама БД внешним ключом (IntegrityError).
+
+    None — дня нет или он из другой программы: program_id записи всегда
+    program_id ее дня, иначе запись переехала бы к другой паре, а сводка и
+    курсор старой пары об этом не узнали бы.
+    """
+    if get_workout_program_id(db, progress.workout_id) != progress.program_id:
+        return None
+    now = datetime.utcnow()
+    revisions = bump_progress_revisions(db, [(progress.user_id, progress.program_id)])
+    statement = dialect_insert(db, models.UserProgress.__table__).values(
+        **progress.model_dump(),
+        completed_at=now if progress.is_completed else None,
+        updated_at=now,
+        revision=revisions[progress.user_id, progress.program_id],
+    )
+    if progress.is_completed is None:
+        statement = statement.values(is_completed=False)
+    table = models.UserProgress.__table__
+    set_ = {
+        "updated_at": statement.excluded.updated_at,
+        "revision": statement.excluded.revision,
+    }
+    if progress.is_completed is not None:
+        set_["is_completed"] = statement.excluded.is_completed
+        set_["completed_at"] = case(
+            (table.c.is_completed & statement.excluded.is_completed, table.c.completed_at),
+            else_=statement.excluded.completed_at,
+        )
+    statement = statement.on_conflict_do_update(index_elements=["user_id", "workout_id"], set_=set_)
+    row = db.execute(statement.returning(*table.c)).one()
+    refresh_program_stats(db, [(row.user_id, row.program_id)])
     db.commit()
-    db.refresh(db_progress)
-    return db_progress
+    return schemas.UserProgress.model_validate(row._mapping)
 
 
 def get_progress(db: Session, progress_id: int) -> Optional[models.UserProgress]:
@@ -92,12 +639,166 @@ def get_progress(db: Session, progress_id: int) -> Optional[models.UserProgress]
 
 
 def update_progress_completion(db: Session, progress_id: int, is_completed: bool) -> Optional[models.UserProgress]:
-    from datetime import datetime
     db_progress = get_progress(db, progress_id)
     if db_progress:
+        pair = (db_progress.user_id, db_progress.program_id)
+        db_progress.revision = bump_progress_revisions(db, [pair])[pair]
         db_progress.is_completed = is_completed
-        if is_completed:
-            db_progress.completed_at = datetime.utcnow()
+        # Если ставим True - записываем время, если False - убираем
+        db_progress.completed_at = datetime.utcnow() if is_completed else None
+        db.flush()
+        refresh_program_stats(db, [(db_progress.user_id, db_progress.program_id)])
         db.commit()
         db.refresh(db_progress)
     return db_progress
+
+
+def get_progress_row(db: Session, progress_id: int) -> Optional[schemas.UserProgress]:
+    db_progress = get_progress(db, progress_id)
+    return schemas.UserProgress.model_validate(db_progress) if db_progress else None
+
+
+def apply_progress_completions(db: Session, events: List[dict]):
+    """
+    Применяет отложенные отметки выполнения одной транзакцией (executemany).
+    Для каждой записи остается только последнее событие.
+    """
+    latest = {event["progress_id"]: event for event in events}
+    table = models.UserProgress.__table__
+    pair_of = {
+        row.id: (row.user_id, row.program_id)
+        for row in db.execute(select(table.c.id, table.c.user_id, table.c.program_id).where(table.c.id.in_(latest)))
+    }
+    revisions = bump_progress_revisions(db, pair_of.values())
+    db.execute(
+        update(table)
+        .where(table.c.id == bindparam("progress_id"))
+        .values(
+            is_completed=bindparam("is_completed"),
+            completed_at=bindparam("completed_at"),
+            updated_at=bindparam("updated_at"),
+            revision=bindparam("revision"),
+        ),
+        [
+            {
+                **{key: event[key] for key in ("progress_id", "is_completed", "completed_at", "updated_at")},
+                "revision": revisions[pair_of[progress_id]],
+            }
+            for progress_id, event in latest.items()
+            if progress_id in pair_of
+        ],
+    )
+    refresh_program_stats(db, pair_of.values())
+    db.commit()
+
+
+def completion_streaks(dates: List[date]) -> Tuple[int, int]:
+    """(серия, заканчивающаяся последней датой; самая длинная серия) по отсортированным уникальным датам."""
+    current = longest = 0
+    previous = None
+    for day in dates:
+        current = current + 1 if previous is not None and (day - previous).days == 1 else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest
+
+
+def bump_progress_revisions(db: Session, pairs, reset: bool = False) -> Dict[Tuple[int, int], int]:
+    """
+    Увеличивает ревизию прогресса пар (user_id, program_id) и возвращает новые
+    значения. Вызывается в транзакции, меняющей user_progress, до самого
+    изменения: строка сводки остается заблокированной до коммита (в SQLite —
+    вся база), поэтому ревизии одной пары выдаются в порядке коммитов.
+    reset — записи пары удаляются, курсоры старше этой ревизии недействительны.
+    """
+    table = models.UserProgramStats.__table__
+    statement = dialect_insert(db, table)
+    set_ = {"revision": table.c.revision + 1}
+    if reset:
+        set_["reset_revision"] = table.c.revision + 1
+    statement = statement.on_conflict_do_update(index_elements=["user_id", "program_id"], set_=set_).returning(
+        table.c.revision
+    )
+    revisions = {}
+    # Один порядок блокировок во всех транзакциях — без взаимных блокировок в PostgreSQL
+    for user_id, program_id in sorted(set(pairs)):
+        revisions[user_id, program_id] = db.execute(statement.values(
+            user_id=user_id, program_id=program_id, revision=1, reset_revision=1 if reset else 0,
+        )).scalar_one()
+    return revisions
+
+
+def refresh_program_stats(db: Session, pairs):
+    """
+    Пересчитывает user_program_stats для пар (user_id, program_id) без коммита —
+    вызывается внутри транзакции, изменившей user_progress. Объем работы
+    ограничен числом дней программы, а не длиной истории пользователя.
+    """
+    progress = models.UserProgress
+    rows = []
+    for user_id, program_id in set(pairs):
+        completed = db.scalars(
+            select(progress.completed_at).where(
+                progress.user_id == user_id,
+                progress.program_id == program_id,
+                progress.is_completed.is_(True),
+            )
+        ).all()
+        timestamps = sorted(value for value in completed if value is not None)
+        streak_days, longest_streak = completion_streaks(sorted({value.date() for value in timestamps}))
+        rows.append({
+            "user_id": user_id,
+            "program_id": program_id,
+            "completed_days": len(completed),
+            "streak_days": streak_days,
+            "longest_streak": longest_streak,
+            "last_completed_at": timestamps[-1] if timestamps else None,
+            "updated_at": datetime.utcnow(),
+        })
+    if rows:
+        # Ревизии ведет bump_progress_revisions, здесь они не трогаются
+        statement = dialect_insert(db, models.UserProgramStats.__table__)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=["user_id", "program_id"],
+                set_={name: statement.excluded[name] for name in rows[0] if name not in ("user_id", "program_id")},
+            ),
+            rows,
+        )
+
+
+def get_program_stats(db: Session, user_id: int, program_id: int) -> Optional[schemas.ProgramStats]:
+    """Статистика одним запросом: строка сводки по ключу и число дней программы."""
+    stats = models.UserProgramStats
+    total_days = (
+        select(func.count()).select_from(models.Workout)
+        .where(models.Workout.program_id == models.WorkoutProgram.id)
+        .scalar_subquery()
+    )
+    row = db.execute(
+        select(
+            total_days.label("total_days"),
+            stats.completed_days,
+            stats.streak_days,
+            stats.longest_streak,
+            stats.last_completed_at,
+        )
+        .select_from(models.WorkoutProgram)
+        .outerjoin(stats, (stats.program_id == models.WorkoutProgram.id) & (stats.user_id == user_id))
+        .where(models.WorkoutProgram.id == program_id)
+    ).one_or_none()
+    if row is None:
+        return None
+
+    last_completed_at = row.last_completed_at
+    # Серия продолжается, пока последняя тренировка была сегодня или вчера
+    alive = last_completed_at is not None and (datetime.utcnow().date() - last_completed_at.date()).days <= 1
+    return schemas.ProgramStats(
+        user_id=user_id,
+        program_id=program_id,
+        completed_days=row.completed_days or 0,
+        total_days=row.total_days,
+        current_streak=row.streak_days if alive else 0,
+        longest_streak=row.longest_streak or 0,
+        last_completed_at=last_completed_at,
+    )
@@ -1,14 +1,61 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
 import os
 
+from profiling import call_profiled
+
 # Используем переменную окружения DATABASE_URL, если она есть
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./workout_app.db")
 
+# DB_ASYNC=1 — обработчики работают через AsyncEngine/AsyncSession
+# (aiosqlite для SQLite, asyncpg для PostgreSQL) без пула потоков
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+
+# Настройки SQLite, применяемые к каждому соединению пула. Пустое значение
+# переменной окружения отключает соответствующий PRAGMA.
+#  - WAL: читатели не блокируются писателем;
+#  - synchronous=NORMAL: в WAL-режиме безопасно и без fsync на каждый коммит;
+#  - busy_timeout: ждать освобождения блокировки вместо "database is locked";
+#  - foreign_keys: без него SQLite игнорирует ondelete="CASCADE".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),  # отрицательное — в КиБ, т.е. 64 МБ
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT", "5000"),
+    "foreign_keys": os.getenv("SQLITE_FOREIGN_KEYS", "ON"),
+}
+
+
+def unicode_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def apply_sqlite_pragmas(target_engine, pragmas: dict = SQLITE_PRAGMAS):
+    """Регистрирует установку PRAGMA и функции unicode_lower на каждое новое соединение движка SQLite."""
+    if target_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(target_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                if value:
+                    cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+        # Встроенные lower() и LIKE в SQLite складывают регистр только для ASCII
+        dbapi_connection.create_function("unicode_lower", 1, unicode_lower, deterministic=True)
+
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+apply_sqlite_pragmas(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -21,3 +68,79 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def to_async_url(url: str) -> str:
+    """sqlite:///... -> sqlite+aiosqlite:///..., postgresql://... -> postgresql+asyncpg://..."""
+    scheme, rest = url.split("://", 1)
+    driver = {
+        "sqlite": "sqlite+aiosqlite",
+        "postgres": "postgresql+asyncpg",
+        "postgresql": "postgresql+asyncpg",
+    }.get(scheme.split("+")[0], scheme)
+    return f"{driver}://{rest}"
+
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL))
+    apply_sqlite_pragmas(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
+
+class AsyncDB:
+    """
+    Асинхронный доступ к БД для обработчиков.
+
+    Функции из crud.py синхронные и принимают Session первым аргументом.
+    В async-режиме они выполняются через AsyncSession.run_sync (в greenlet на
+    event loop, без потоков), в обычном режиме — в пуле потоков (под
+    профилировщиком, если запрос профилируется, см. profiling.py).
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run(self, fn, *args, **kwargs):
+        if isinstance(self.session, Session):
+            return await run_in_threadpool(call_profiled, fn, self.session, *args, **kwargs)
+        return await self.session.run_sync(fn, *args, **kwargs)
+
+
+async def get_async_db():
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield AsyncDB(session)
+    else:
+        db = SessionLocal()
+        try:
+            yield AsyncDB(db)
+        finally:
+            db.close()
+
+
+def _call_in_new_session(fn, *args, **kwargs):
+    db = SessionLocal()
+    try:
+        return call_profiled(fn, db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def run_in_session(fn, *args, **kwargs):
+    """
+    Выполняет функцию crud в собственной сессии — для фоновых задач и параллельных запросов.
+
+    В обычном режиме сессия целиком живет в потоке пула: создается, используется
+    и закрывается там же. Отмена вызывающей задачи поток не останавливает, и
+    соединение не может вернуться в пул, пока поток им еще пользуется; результат
+    такого вызова просто отбрасывается.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(_call_in_new_session, fn, *args, **kwargs)
@@ -0,0 +1,298 @@
+"""
+Синтетический набор данных для нагрузочных прогонов: каталог, пользователи и
+история прогресса.
+
+Каталог — programs программ по days дней и exercises упражнений с фасетами
+из значений, которые использует фронтенд. История прогресса похожа на
+настоящую:
+  - популярность программ убывает по закону Ципфа (popularity_skew);
+  - часть пользователей ничего не начинает, остальные — одну программу,
+    реже несколько;
+  - дни программы проходятся по порядку, после каждого пользователь
+    продолжает с вероятностью retention, между тренировками 1-4 дня;
+  - за последним выполненным днем иногда следует начатый, но не отмеченный.
+Из той же истории сразу считается user_program_stats, как это сделал бы
+crud.refresh_program_stats.
+
+Все случайные значения берутся из random.Random(seed), а время отсчитывается
+от until, поэтому при одинаковых seed и until данные совпадают до байта.
+Строки вставляются через insert() executemany порциями по batch_size строк,
+одна транзакция на порцию, с явными id — без RETURNING и ORM-объектов.
+"""
+import random
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+from operator import itemgetter
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import DateTime, func, insert, select
+from sqlalchemy.orm import Session
+
+import crud
+import models
+
+DIFFICULTIES = ("beginner", "intermediate", "advanced")
+GOALS = ("weight_loss", "muscle_gain", "endurance", "flexibility")
+LOCATIONS = ("home", "gym", "street")
+
+# Синтетические telegram_id не пересекаются с реальными пользователями тестовых стендов
+TELEGRAM_ID_BASE = 9_000_000_000
+# Перерыв между тренировками, когда он больше одного дня
+GAP_DAYS = (2, 2, 3, 4)
+
+
+class DatasetConfig(NamedTuple):
+    programs: int = 100
+    days: int = 14
+    exercises: int = 6
+    users: int = 10_000
+    seed: int = 1
+    # Конец истории прогресса; None — полночь текущих суток (UTC)
+    until: Optional[datetime] = None
+    history_days: int = 120
+    # Вероятность перейти к следующему дню программы после выполненного
+    retention: float = 0.85
+    popularity_skew: float = 1.1
+    batch_size: int = 100_000
+
+
+class DatasetError(ValueError):
+    pass
+
+
+def telegram_id(user_id: int) -> str:
+    return str(TELEGRAM_ID_BASE + user_id)
+
+
+def workout_id(config: DatasetConfig, program_id: int, day_number: int) -> int:
+    return (program_id - 1) * config.days + day_number
+
+
+def exercise_id(config: DatasetConfig, workout: int, position: int) -> int:
+    return (workout - 1) * config.exercises + position
+
+
+def resolve_until(config: DatasetConfig) -> datetime:
+    if config.until is not None:
+        return config.until
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def program_rows(config: DatasetConfig, rng: random.Random) -> Iterator[dict]:
+    for program_id in range(1, config.programs + 1):
+        yield {
+            "id": program_id,
+            "difficulty": rng.choice(DIFFICULTIES),
+            "goal": rng.choice(GOALS),
+            "location": rng.choice(LOCATIONS),
+            "name": f"Программа {program_id}",
+            "description": "Синтетическая программа для нагрузочного теста: " + "описание " * rng.randint(5, 30),
+        }
+
+
+def workout_rows(config: DatasetConfig) -> Iterator[dict]:
+    for program_id in range(1, config.programs + 1):
+        for day in range(1, config.days + 1):
+            yield {
+                "id": workout_id(config, program_id, day),
+                "program_id": program_id,
+                "day_number": day,
+                "title": f"День {day}",
+                "description": "Разминка, основная часть и заминка",
+            }
+
+
+def exercise_rows(config: DatasetConfig, rng: random.Random) -> Iterator[dict]:
+    for workout in range(1, config.programs * config.days + 1):
+        for position in range(1, config.exercises + 1):
+            yield {
+                "id": exercise_id(config, workout, position),
+                "workout_id": workout,
+                "name": f"Упражнение {position}",
+                "sets": rng.randint(2, 5),
+                "reps": rng.choice(("8-10", "10-12", "12-15", "30 сек")),
+                "rest_time": rng.choice((30, 45, 60, 90, 120)),
+                "description": "Техника выполнения: " + "пояснение " * rng.randint(3, 15),
+            }
+
+
+def user_rows(config: DatasetConfig, rng: random.Random, until: datetime) -> Iterator[dict]:
+    first_day = until - timedelta(days=config.history_days)
+    for user_id in range(1, config.users + 1):
+        yield {
+            "id": user_id,
+            "telegram_id": telegram_id(user_id),
+            "created_at": first_day - timedelta(minutes=rng.randrange(30 * 24 * 60)),
+        }
+
+
+def _programs_per_user(rng: random.Random, programs: int) -> int:
+    # 20% ничего не начинают; остальные — 1, 2, ... с геометрически убывающей долей
+    if rng.random() < 0.2:
+        return 0
+    count = 1
+    while count < min(programs, 5) and rng.random() < 0.3:
+        count += 1
+    return count
+
+
+def progress_batches(config: DatasetConfig, rng: random.Random, until: datetime) -> Iterator[Tuple[List[dict], List[dict]]]:
+    """Порции строк (user_progress, user_program_stats) в порядке пользователей, по batch_size строк прогресса."""
+    program_ids = list(range(1, config.programs + 1))
+    # Ранги популярности перемешаны, чтобы популярные программы не шли подряд по id
+    ranks = program_ids[:]
+    rng.shuffle(ranks)
+    cum_weights = list(accumulate(1 / rank ** config.popularity_skew for rank in ranks))
+    total_weight = cum_weights[-1]
+    history_minutes = config.history_days * 24 * 60
+    days, retention, random_value = config.days, config.retention, rng.random
+    progress, stats = [], []
+    progress_id = 0
+
+    for user_id in range(1, config.users + 1):
+        started = set()
+        wanted = _programs_per_user(rng, config.programs)
+        while len(started) < wanted:
+            started.add(program_ids[bisect(cum_weights, random_value() * total_weight)])
+
+        for program_id in sorted(started):
+            first_workout = workout_id(config, program_id, 1)
+            moment = until - timedelta(minutes=int(random_value() * history_minutes) + 1)
+            completed: List[datetime] = []
+            day = 1
+            while day <= days and moment < until:
+                completed.append(moment)
+                progress_id += 1
+                progress.append({
+                    "id": progress_id, "user_id": user_id, "program_id": program_id,
+                    "workout_id": first_workout + day - 1,
+                    "is_completed": True, "completed_at": moment, "updated_at": moment,
+                })
+                day += 1
+                if random_value() >= retention:
+                    break
+                # Чаще всего на следующий день, иногда через 2-4 дня; время суток плавает на ±3 часа
+                gap_days = 1 if random_value() < 0.6 else GAP_DAYS[int(random_value() * len(GAP_DAYS))]
+                moment += timedelta(days=gap_days, minutes=int(random_value() * 360) - 180)
+
+            if day <= days and random_value() < 0.3:
+                # День открыт, но не отмечен
+                progress_id += 1
+                progress.append({
+                    "id": progress_id, "user_id": user_id, "program_id": program_id,
+                    "workout_id": first_workout + day - 1,
+                    "is_completed": False, "completed_at": None, "updated_at": min(moment, until),
+                })
+
+            if completed:
+                streak_days, longest_streak = crud.completion_streaks(sorted({value.date() for value in completed}))
+                stats.append({
+                    "user_id": user_id, "program_id": program_id, "completed_days": len(completed),
+                    "streak_days": streak_days, "longest_streak": longest_streak,
+                    "last_completed_at": completed[-1], "updated_at": until,
+                })
+
+        if len(progress) >= config.batch_size:
+            yield progress, stats
+            progress, stats = [], []
+    if progress or stats:
+        yield progress, stats
+
+
+class BatchInserter:
+    """
+    Копит строки по таблицам и вставляет их executemany, коммитя каждую порцию.
+
+    Скомпилированный insert() выполняется драйвером напрямую: построчная
+    обработка параметров SQLAlchemy занимала больше времени, чем сама вставка.
+    Единственное преобразование типов, нужное драйверу, — DateTime в строку
+    для SQLite — делается здесь в том же формате, что у SQLAlchemy.
+    """
+
+    def __init__(self, db: Session, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.pending: Dict[object, List[dict]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, table, rows: List[dict]):
+        pending = self.pending.setdefault(table, [])
+        pending.extend(rows)
+        if len(pending) >= self.batch_size:
+            self.flush(table)
+
+    def flush(self, table=None):
+        for pending_table in [table] if table is not None else list(self.pending):
+            rows = self.pending.pop(pending_table, [])
+            if rows:
+                self._execute_many(pending_table, rows)
+                self.db.commit()
+                self.counts[pending_table.name] = self.counts.get(pending_table.name, 0) + len(rows)
+
+    def _execute_many(self, table, rows: List[dict]):
+        connection = self.db.connection()
+        dialect = connection.dialect
+        compiled = insert(table).compile(dialect=dialect, column_keys=list(rows[0]))
+        if dialect.name == "sqlite":
+            datetime_keys = [
+                column.name for column in table.c if isinstance(column.type, DateTime) and column.name in rows[0]
+            ]
+            for row in rows:
+                previous = converted = None
+                for key in datetime_keys:
+                    value = row[key]
+                    if value is None:
+                        continue
+                    # completed_at и updated_at обычно один и тот же объект — форматируем его один раз
+                    if value is not previous:
+                        previous, converted = value, value.isoformat(" ", "microseconds")
+                    row[key] = converted
+        if compiled.positional:
+            getter = itemgetter(*compiled.positiontup)
+            connection.exec_driver_sql(compiled.string, [getter(row) for row in rows])
+        else:
+            connection.exec_driver_sql(compiled.string, rows)
+
+
+def generate(db: Session, config: DatasetConfig) -> Dict[str, int]:
+    """Заполняет пустую базу; возвращает число вставленных строк по таблицам."""
+    for model in (models.WorkoutProgram, models.User, models.UserProgress):
+        if db.scalar(select(func.count()).select_from(model)):
+            raise DatasetError(f"table {model.__tablename__} is not empty; generate into an empty database")
+
+    rng = random.Random(config.seed)
+    until = resolve_until(config)
+    inserter = BatchInserter(db, config.batch_size)
+    for table, rows in (
+        (models.WorkoutProgram.__table__, program_rows(config, rng)),
+        (models.Workout.__table__, workout_rows(config)),
+        (models.Exercise.__table__, exercise_rows(config, rng)),
+        (models.User.__table__, user_rows(config, rng, until)),
+    ):
+        inserter.add(table, list(rows))
+        # Следующие таблицы ссылаются на эту (foreign_keys=ON)
+        inserter.flush(table)
+
+    # В пустую таблицу быстрее вставить без вторичных индексов и построить их один раз в конце
+    progress_indexes = list(models.UserProgress.__table__.indexes)
+    for index in progress_indexes:
+        index.drop(bind=db.connection())
+    try:
+        for progress, stats in progress_batches(config, rng, until):
+            inserter.add(models.UserProgress.__table__, progress)
+            inserter.add(models.UserProgramStats.__table__, stats)
+        inserter.flush()
+    finally:
+        db.rollback()
+        for index in progress_indexes:
+            index.create(bind=db.connection())
+        db.commit()
+
+    crud.sync_sequences(db, [
+        models.WorkoutProgram.__table__, models.Workout.__table__, models.Exercise.__table__,
+        models.User.__table__, models.UserProgress.__table__,
+    ])
+    crud.bump_catalog_revision(db)
+    db.commit()
+    return inserter.counts
@@ -0,0 +1,63 @@
+"""
+Генерация синтетических данных заданного размера (см. dataset.py).
+
+    python dataset_cli.py --programs 500 --days 21 --exercises 6 --users 300000
+    python dataset_cli.py --users 50000 --seed 7 --until 2025-01-01 --reset
+
+Работает с базой из DATABASE_URL, как init_db.py. Целевые таблицы должны быть
+пустыми; --reset удаляет все таблицы, и схема создается заново (migrations.py).
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from database import Base, SessionLocal, engine
+import dataset
+import migrations
+
+
+def main():
+    defaults = dataset.DatasetConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--programs", type=int, default=defaults.programs)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--exercises", type=int, default=defaults.exercises)
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument(
+        "--until", type=datetime.fromisoformat, default=None,
+        help="End of progress history (YYYY-MM-DD); default is today, pass it for reproducible data",
+    )
+    parser.add_argument("--history-days", type=int, default=defaults.history_days)
+    parser.add_argument("--retention", type=float, default=defaults.retention)
+    parser.add_argument("--popularity-skew", type=float, default=defaults.popularity_skew)
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    args = parser.parse_args()
+
+    config = dataset.DatasetConfig(
+        programs=args.programs, days=args.days, exercises=args.exercises, users=args.users, seed=args.seed,
+        until=args.until, history_days=args.history_days, retention=args.retention,
+        popularity_skew=args.popularity_skew, batch_size=args.batch_size,
+    )
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    migrations.upgrade(engine)
+
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        counts = dataset.generate(db, config)
+    except dataset.DatasetError as e:
+        sys.exit(f"Nothing generated: {e}")
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - started
+    for table, count in counts.items():
+        print(f"{table:<20} {count:>10}", file=sys.stderr)
+    print(f"Generated {sum(counts.values())} rows in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
-from database import engine, SessionLocal, Base
+from database import engine, SessionLocal
+import crud
+import migrations
 import models
 
 def init_database():
-    Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
     print("Database tables created successfully!")
 
     db = SessionLocal()
@@ -127,6 +129,7 @@ def init_database():
         for exercise in strength_exercises:
             db.add(exercise)
 
+        crud.bump_catalog_revision(db, [program.id])
         db.commit()
         print("Sample data added successfully!")
         print(f"Created program: {program.name}")
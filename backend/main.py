@@ -1,15 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from typing import List, Optional, Set
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, get_db, Base
-import models
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
+from sqlalchemy.exc import IntegrityError
+from cache import CachedBody, catalog_cache, catalog_revision_poller, user_cache
+from database import AsyncDB, SessionLocal, async_engine, engine, get_async_db, run_in_session
+from analytics import analytics_refresher
+from compression import COMPRESSION_MIN_BYTES, CompressionMiddleware, encoded_body, negotiate, payload_stats
+import analytics
+import catalog_io
+import migrations
+from matching import program_matcher
+from metrics import (
+    PROMETHEUS_CONTENT_TYPE, REQUEST_METRICS, MetricsMiddleware, instrument_engine, request_metrics, slow_queries,
+)
+import profiling
+import crud
 import schemas
-
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Workout Program API", version="1.0.0")
+from write_behind import ProgressNotFlushed, progress_writer
+
+# Сколько /bootstrap ждет необязательные части ответа (прогресс), мс
+BOOTSTRAP_BUDGET_MS = float(os.getenv("BOOTSTRAP_BUDGET_MS", "800"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схему меняет только migrate_db.py, запускаемый до воркеров
+    migrations.ensure_current(engine)
+    if progress_writer.enabled:
+        progress_writer.start()
+    analytics_refresher.start()
+    catalog_revision_poller.start()
+    yield
+    await catalog_revision_poller.close()
+    await analytics_refresher.close()
+    await progress_writer.close()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+# Ответы рендерит orjson; горячие пути чтения к тому же отдают готовые байты (см. cached_json)
+app = FastAPI(
+    title="Workout Program API", version="1.0.0", lifespan=lifespan, default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,286 +62,751 @@ app.add_middleware(
     allow_methods=["*"],
     # Разрешаем отправлять любые заголовки
     allow_headers=["*"],
+    # Курсор следующей страницы каталога должен быть доступен из JS
+    expose_headers=["X-Next-Cursor"],
 )
+if profiling.PROFILING_TOKEN:
+    app.add_middleware(profiling.ProfilingMiddleware)
+# Добавлен последним — внешний слой: сжимает и учитывает все ответы, включая CORS-заголовки
+app.add_middleware(CompressionMiddleware)
+if REQUEST_METRICS:
+    # Снаружи сжатия: время ответа включает его, размер ответа — уже сжатый
+    app.add_middleware(MetricsMiddleware)
+# Время SQL нужно и метрикам запросов, и журналу медленных запросов
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+
+
+@app.exception_handler(ProgressNotFlushed)
+async def progress_not_flushed_handler(request: Request, exc: ProgressNotFlushed):
+    # Отложенные отметки пользователя не записаны: устаревший прогресс не отдаем
+    return ORJSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "1"})
 
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Workout Program API", "status": "running"}
 
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/analytics/programs", response_model=schemas.AnalyticsReport)
+async def get_analytics_programs(db: AsyncDB = Depends(get_async_db)):
+    """
+    Освоение программ: сколько пользователей начали и завершили каждую программу.
+    Данные из сводной таблицы на момент refreshed_at.
+    """
+    return await db.run(analytics.get_program_report)
+
+
+@app.get("/analytics/programs/{program_id}/funnel", response_model=schemas.ProgramFunnel)
+async def get_analytics_funnel(program_id: int, db: AsyncDB = Depends(get_async_db)):
+    """
+    Воронка по дням программы: сколько пользователей выполнили каждый день.
+    """
+    funnel = await db.run(analytics.get_program_funnel, program_id)
+    if funnel is None:
+        raise HTTPException(status_code=404, detail="Program not found in analytics")
+    return funnel
+
+
+@app.get("/analytics/daily-active", response_model=schemas.DailyActiveReport)
+async def get_analytics_daily_active(
+    days: int = Query(30, ge=1, le=analytics.ANALYTICS_DAYS, description="Number of recent days"),
+    db: AsyncDB = Depends(get_async_db),
+):
+    return await db.run(analytics.get_daily_active, days)
+
+
+def require_analytics_token(x_analytics_token: Optional[str] = Header(None)):
+    if not analytics.ANALYTICS_REFRESH_TOKEN:
+        raise HTTPException(status_code=404, detail="Manual analytics refresh is disabled")
+    if not profiling.is_authorized(x_analytics_token, analytics.ANALYTICS_REFRESH_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid analytics token")
+
+
+@app.post("/analytics/refresh", dependencies=[Depends(require_analytics_token)])
+async def refresh_analytics():
+    """
+    Пересобирает сводные таблицы аналитики сразу, не дожидаясь планового обновления.
+    Требует заголовок X-Analytics-Token.
+    """
+    refreshed_at = await analytics_refresher.refresh()
+    return {"refreshed_at": refreshed_at, "duration_ms": round(analytics_refresher.last_refresh_ms, 3)}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Время ответа, SQL и ожидание пула по маршрутам в формате Prometheus."""
+    return Response(content=request_metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/metrics/payloads")
+async def payload_metrics():
+    """Размер ответов по маршрутам до и после сжатия, число ответов сверх PAYLOAD_BUDGET_BYTES."""
+    return payload_stats.stats()
+
+
+@app.get("/metrics/slow-queries")
+async def slow_query_metrics():
+    """Последние SQL-запросы дольше SLOW_QUERY_MS: маршрут, типы параметров и план."""
+    return {"threshold_ms": slow_queries.threshold_ms, "queries": slow_queries.entries()}
+
+
+def require_profiling_token(x_profile_token: Optional[str] = Header(None)):
+    if not profiling.PROFILING_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiling.is_authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+@app.get("/profiles", dependencies=[Depends(require_profiling_token)])
+async def list_profiles():
+    """Профили запросов, выполненных с заголовком X-Profile-Token, новые первыми."""
+    return profiling.profile_store.list()
+
+
+@app.get("/profiles/{profile_id}", dependencies=[Depends(require_profiling_token)])
+async def get_profile(profile_id: str, format: str = Query("prof", pattern="^(prof|text)$")):
+    """
+    Профиль запроса: prof — файл для pstats/snakeviz, text — функции по cumulative time.
+    """
+    request_profile = profiling.profile_store.get(profile_id)
+    if request_profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return Response(content=request_profile.text(), media_type="text/plain; charset=utf-8")
+    return Response(
+        content=request_profile.dump(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'},
+    )
+
+
+@app.get("/metrics/progress-writer")
+async def progress_writer_metrics():
+    """Глубина очереди отложенных отметок и время записи батчей."""
+    return progress_writer.stats()
+
+
+def remember_user(db_user) -> schemas.User:
+    user = schemas.User.model_validate(db_user)
+    user_cache.set(user.telegram_id, user)
+    return user
+
+
 @app.post("/users", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.telegram_id == user.telegram_id).first()
+async def create_user(user: schemas.UserCreate, db: AsyncDB = Depends(get_async_db)):
+    if user_cache.get(user.telegram_id) is not None:
+        raise HTTPException(status_code=400, detail="User already registered")
+    db_user = await db.run(crud.get_user_by_telegram_id, user.telegram_id)
     if db_user:
         raise HTTPException(status_code=400, detail="User already registered")
 
-    new_user = models.User(telegram_id=user.telegram_id)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
+    return remember_user(await db.run(crud.create_user, user))
+
+
+@app.post("/users/resolve", response_model=schemas.User)
+async def resolve_user(user: schemas.UserCreate, db: AsyncDB = Depends(get_async_db)):
+    """
+    Возвращает пользователя по telegram_id, при первом входе создает его.
+    Повторные вызовы обслуживаются из памяти без запросов к БД.
+    """
+    cached = user_cache.get(user.telegram_id)
+    if cached is not None:
+        return cached
+    return remember_user(await db.run(crud.get_or_create_user, user.telegram_id))
 
 
 @app.get("/users/{telegram_id}", response_model=schemas.User)
-def get_user(telegram_id: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.telegram_id == telegram_id).first()
+async def get_user(telegram_id: str, db: AsyncDB = Depends(get_async_db)):
+    cached = user_cache.get(telegram_id)
+    if cached is not None:
+        return cached
+    user = await db.run(crud.get_user_by_telegram_id, telegram_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return remember_user(user)
+
+
+def next_cursor_headers(rows, limit: Optional[int]) -> dict:
+    # Полная страница — значит, возможно, есть следующая; курсор = последний id
+    if limit is not None and len(rows) == limit:
+        return {"X-Next-Cursor": str(rows[-1]["id"])}
+    return {}
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    # Сжатое тело — другое представление с другими байтами: у него свой сильный ETag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(request: Request, etag: str) -> Optional[str]:
+    """Тег из If-None-Match, совпавший с etag любой кодировки (его и вернуть в 304), или None."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        if tag == "*":
+            return etag
+        # Суффикс любой поддерживаемой кодировки, даже если ее с тех пор отключили
+        if tag == etag or any(tag == encoded_etag(etag, encoding) for encoding in ("br", "gzip")):
+            return tag
+    return None
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def json_response(request: Request, cached: CachedBody, etag: Optional[str] = None) -> Response:
+    headers = dict(cached.headers or {})
+    if etag:
+        # no-cache: клиент хранит ответ, но каждый раз перепроверяет его по ETag
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "no-cache"
+    body = cached.body
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    if encoding and len(body) >= COMPRESSION_MIN_BYTES:
+        # Сжатый вариант хранится в записи кэша: повторные ответы не сжимаются заново
+        request.state.uncompressed_bytes = len(body)
+        body = encoded_body(cached, encoding)
+        headers["Content-Encoding"] = encoding
+        if etag:
+            headers["ETag"] = encoded_etag(etag, encoding)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def sync_catalog_revisions(db: AsyncDB):
+    """После изменения каталога: сразу подхватить новые ревизии из БД, не дожидаясь опроса."""
+    catalog_cache.apply_revisions(await db.run(crud.get_catalog_revisions, catalog_cache.stored_revision()))
+
+
+async def cached_json(request: Request, db: AsyncDB, key, etag: str, load, limit: Optional[int] = None) -> Response:
+    """
+    Отдает готовый JSON из кэша каталога, при промахе загружает данные через load(session),
+    сериализует и сохраняет. Ключ должен включать ревизию каталога или программы,
+    а etag строиться из той же ревизии: тогда 304 отдается без обращения к БД.
+
+    load возвращает словари в форме схемы ответа (crud.get_*_document*): они
+    сериализуются orjson напрямую, без ORM-объектов и валидации pydantic.
+    """
+    matched = etag_matches(request, etag)
+    if matched:
+        return not_modified(matched)
+
+    cached = catalog_cache.get(key)
+    if cached is None:
+        rows = await db.run(load)
+        cached = CachedBody(orjson.dumps(rows), next_cursor_headers(rows, limit), {})
+        catalog_cache.set(key, cached)
+    return json_response(request, cached, etag)
 
 
 @app.get("/programs", response_model=List[schemas.WorkoutProgram])
-def get_programs(
+async def get_programs(
+    request: Request,
     difficulty: Optional[str] = Query(None, description="Filter by difficulty level"),
     goal: Optional[str] = Query(None, description="Filter by goal"),
     location: Optional[str] = Query(None, description="Filter by location"),
-    db: Session = Depends(get_db)
+    search: Optional[str] = Query(None, description="Search by program name"),
+    after_id: Optional[int] = Query(None, description="Return programs with id greater than this cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size"),
+    db: AsyncDB = Depends(get_async_db)
+):
+    key = ("programs", difficulty, goal, location, search, after_id, limit, catalog_cache.catalog_revision())
+    return await cached_json(
+        request, db, key, catalog_cache.catalog_etag(),
+        lambda session: crud.get_program_documents(
+            session, difficulty=difficulty, goal=goal, location=location,
+            search=search, after_id=after_id, limit=limit,
+        ),
+        limit,
+    )
+
+@app.get("/programs/summary", response_model=List[schemas.WorkoutProgramSummary])
+async def get_program_summaries(
+    request: Request,
+    difficulty: Optional[str] = Query(None, description="Filter by difficulty level"),
+    goal: Optional[str] = Query(None, description="Filter by goal"),
+    location: Optional[str] = Query(None, description="Filter by location"),
+    search: Optional[str] = Query(None, description="Search by program name"),
+    after_id: Optional[int] = Query(None, description="Return programs with id greater than this cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size"),
+    db: AsyncDB = Depends(get_async_db)
+):
+    """
+    Краткий список программ для каталога: без дней и упражнений, только счётчики.
+    """
+    key = ("summary", difficulty, goal, location, search, after_id, limit, catalog_cache.catalog_revision())
+    return await cached_json(
+        request, db, key, catalog_cache.catalog_etag(),
+        lambda session: crud.get_program_summary_documents(
+            session, difficulty=difficulty, goal=goal, location=location,
+            search=search, after_id=after_id, limit=limit,
+        ),
+        limit,
+    )
+
+@app.get("/programs/match", response_model=List[schemas.ProgramMatch])
+async def match_programs(
+    difficulty: Optional[str] = Query(None, description="Preferred difficulty level"),
+    goal: Optional[str] = Query(None, description="Preferred goal"),
+    location: Optional[str] = Query(None, description="Preferred location"),
+    limit: int = Query(5, ge=1, le=100),
+    db: AsyncDB = Depends(get_async_db),
+):
+    """
+    Подбор программ для онбординга: сначала полные совпадения, затем частичные по убыванию score.
+    Отвечает из индекса в памяти, к БД обращается только после изменения каталога.
+    """
+    revision = catalog_cache.catalog_revision()
+    if not program_matcher.is_fresh(revision):
+        await db.run(program_matcher.rebuild, revision)
+    body = program_matcher.match({"difficulty": difficulty, "goal": goal, "location": location}, limit)
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/programs/export")
+async def export_programs(program_id: Optional[List[int]] = Query(None, description="Export only these programs")):
+    """
+    Выгружает каталог (или выбранные программы) в NDJSON: одна строка — одна программа с днями и упражнениями.
+    """
+    def stream():
+        # Генератор потребляется Starlette в пуле потоков, поэтому сессия своя и синхронная в обоих режимах
+        db = SessionLocal()
+        try:
+            yield from catalog_io.export_catalog(db, program_id)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="programs.ndjson"'},
+    )
+
+
+@app.post("/programs/import")
+async def import_programs(
+    request: Request,
+    keep_ids: bool = Query(True, description="Upsert by id; false creates every program anew"),
+    db: AsyncDB = Depends(get_async_db),
 ):
-    query = db.query(models.WorkoutProgram)
+    """
+    Загружает NDJSON из тела запроса потоково, каждым батчем программ — отдельная транзакция.
+    При ошибке в строке уже загруженные батчи остаются в БД.
+    """
+    totals = {"programs": 0, "workouts": 0, "exercises": 0}
+    batcher = catalog_io.NDJSONBatcher()
 
-    if difficulty:
-        query = query.filter(models.WorkoutProgram.difficulty == difficulty)
-    if goal:
-        query = query.filter(models.WorkoutProgram.goal == goal)
-    if location:
-        query = query.filter(models.WorkoutProgram.location == location)
+    async def load(batches):
+        for batch in batches:
+            for key, value in (await db.run(catalog_io.import_batch, batch, keep_ids)).items():
+                totals[key] += value
 
-    programs = query.all()
-    return programs
+    try:
+        async for chunk in request.stream():
+            await load(batcher.feed(chunk))
+        await load(batcher.close())
+    except catalog_io.CatalogFormatError as e:
+        raise HTTPException(status_code=400, detail=f"{e}; imported before error: {totals}")
+    finally:
+        if totals["programs"]:
+            await sync_catalog_revisions(db)
+    return totals
 
 @app.put("/programs/{program_id}", response_model=schemas.WorkoutProgram)
-def update_program(program_id: int, program_data: schemas.WorkoutProgramUpdate, db: Session = Depends(get_db)):
+async def update_program(program_id: int, program_data: schemas.WorkoutProgramUpdate, db: AsyncDB = Depends(get_async_db)):
     """
     Обновляет данные программы (название, описание, параметры).
     """
-    # Находим программу
-    db_program = db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id == program_id).first()
+    db_program = await db.run(crud.update_program, program_id, program_data)
     if not db_program:
         raise HTTPException(status_code=404, detail="Программа не найдена")
 
-    # Обновляем поля
-    db_program.name = program_data.name
-    if program_data.description is not None:
-        db_program.description = program_data.description
-    db_program.difficulty = program_data.difficulty
-    db_program.goal = program_data.goal
-    db_program.location = program_data.location
-
-    db.commit()
-    db.refresh(db_program)
+    await sync_catalog_revisions(db)
     return db_program
 
 
 @app.delete("/programs/{program_id}")
-def delete_program(program_id: int, db: Session = Depends(get_db)):
+async def delete_program(program_id: int, db: AsyncDB = Depends(get_async_db)):
     """
     Удаляет программу.
     """
-    db_program = db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id == program_id).first()
-    if not db_program:
-        raise HTTPException(status_code=404, detail="Программа не найдена")
-
     # Проверка: если в Workout есть ссылка на program_id, удаление программы может вызвать ошибку Foreign Key,
     # если не настроен CASCADE.
     # Мы предполагаем, что cascade настроен, либо удаляем вручную.
 
     try:
-        db.delete(db_program)
-        db.commit()
+        deleted = await db.run(crud.delete_program, program_id)
     except Exception as e:
-        db.rollback()
         raise HTTPException(
             status_code=400, 
             detail="Невозможно удалить программу, так как есть связанные записи. Удалите дни или настройте cascade."
         )
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Программа не найдена")
 
+    await sync_catalog_revisions(db)
     return {"message": "Программа успешно удалена"}
 
 @app.get("/programs/{program_id}", response_model=schemas.WorkoutProgram)
-def get_program(program_id: int, db: Session = Depends(get_db)):
-    program = db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id == program_id).first()
-    if not program:
-        raise HTTPException(status_code=404, detail="Program not found")
-    return program
+async def get_program(program_id: int, request: Request, db: AsyncDB = Depends(get_async_db)):
+    def load(session):
+        program = crud.get_program_document(session, program_id)
+        if not program:
+            raise HTTPException(status_code=404, detail="Program not found")
+        return program
+
+    key = ("program", program_id, catalog_cache.program_revision(program_id))
+    return await cached_json(request, db, key, catalog_cache.program_etag(program_id), load)
 
 
 @app.post("/programs", response_model=schemas.WorkoutProgram)
-def create_program(program: schemas.WorkoutProgramCreate, db: Session = Depends(get_db)):
-    new_program = models.WorkoutProgram(**program.dict())
-    db.add(new_program)
-    db.commit()
-    db.refresh(new_program)
+async def create_program(program: schemas.WorkoutProgramCreate, db: AsyncDB = Depends(get_async_db)):
+    new_program = await db.run(crud.create_program, program)
+    await sync_catalog_revisions(db)
+    return new_program
+
+
+@app.post("/programs/full", response_model=schemas.WorkoutProgram)
+async def create_program_full(program: schemas.WorkoutProgramFullCreate, db: AsyncDB = Depends(get_async_db)):
+    """
+    Создает программу вместе со всеми днями и упражнениями одной транзакцией.
+    """
+    new_program = await db.run(crud.create_program_full, program)
+    await sync_catalog_revisions(db)
     return new_program
 
 
 @app.get("/programs/{program_id}/workouts", response_model=List[schemas.Workout])
-def get_program_workouts(program_id: int, db: Session = Depends(get_db)):
-    program = db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id == program_id).first()
-    if not program:
-        raise HTTPException(status_code=404, detail="Program not found")
-    return program.workouts
+async def get_program_workouts(program_id: int, request: Request, db: AsyncDB = Depends(get_async_db)):
+    def load(session):
+        if not crud.program_exists(session, program_id):
+            raise HTTPException(status_code=404, detail="Program not found")
+        return crud.get_program_workout_documents(session, program_id)
+
+    key = ("program_workouts", program_id, catalog_cache.program_revision(program_id))
+    return await cached_json(request, db, key, catalog_cache.program_etag(program_id), load)
 
 @app.get("/workouts/single/{workout_id}", response_model=schemas.Workout)
-def get_single_workout(workout_id: int, db: Session = Depends(get_db)):
+async def get_single_workout(workout_id: int, request: Request, db: AsyncDB = Depends(get_async_db)):
     """
     Получает одну тренировку по её ID для админки.
     """
-    workout = db.query(models.Workout).filter(models.Workout.id == workout_id).first()
+    program_id = catalog_cache.workout_program(workout_id)
+    if program_id is not None:
+        etag = catalog_cache.program_etag(program_id)
+        matched = etag_matches(request, etag)
+        if matched:
+            return not_modified(matched)
+        cached = catalog_cache.get(("workout", workout_id, catalog_cache.program_revision(program_id)))
+        if cached is not None:
+            return json_response(request, cached, etag)
+
+    catalog_revision = catalog_cache.catalog_revision()
+    workout = await db.run(crud.get_workout_document, workout_id)
     if not workout:
         raise HTTPException(status_code=404, detail="Тренировка не найдена")
-    return workout
+    program_id, cached = workout["program_id"], CachedBody(orjson.dumps(workout), encoded={})
+    etag = catalog_cache.program_etag(program_id)
+    # Если каталог изменился во время загрузки, результат не кэшируем
+    if catalog_revision == catalog_cache.catalog_revision():
+        catalog_cache.remember_workout(workout_id, program_id)
+        catalog_cache.set(("workout", workout_id, catalog_cache.program_revision(program_id)), cached)
+    else:
+        etag = None
+    return json_response(request, cached, etag)
 
 @app.get("/workouts/{program_id}", response_model=List[schemas.Workout])
-def get_workouts_by_program(program_id: int, db: Session = Depends(get_db)):
+async def get_workouts_by_program(program_id: int, request: Request, db: AsyncDB = Depends(get_async_db)):
     # Явно ищем все записи, где program_id совпадает с аргументом
-    workouts = db.query(models.Workout).filter(models.Workout.program_id == program_id).all()
-    return workouts
+    key = ("workouts", program_id, catalog_cache.program_revision(program_id))
+    return await cached_json(
+        request, db, key, catalog_cache.program_etag(program_id),
+        lambda session: crud.get_program_workout_documents(session, program_id),
+    )
 
 @app.post("/workouts", response_model=schemas.Workout)
-def create_workout(workout: schemas.WorkoutCreate, db: Session = Depends(get_db)):
+async def create_workout(workout: schemas.WorkoutCreate, db: AsyncDB = Depends(get_async_db)):
     """
     Создает новый день в программе.
     """
     # Проверка существования программы
-    program = db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id == workout.program_id).first()
-    if not program:
+    if not await db.run(crud.program_exists, workout.program_id):
         raise HTTPException(status_code=404, detail="Программа не найдена")
 
-    new_workout = models.Workout(
-        program_id=workout.program_id,
-        day_number=workout.day_number,
-        title=workout.title,
-        description=workout.description
-    )
-    db.add(new_workout)
-    db.commit()
-    db.refresh(new_workout)
+    new_workout = await db.run(crud.create_workout, workout)
+    await sync_catalog_revisions(db)
     return new_workout
 
+@app.post("/workouts/bulk", response_model=List[schemas.Workout])
+async def create_workouts_bulk(workouts: List[schemas.WorkoutCreate], db: AsyncDB = Depends(get_async_db)):
+    """
+    Создает несколько дней за один запрос и одну транзакцию.
+    """
+    program_ids = {workout.program_id for workout in workouts}
+    missing = program_ids - await db.run(crud.get_existing_program_ids, program_ids)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Программы не найдены: {sorted(missing)}")
+    if not workouts:
+        return []
+
+    new_workouts = await db.run(crud.create_workouts_bulk, workouts)
+    await sync_catalog_revisions(db)
+    return new_workouts
+
 @app.delete("/workouts/{workout_id}")
-def delete_workout(workout_id: int, db: Session = Depends(get_db)):
-    workout = db.query(models.Workout).filter(models.Workout.id == workout_id).first()
-    if not workout:
-        raise HTTPException(status_code=404, detail="Тренировка не найдена")
-    
+async def delete_workout(workout_id: int, db: AsyncDB = Depends(get_async_db)):
     # Удаление (упражнения удалятся каскадно автоматически)
-    db.delete(workout)
-    db.commit()
+    program_id = await db.run(crud.delete_workout, workout_id)
+    if program_id is None:
+        raise HTTPException(status_code=404, detail="Тренировка не найдена")
+
+    await sync_catalog_revisions(db)
     return {"message": "Тренировка успешно удалена"}
 
 
 @app.get("/workouts/{workout_id}/exercises", response_model=List[schemas.Exercise])
-def get_workout_exercises(workout_id: int, db: Session = Depends(get_db)):
-    workout = db.query(models.Workout).filter(models.Workout.id == workout_id).first()
+async def get_workout_exercises(workout_id: int, db: AsyncDB = Depends(get_async_db)):
+    workout = await db.run(crud.get_workout, workout_id)
     if not workout:
         raise HTTPException(status_code=404, detail="Workout not found")
     return workout.exercises
 
 
 @app.post("/progress", response_model=schemas.UserProgress)
-def create_progress(progress: schemas.UserProgressCreate, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == progress.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    program = db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id == progress.program_id).first()
-    if not program:
-        raise HTTPException(status_code=404, detail="Program not found")
-
-    workout = db.query(models.Workout).filter(models.Workout.id == progress.workout_id).first()
-    if not workout:
-        raise HTTPException(status_code=404, detail="Workout not found")
-
-    new_progress = models.UserProgress(**progress.dict())
-    db.add(new_progress)
-    db.commit()
-    db.refresh(new_progress)
-    return new_progress
+async def upsert_progress(progress: schemas.UserProgressCreate, db: AsyncDB = Depends(get_async_db)):
+    """
+    Создает запись прогресса дня или обновляет существующую (одна запись на пользователя и день).
+    """
+    # Отложенные отметки пользователя должны попасть в БД раньше этой записи
+    await progress_writer.wait_for_user(progress.user_id)
+    try:
+        saved = await db.run(crud.upsert_progress, progress)
+    except IntegrityError:
+        raise HTTPException(status_code=404, detail="User, program or workout not found")
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Workout not found in this program")
+    return saved
 
 @app.post("/exercises", response_model=schemas.Exercise)
-def create_exercise(exercise: schemas.ExerciseCreate, db: Session = Depends(get_db)):
+async def create_exercise(exercise: schemas.ExerciseCreate, db: AsyncDB = Depends(get_async_db)):
     """
     Создает новое упражнение.
     """
     # Проверка существования тренировки
-    workout = db.query(models.Workout).filter(models.Workout.id == exercise.workout_id).first()
-    if not workout:
+    program_id = await db.run(crud.get_workout_program_id, exercise.workout_id)
+    if program_id is None:
         raise HTTPException(status_code=404, detail="Тренировка не найдена")
 
-    new_exercise = models.Exercise(
-        workout_id=exercise.workout_id,
-        name=exercise.name,
-        sets=exercise.sets,
-        reps=exercise.reps,
-        rest_time=exercise.rest_time,
-        description=exercise.description
-    )
-    db.add(new_exercise)
-    db.commit()
-    db.refresh(new_exercise)
+    new_exercise = await db.run(crud.create_exercise, exercise)
+    await sync_catalog_revisions(db)
     return new_exercise
 
+@app.post("/exercises/bulk", response_model=List[schemas.Exercise])
+async def create_exercises_bulk(exercises: List[schemas.ExerciseCreate], db: AsyncDB = Depends(get_async_db)):
+    """
+    Создает несколько упражнений за один запрос и одну транзакцию.
+    """
+    workout_ids = {exercise.workout_id for exercise in exercises}
+    workout_programs = await db.run(crud.get_workout_program_ids, workout_ids)
+    missing = workout_ids - workout_programs.keys()
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Тренировки не найдены: {sorted(missing)}")
+    if not exercises:
+        return []
+
+    new_exercises = await db.run(crud.create_exercises_bulk, exercises)
+    await sync_catalog_revisions(db)
+    return new_exercises
+
 @app.put("/exercises/{exercise_id}", response_model=schemas.Exercise)
-def update_exercise(exercise_id: int, exercise: schemas.ExerciseCreate, db: Session = Depends(get_db)):
+async def update_exercise(exercise_id: int, exercise: schemas.ExerciseCreate, db: AsyncDB = Depends(get_async_db)):
     """
     Обновляет существующее упражнение.
     """
-    db_exercise = db.query(models.Exercise).filter(models.Exercise.id == exercise_id).first()
-    if not db_exercise:
+    updated = await db.run(crud.update_exercise, exercise_id, exercise)
+    if not updated:
         raise HTTPException(status_code=404, detail="Упражнение не найдено")
 
-    # Обновляем поля
-    db_exercise.name = exercise.name
-    db_exercise.sets = exercise.sets
-    db_exercise.reps = exercise.reps
-    db_exercise.rest_time = exercise.rest_time
-    db_exercise.description = exercise.description
-
-    db.commit()
-    db.refresh(db_exercise)
+    db_exercise, _ = updated
+    await sync_catalog_revisions(db)
     return db_exercise
 
 @app.delete("/exercises/{exercise_id}")
-def delete_exercise(exercise_id: int, db: Session = Depends(get_db)):
-    exercise = db.query(models.Exercise).filter(models.Exercise.id == exercise_id).first()
-    if not exercise:
+async def delete_exercise(exercise_id: int, db: AsyncDB = Depends(get_async_db)):
+    program_id = await db.run(crud.delete_exercise, exercise_id)
+    if program_id is None:
         raise HTTPException(status_code=404, detail="Упражнение не найдено")
-    
-    db.delete(exercise)
-    db.commit()
+
+    await sync_catalog_revisions(db)
     return {"message": "Упражнение успешно удалено"}
 
-@app.patch("/progress/{progress_id}/complete")
-def complete_workout(progress_id: int,  status: schemas.CompletionStatus, db: Session = Depends(get_db)):
-    progress = db.query(models.UserProgress).filter(models.UserProgress.id == progress_id).first()
-    if not progress:
-        raise HTTPException(status_code=404, detail="Progress not found")
+@app.patch("/progress/{progress_id}/complete", response_model=schemas.UserProgress)
+async def complete_workout(progress_id: int,  status: schemas.CompletionStatus, db: AsyncDB = Depends(get_async_db)):
+    if progress_writer.running:
+        # Write-behind: запись проверяется сразу, а изменение коммитится батчем в фоне
+        progress = await db.run(crud.get_progress_row, progress_id)
+        if not progress:
+            raise HTTPException(status_code=404, detail="Progress not found")
+        event = progress_writer.submit(progress_id, progress.user_id, status.is_completed)
+        return progress.model_copy(update={"is_completed": event.is_completed, "completed_at": event.completed_at})
 
     # Обновляем статус на то, что пришло с фронтенда
-    progress.is_completed = status.is_completed
-    
-    # Если ставим True - записываем время, если False - убираем
-    if status.is_completed:
-        progress.completed_at = datetime.utcnow()
-    else:
-        progress.completed_at = None
-    db.commit()
-    db.refresh(progress)
+    progress = await db.run(crud.update_progress_completion, progress_id, status.is_completed)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Progress not found")
     return progress
 
 
+@app.get("/users/{user_id}/programs/{program_id}/progress", response_model=schemas.ProgramProgress)
+async def get_user_program_progress(
+    user_id: int,
+    program_id: int,
+    since: Optional[int] = Query(None, description="Cursor from the previous response: return only days changed after it"),
+    db: AsyncDB = Depends(get_async_db),
+):
+    """
+    Прогресс по одной программе для трекера: id выполненных дней и счётчики.
+    Для неизвестного пользователя возвращается пустой прогресс.
+    """
+    await progress_writer.wait_for_user(user_id)
+    return await db.run(crud.get_user_program_progress, user_id, program_id, since)
+
+
+@app.get("/users/{user_id}/programs/{program_id}/stats", response_model=schemas.ProgramStats)
+async def get_user_program_stats(user_id: int, program_id: int, db: AsyncDB = Depends(get_async_db)):
+    """
+    Сводка по программе: выполнено дней из общего числа, текущая и лучшая серия, последняя тренировка.
+    """
+    await progress_writer.wait_for_user(user_id)
+    stats = await db.run(crud.get_program_stats, user_id, program_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Program not found")
+    return stats
+
+
 @app.get("/users/{user_id}/progress", response_model=List[schemas.UserProgress])
-def get_user_progress(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_progress(user_id: int, db: AsyncDB = Depends(get_async_db)):
+    user = await db.run(crud.get_user, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    progress = db.query(models.UserProgress).filter(models.UserProgress.user_id == user_id).all()
-    return progress
+    await progress_writer.wait_for_user(user_id)
+    return ORJSONResponse(await db.run(crud.get_user_progress_documents, user_id))
+
+
+async def cached_part(key, load) -> Optional[bytes]:
+    """
+    JSON фрагмента каталога из кэша или из собственной сессии: фрагменты
+    /bootstrap загружаются параллельно. None — load ничего не нашел.
+    """
+    cached = catalog_cache.get(key)
+    if cached is None:
+        rows = await run_in_session(load)
+        if rows is None:
+            return None
+        # Ключ общий с /workouts/{program_id}: сжатые варианты должны копиться в той же записи
+        cached = CachedBody(orjson.dumps(rows), encoded={})
+        catalog_cache.set(key, cached)
+    return cached.body
+
+
+# Части /bootstrap, не уложившиеся в ответ: их не отменяют (работа в пуле потоков
+# все равно не прервется), а дают доделать в фоне и отбрасывают результат
+_abandoned_parts: Set[asyncio.Task] = set()
+
+
+def _forget_part(task: asyncio.Task):
+    _abandoned_parts.discard(task)
+    if not task.cancelled():
+        task.exception()  # ошибка уже не нужна ответу — не пишем "exception was never retrieved"
+
+
+def abandon_part(task: asyncio.Task):
+    if task.done():
+        _forget_part(task)
+        return
+    _abandoned_parts.add(task)
+    task.add_done_callback(_forget_part)
+
+
+async def program_progress_part(user_id: int, program_id: int) -> bytes:
+    await progress_writer.wait_for_user(user_id)
+    progress = await run_in_session(crud.get_user_program_progress, user_id, program_id)
+    return progress.model_dump_json().encode()
+
+
+@app.get("/bootstrap", response_model=schemas.Bootstrap)
+async def bootstrap(
+    telegram_id: str = Query(..., description="Telegram user id; the user is created on first launch"),
+    program_id: Optional[int] = Query(None, description="Current program; defaults to the last one the user trained in"),
+):
+    """
+    Стартовые данные мини-приложения одним запросом: пользователь, краткая
+    карточка программы, дни по порядку и прогресс. Части загружаются
+    параллельно в отдельных сессиях, каталог — из кэша. Если прогресс не
+    успел за BOOTSTRAP_BUDGET_MS, он возвращается как null и указывается в partial.
+    """
+    started = time.perf_counter()
+    tasks = {}
+
+    def load_program(program_id: int):
+        revision = catalog_cache.program_revision(program_id)
+        tasks["program"] = asyncio.create_task(cached_part(
+            ("program_summary", program_id, revision),
+            lambda session: crud.get_program_summary_document(session, program_id),
+        ))
+        tasks["workouts"] = asyncio.create_task(cached_part(
+            ("workouts", program_id, revision),
+            lambda session: crud.get_program_workout_documents(session, program_id),
+        ))
+
+    # Программа известна заранее — каталог грузится, пока определяется пользователь
+    if program_id is not None:
+        load_program(program_id)
+    try:
+        user = user_cache.get(telegram_id)
+        if user is None:
+            user = remember_user(await run_in_session(crud.get_or_create_user, telegram_id))
+        if program_id is None:
+            program_id = await run_in_session(crud.get_active_program_id, user.id)
+            if program_id is not None:
+                load_program(program_id)
+
+        parts = {"program": b"null", "workouts": b"[]", "progress": b"null"}
+        partial = []
+        if program_id is not None:
+            progress_task = asyncio.create_task(program_progress_part(user.id, program_id))
+            tasks["progress"] = progress_task
+            program, workouts = await asyncio.gather(asyncio.shield(tasks["program"]), asyncio.shield(tasks["workouts"]))
+            if program is None:
+                raise HTTPException(status_code=404, detail="Program not found")
+            parts.update(program=program, workouts=workouts)
+
+            remaining = BOOTSTRAP_BUDGET_MS / 1000 - (time.perf_counter() - started)
+            try:
+                parts["progress"] = await asyncio.wait_for(asyncio.shield(progress_task), max(remaining, 0))
+            except asyncio.TimeoutError:
+                partial.append("progress")
+    finally:
+        for task in tasks.values():
+            abandon_part(task)
+
+    body = b"".join([
+        b'{"user":', user.model_dump_json().encode(),
+        b',"program":', parts["program"],
+        b',"workouts":', parts["workouts"],
+        b',"progress":', parts["progress"],
+        b',"partial":', json.dumps(partial).encode(),
+        b"}",
+    ])
+    return Response(content=body, media_type="application/json")
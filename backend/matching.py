@@ -0,0 +1,110 @@
+"""
+Подбор программы по ответам онбординга (difficulty, goal, location).
+
+Индекс строится в памяти одним запросом к БД: для каждого значения фасета
+хранится битсет (целое число Python) позиций программ. Подбор — несколько
+AND/OR над битсетами: сначала программы, совпавшие по всем фасетам, затем по
+подмножествам фасетов в порядке убывания веса. Перебираются только нужные
+limit позиций, поэтому время ответа не зависит от размера каталога.
+
+Индекс привязан к ревизии каталога из cache.catalog_cache и перестраивается
+при первом подборе после любого изменения каталога. Каталог загружается без
+блокировки: в режиме DB_ASYNC запрос уступает event loop, и поток loop не
+должен ждать на threading.Lock. Под блокировкой только подменяется готовый
+индекс; параллельные перестроения одной ревизии дают одинаковый результат.
+"""
+import json
+import threading
+from itertools import combinations
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import orjson
+from sqlalchemy.orm import Session
+
+import crud
+
+# Вес совпадения по фасету: цель важнее уровня, уровень важнее места
+FACET_WEIGHTS = {"goal": 3, "difficulty": 2, "location": 1}
+
+
+def normalize(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip().lower()
+    return value or None
+
+
+class FacetIndex(NamedTuple):
+    revision: int
+    # Позиция -> готовый JSON краткой карточки программы
+    programs: List[bytes]
+    facets: Dict[Tuple[str, str], int]
+
+
+class ProgramMatcher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Optional[FacetIndex] = None
+
+    def is_fresh(self, revision: int) -> bool:
+        index = self._index
+        return index is not None and index.revision == revision
+
+    def rebuild(self, db: Session, revision: int) -> FacetIndex:
+        """Загружает каталог и строит индекс; revision нужно взять до загрузки."""
+        index = self._index
+        if index is not None and index.revision == revision:
+            return index
+        summaries = sorted(crud.get_program_summary_documents(db), key=lambda program: program["id"])
+        programs, facets = [], {}
+        for position, program in enumerate(summaries):
+            programs.append(orjson.dumps(program))
+            for facet in FACET_WEIGHTS:
+                key = (facet, normalize(program[facet]))
+                facets[key] = facets.get(key, 0) | (1 << position)
+        index = FacetIndex(revision, programs, facets)
+        with self._lock:
+            # Перестроение по более старой ревизии могло закончиться позже — его не ставим
+            if self._index is None or self._index.revision <= revision:
+                self._index = index
+        return index
+
+    def match(self, criteria: Dict[str, Optional[str]], limit: int) -> bytes:
+        """JSON-массив совпадений [{"program", "score", "matched"}], лучшие первыми."""
+        index = self._index
+        requested = {
+            facet: index.facets.get((facet, value), 0)
+            for facet, value in ((facet, normalize(criteria.get(facet))) for facet in FACET_WEIGHTS)
+            if value is not None
+        }
+        everything = (1 << len(index.programs)) - 1
+
+        # Подмножества запрошенных фасетов от самого "тяжелого"; программы без
+        # единого совпадения не предлагаются, если хоть что-то запрошено
+        subsets = [
+            subset
+            for size in range(len(requested), 0, -1)
+            for subset in combinations(requested, size)
+        ] or [()]
+        subsets.sort(key=lambda subset: -sum(FACET_WEIGHTS[facet] for facet in subset))
+        max_score = sum(FACET_WEIGHTS[facet] for facet in requested)
+
+        results = []
+        for subset in subsets:
+            bits = everything
+            for facet, facet_bits in requested.items():
+                bits &= facet_bits if facet in subset else ~facet_bits
+            score = round(sum(FACET_WEIGHTS[facet] for facet in subset) / max_score, 4) if max_score else 1.0
+            while bits and len(results) < limit:
+                lowest = bits & -bits
+                bits ^= lowest
+                results.append(b"".join([
+                    b'{"program":', index.programs[lowest.bit_length() - 1],
+                    b',"score":', json.dumps(score).encode(),
+                    b',"matched":', json.dumps(list(subset)).encode(),
+                    b"}",
+                ]))
+            if len(results) >= limit:
+                break
+        return b"[" + b",".join(results) + b"]"
+
+
+program_matcher = ProgramMatcher()
@@ -0,0 +1,411 @@
+"""
+Метрики запросов: время ответа, SQL и ожидание соединения по маршрутам.
+
+MetricsMiddleware заводит на каждый HTTP-запрос RequestTimings в contextvar;
+слушатели движка (instrument_engine) добавляют туда число и время SQL-запросов,
+а пул соединений — время получения соединения. Контекст копируется в пул
+потоков и в задачи asyncio.gather, поэтому запросы crud из run_in_threadpool и
+run_in_session учитываются в запросе, который их вызвал; фоновые задачи
+(отложенная запись, аналитика) ни к какому запросу не относятся.
+
+Итог по запросу:
+  - заголовок Server-Timing (SERVER_TIMING=1): app — время до начала ответа,
+    db — время SQL и число запросов, pool — ожидание соединения;
+  - накопленные по маршрутам гистограммы и счетчики в формате Prometheus
+    (GET /metrics).
+Маршрут — шаблон пути (/programs/{program_id}), как и в payload_stats.
+
+Те же слушатели ведут журнал медленных запросов (slow_queries): SQL дольше
+SLOW_QUERY_MS попадает в лог и в кольцевой буфер (GET /metrics/slow-queries)
+вместе с маршрутом, типами параметров (без значений) и планом EXPLAIN QUERY
+PLAN / EXPLAIN — для SELECT, план одного текста запроса считается один раз.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from compression import route_name
+
+REQUEST_METRICS = os.getenv("REQUEST_METRICS", "1").lower() in ("1", "true", "yes")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1").lower() in ("1", "true", "yes")
+# Границы гистограммы времени ответа, секунды
+LATENCY_BUCKETS = tuple(
+    float(value) for value in os.getenv("METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5").split(",")
+)
+# Границы гистограммы числа SQL-запросов на HTTP-запрос: рост хвоста — признак N+1
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Порог журнала медленных запросов, мс; 0 — выключен
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1").lower() in ("1", "true", "yes")
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    """Счетчики одного HTTP-запроса; пополняются из потоков пула, поэтому под блокировкой."""
+
+    __slots__ = ("scope", "sql_count", "sql_seconds", "pool_wait_seconds", "_lock")
+
+    def __init__(self, scope=None):
+        # Маршрут появляется в scope только после роутинга, поэтому храним сам scope
+        self.scope = scope
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def route(self) -> Optional[str]:
+        return route_name(self.scope) if self.scope is not None else None
+
+    def add_statement(self, seconds: float):
+        with self._lock:
+            self.sql_count += 1
+            self.sql_seconds += seconds
+
+    def add_pool_wait(self, seconds: float):
+        with self._lock:
+            self.pool_wait_seconds += seconds
+
+    def server_timing(self, app_seconds: float) -> str:
+        return (
+            f'app;dur={app_seconds * 1000:.3f}, '
+            f'db;dur={self.sql_seconds * 1000:.3f};desc="queries: {self.sql_count}", '
+            f'pool;dur={self.pool_wait_seconds * 1000:.3f}'
+        )
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, dict]:
+    """Server-Timing -> {имя: {"dur": мс, "desc": строка}}; для клиентов и нагрузочных прогонов."""
+    metrics = {}
+    for item in (header or "").split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        if not name:
+            continue
+        entry = metrics[name] = {}
+        for param in params:
+            key, _, value = param.partition("=")
+            value = value.strip('"')
+            entry[key] = float(value) if key == "dur" else value
+    return metrics
+
+
+def parameters_shape(parameters, executemany: bool = False):
+    """Типы параметров без значений: {"id": "int"}, ["str", "NoneType"]; для executemany — число строк и первая."""
+    if executemany:
+        rows = list(parameters or ())
+        return {"rows": len(rows), "first": parameters_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+# EXPLAIN без ANALYZE сам запрос не выполняет, поэтому безопасен и для UPDATE/DELETE
+EXPLAIN_PREFIXES = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+
+class SlowQueryLog:
+    """Последние запросы дольше threshold_ms: SQL, типы параметров, маршрут и план."""
+
+    PLAN_CACHE_SIZE = 256
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, size: int = SLOW_QUERY_LOG_SIZE, explain: bool = SLOW_QUERY_EXPLAIN):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=size)
+        self._plans: Dict[Tuple[str, str], List[str]] = {}
+
+    def record(self, conn, cursor, statement: str, parameters, executemany: bool, seconds: float, route: Optional[str]):
+        plan = None
+        if self.explain and not executemany and statement.split(None, 1)[0].upper() in EXPLAINABLE:
+            plan = self._plan(conn, statement, parameters)
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "duration_ms": round(seconds * 1000, 3),
+            "route": route,
+            "statement": statement,
+            "parameters": parameters_shape(parameters, executemany),
+            "plan": plan,
+        }
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning(
+            "Slow query %.1f ms (%s): %s | plan: %s",
+            entry["duration_ms"], route or "no request", " ".join(statement.split()), "; ".join(plan or ()) or "-",
+        )
+
+    def _plan(self, conn, statement: str, parameters) -> Optional[List[str]]:
+        dialect = conn.dialect.name
+        prefix = EXPLAIN_PREFIXES.get(dialect)
+        if prefix is None:
+            return None
+        key = (dialect, statement)
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+        # Сырой курсор того же соединения: в той же транзакции и мимо событий движка
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception as e:
+            return [f"EXPLAIN failed: {e}"]
+        finally:
+            cursor.close()
+        # SQLite: (id, parent, notused, detail); PostgreSQL: одна колонка с текстом
+        plan = [str(row[-1]) for row in rows]
+        if len(self._plans) >= self.PLAN_CACHE_SIZE:
+            self._plans.clear()
+        self._plans[key] = plan
+        return plan
+
+    def entries(self) -> List[dict]:
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._plans.clear()
+
+
+slow_queries = SlowQueryLog()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    timings = _current.get()
+    if timings is not None:
+        timings.add_statement(seconds)
+    threshold_ms = slow_queries.threshold_ms
+    if threshold_ms > 0 and seconds * 1000 >= threshold_ms:
+        route = timings.route if timings is not None else None
+        slow_queries.record(conn, cursor, statement, parameters, executemany, seconds, route)
+
+
+_timed_pool_classes: Dict[type, type] = {}
+
+
+def _timed_pool_class(pool_class: type) -> type:
+    """Подкласс пула, который засекает получение соединения (_do_get: очередь или новое соединение)."""
+    timed = _timed_pool_classes.get(pool_class)
+    if timed is None:
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return pool_class._do_get(self)
+            finally:
+                timings = _current.get()
+                if timings is not None:
+                    timings.add_pool_wait(time.perf_counter() - started)
+
+        timed = _timed_pool_classes[pool_class] = type(f"Timed{pool_class.__name__}", (pool_class,), {"_do_get": _do_get})
+    return timed
+
+
+def instrument_engine(target_engine):
+    """Подключает учет SQL и ожидания пула к движку (для AsyncEngine — к его sync_engine)."""
+    if event.contains(target_engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(target_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target_engine, "after_cursor_execute", _after_cursor_execute)
+    pool = target_engine.pool
+    if pool.__class__ not in _timed_pool_classes.values():
+        # recreate() при dispose() создает пул того же класса, так что подмена переживает его
+        pool.__class__ = _timed_pool_class(pool.__class__)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        result, running = [], 0
+        for bound, count in zip(self.bounds, self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+class RouteMetrics:
+    __slots__ = ("latency", "sql_count", "sql_seconds", "pool_wait_seconds", "response_bytes", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.sql_count = Histogram(SQL_COUNT_BUCKETS)
+        self.sql_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.response_bytes = 0
+        self.statuses: Dict[int, int] = {}
+
+
+class RequestMetrics:
+    """Метрики запросов по (метод, маршрут) и вывод в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self.in_progress = 0
+
+    def record(self, method: str, route: str, status: int, seconds: float, timings: RequestTimings, response_bytes: int):
+        with self._lock:
+            entry = self._routes.get((method, route))
+            if entry is None:
+                entry = self._routes[(method, route)] = RouteMetrics()
+            entry.latency.observe(seconds)
+            entry.sql_count.observe(timings.sql_count)
+            entry.sql_seconds += timings.sql_seconds
+            entry.pool_wait_seconds += timings.pool_wait_seconds
+            entry.response_bytes += response_bytes
+            entry.statuses[status] = entry.statuses.get(status, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                "# HELP http_requests_in_progress HTTP requests being handled.",
+                "# TYPE http_requests_in_progress gauge",
+                f"http_requests_in_progress {self.in_progress}",
+            ]
+            lines += _family("http_requests_total", "counter", "HTTP responses by status.", [
+                (_labels(method, route, status=str(status)), count)
+                for (method, route), entry in routes for status, count in sorted(entry.statuses.items())
+            ])
+            lines += _histogram("http_request_duration_seconds", "Time to the last response byte.", [
+                (method, route, entry.latency) for (method, route), entry in routes
+            ])
+            lines += _histogram("http_request_sql_statements", "SQL statements per request.", [
+                (method, route, entry.sql_count) for (method, route), entry in routes
+            ])
+            for name, attribute, help_text in (
+                ("http_request_sql_seconds_total", "sql_seconds", "Time spent in SQL statements."),
+                ("http_request_pool_wait_seconds_total", "pool_wait_seconds", "Time spent acquiring a pool connection."),
+                ("http_response_bytes_total", "response_bytes", "Response body bytes sent (after compression)."),
+            ):
+                lines += _family(name, "counter", help_text, [
+                    (_labels(method, route), getattr(entry, attribute)) for (method, route), entry in routes
+                ])
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(method: str, route: str, **extra) -> str:
+    pairs = [("method", method), ("route", route), *extra.items()]
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _family(name: str, kind: str, help_text: str, samples) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{labels} {_number(value)}" for labels, value in samples]
+    return lines
+
+
+def _histogram(name: str, help_text: str, series) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for method, route, histogram in series:
+        for bound, count in histogram.cumulative():
+            lines.append(f"{name}_bucket{_labels(method, route, le=_number(float(bound)))} {count}")
+        lines.append(f"{name}_bucket{_labels(method, route, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(method, route)} {_number(histogram.total)}")
+        lines.append(f"{name}_count{_labels(method, route)} {histogram.count}")
+    return lines
+
+
+request_metrics = RequestMetrics()
+
+
+class MetricsMiddleware:
+    """ASGI middleware: RequestTimings на запрос, Server-Timing и запись в request_metrics."""
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.metrics = metrics
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(scope)
+        token = _current.set(timings)
+        started = time.perf_counter()
+        status = 500
+        response_bytes = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", timings.server_timing(time.perf_counter() - started)
+                    )
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        self.metrics.in_progress += 1
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            self.metrics.in_progress -= 1
+            _current.reset(token)
+            self.metrics.record(
+                scope["method"], route_name(scope), status, time.perf_counter() - started, timings, response_bytes,
+            )
@@ -1,80 +1,69 @@
 """
-Скрипт для обновления структуры базы данных с добавлением CASCADE удаления.
-Запустите этот скрипт один раз для применения изменений к существующей базе данных.
+Миграции схемы БД (см. migrations.py).
+
+    python migrate_db.py                  # применить недостающие миграции
+    python migrate_db.py status           # какие миграции применены
+    python migrate_db.py --batch-size 2000
+
+Работает с базой из DATABASE_URL. Выполняется до запуска приложения: само
+приложение схему не меняет и не стартует, пока миграции не применены.
+Перед миграцией существующей базы SQLite рядом с ней сохраняется резервная
+копия (--no-backup — без нее). Копия снимается через backup API SQLite,
+поэтому приложение может продолжать работу.
 """
+import argparse
+import logging
 import sqlite3
-import shutil
+import sys
 from datetime import datetime
 
-# Путь к базе данных
-DB_PATH = "./workout_app.db"
-
-def backup_database():
-    """Создает резервную копию базы данных"""
-    backup_path = f"./workout_app_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-    shutil.copy2(DB_PATH, backup_path)
-    print(f"[OK] Создана резервная копия: {backup_path}")
-    return backup_path
-
-def migrate_database():
-    """Обновляет структуру базы данных для поддержки CASCADE удаления"""
+from sqlalchemy import inspect
 
-    print("Начало миграции базы данных...")
+from database import engine
+import migrations
 
-    # Создаем резервную копию
-    backup_path = backup_database()
 
+def backup_sqlite(path: str) -> str:
+    backup_path = f"{path.rsplit('.', 1)[0]}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+    source, target = sqlite3.connect(path), sqlite3.connect(backup_path)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # SQLite не поддерживает изменение внешних ключей напрямую
-        # Поэтому нужно пересоздать таблицу user_progress
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return backup_path
 
-        print("Пересоздание таблицы user_progress...")
 
-        # 1. Создаем временную таблицу с новой структурой
-        cursor.execute("""
-            CREATE TABLE user_progress_new (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                program_id INTEGER NOT NULL,
-                workout_id INTEGER NOT NULL,
-                is_completed BOOLEAN DEFAULT 0,
-                completed_at DATETIME,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY (program_id) REFERENCES workout_programs(id) ON DELETE CASCADE,
-                FOREIGN KEY (workout_id) REFERENCES workouts(id) ON DELETE CASCADE
-            )
-        """)
+def status_command(args):
+    applied = migrations.applied_versions(engine)
+    for migration in migrations.MIGRATIONS:
+        state = "applied" if migration.version in applied else "pending"
+        print(f"{migration.version:>4}  {migration.name:<20} {state}")
 
-        # 2. Копируем данные из старой таблицы
-        cursor.execute("""
-            INSERT INTO user_progress_new (id, user_id, program_id, workout_id, is_completed, completed_at)
-            SELECT id, user_id, program_id, workout_id, is_completed, completed_at
-            FROM user_progress
-        """)
 
-        # 3. Удаляем старую таблицу
-        cursor.execute("DROP TABLE user_progress")
+def upgrade_command(args):
+    if not migrations.pending(engine):
+        print(f"Schema is up to date (version {migrations.HEAD})", file=sys.stderr)
+        return
+    path = engine.url.database
+    if engine.dialect.name == "sqlite" and not args.no_backup and path and path != ":memory:" \
+            and inspect(engine).get_table_names():
+        print(f"Backup: {backup_sqlite(path)}", file=sys.stderr)
+    for migration in migrations.upgrade(engine, args.batch_size):
+        print(f"[OK] {migration.version} {migration.name}", file=sys.stderr)
 
-        # 4. Переименовываем новую таблицу
-        cursor.execute("ALTER TABLE user_progress_new RENAME TO user_progress")
 
-        # Сохраняем изменения
-        conn.commit()
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=("upgrade", "status"), default="upgrade")
+    parser.add_argument("--batch-size", type=int, default=migrations.MIGRATION_BATCH_SIZE,
+                        help="Rows per transaction when copying tables")
+    parser.add_argument("--no-backup", action="store_true", help="Do not back up the SQLite database first")
+    args = parser.parse_args()
 
-        print("[OK] Миграция успешно завершена!")
-        print("[OK] Теперь можно удалять тренировки и программы без ошибок")
-        print(f"[OK] Резервная копия сохранена: {backup_path}")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    {"upgrade": upgrade_command, "status": status_command}[args.command](args)
 
-    except Exception as e:
-        print(f"[ERROR] Ошибка при миграции: {e}")
-        print(f"Восстановите базу данных из резервной копии: {backup_path}")
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
-    migrate_database()
+    main()
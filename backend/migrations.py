@@ -0,0 +1,430 @@
+"""
+Версионные миграции схемы БД.
+
+Примененные миграции записываются в schema_migrations (models.SchemaMigration),
+по строке на версию. Миграции выполняются отдельным явным шагом
+(python migrate_db.py) до запуска воркеров; в Docker это делает CMD.
+Приложение при старте только проверяет версию (ensure_current) и не
+запускается на устаревшей схеме, поэтому воркеры не мигрируют одну базу
+наперегонки.
+
+Пустая база создается сразу в актуальном виде (create_all) и помечается всеми
+версиями. База без schema_migrations — ее создали прежние версии приложения
+через create_all при импорте — проходит все миграции по порядку, и каждая
+сначала проверяет, нужна ли она.
+
+Пересборка таблицы (rebuild_table; SQLite не умеет менять внешние ключи)
+копирует строки порциями по MIGRATION_BATCH_SIZE, каждую в своей короткой
+транзакции. Изменения, которые приложение делает во время копирования,
+переносят триггеры. Блокировка записи держится только на время порции и
+финальной подмены таблицы, а в WAL-режиме чтение не блокируется вовсе.
+В PostgreSQL те же изменения делаются на месте через ALTER TABLE.
+"""
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from sqlalchemy import exists, insert, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import crud
+import models
+from database import Base
+
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Engine, int], None]
+
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+
+def _is_sqlite(engine: Engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+# --- Пересборка таблицы SQLite ---
+
+def _copy_batch(engine: Engine, source: str, target: str, columns: str, values: str, where: str, after_id, batch_size: int):
+    """Копирует следующую порцию строк по id; возвращает (верхний id порции или None для последней, скопировано)."""
+    with engine.begin() as conn:
+        upper = conn.exec_driver_sql(
+            f"SELECT id FROM {source} WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?", (after_id, batch_size - 1)
+        ).scalar()
+        bound, params = ("id > ? AND id <= ?", (after_id, upper)) if upper is not None else ("id > ?", (after_id,))
+        # OR IGNORE: строку, уже перенесенную триггером, не перезаписываем более старой версией
+        copied = conn.exec_driver_sql(
+            f"INSERT OR IGNORE INTO {target} ({columns}) SELECT {values} FROM {source} WHERE {bound} AND {where}",
+            params,
+        ).rowcount
+    return upper, copied
+
+
+def rebuild_table(engine: Engine, table, batch_size: int, fill: Optional[Dict[str, str]] = None) -> int:
+    """
+    Пересоздает таблицу SQLite по описанию из models.py, сохраняя строки; возвращает число перенесенных строк.
+
+    fill — SQL-выражения для колонок, которых нет в старой таблице; {row} в них —
+    префикс колонок исходной строки. Строки с удаленными родителями (до ON DELETE
+    CASCADE они оставались) не переносятся. Уникальные индексы не создаются:
+    их строят миграции, которые сначала убирают дубли.
+    """
+    fill = fill or {}
+    name, rebuilt = table.name, f"{table.name}__rebuild"
+    with engine.connect() as conn:
+        old_columns = {column["name"] for column in inspect(conn).get_columns(name)}
+    columns = [column.name for column in table.c if column.name in old_columns or column.name in fill]
+
+    def values(row: str) -> str:
+        return ", ".join(f"{row}{column}" if column in old_columns else fill[column].format(row=row) for column in columns)
+
+    column_list = ", ".join(columns)
+    parents = " AND ".join(
+        f"{fk.parent.name} IN (SELECT {fk.column.name} FROM {fk.column.table.name})" for fk in table.foreign_keys
+    ) or "1"
+    ddl = str(CreateTable(table).compile(dialect=engine.dialect)).replace(
+        f"CREATE TABLE {name} (", f"CREATE TABLE {rebuilt} (", 1
+    )
+    triggers = {
+        f"{rebuilt}_ai": f"AFTER INSERT ON {name} BEGIN "
+                         f"INSERT OR REPLACE INTO {rebuilt} ({column_list}) VALUES ({values('new.')}); END",
+        f"{rebuilt}_au": f"AFTER UPDATE ON {name} BEGIN "
+                         f"INSERT OR REPLACE INTO {rebuilt} ({column_list}) VALUES ({values('new.')}); END",
+        f"{rebuilt}_ad": f"AFTER DELETE ON {name} BEGIN DELETE FROM {rebuilt} WHERE id = old.id; END",
+    }
+
+    with engine.connect() as conn:
+        # pysqlite сам не открывает транзакцию для DDL
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        for trigger in triggers:
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+        # Остаток прерванной пересборки
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {rebuilt}")
+        conn.exec_driver_sql(ddl)
+        for trigger, body in triggers.items():
+            conn.exec_driver_sql(f"CREATE TRIGGER {trigger} {body}")
+        conn.commit()
+
+    after_id, copied = -1, 0
+    while after_id is not None:
+        after_id, batch = _copy_batch(engine, name, rebuilt, column_list, values(""), parents, after_id, batch_size)
+        copied += batch
+        logger.info("%s: copied %d rows", name, copied)
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        for trigger in triggers:
+            conn.exec_driver_sql(f"DROP TRIGGER {trigger}")
+        conn.exec_driver_sql(f"DROP TABLE {name}")
+        conn.exec_driver_sql(f"ALTER TABLE {rebuilt} RENAME TO {name}")
+        for index in table.indexes:
+            if not index.unique:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+        conn.commit()
+    return copied
+
+
+# --- Миграции ---
+
+def create_missing_tables(engine: Engine, batch_size: int):
+    # То, что раньше делал create_all при импорте main.py: недостающие таблицы с их индексами
+    Base.metadata.create_all(bind=engine)
+
+
+def _alter_user_progress(engine: Engine, batch_size: int):
+    """
+    То же для PostgreSQL: он умеет менять колонки и внешние ключи на месте.
+    updated_at заполняется порциями по batch_size строк, каждая в своей транзакции.
+    revision добавляется здесь же, как и при пересборке в SQLite: на нее
+    ссылается индекс, который строит миграция indexes.
+    """
+    table = models.UserProgress.__table__
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+        foreign_keys = inspector.get_foreign_keys(table.name)
+
+    if "revision" not in columns:
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ALTER TABLE user_progress ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+    updated_at = columns.get("updated_at")
+    if updated_at is None or updated_at["nullable"]:
+        if updated_at is None:
+            with engine.begin() as conn:
+                conn.exec_driver_sql("ALTER TABLE user_progress ADD COLUMN updated_at TIMESTAMP WITHOUT TIME ZONE")
+        filled, now = 0, datetime.utcnow()
+        while True:
+            with engine.begin() as conn:
+                batch = conn.execute(text(
+                    "UPDATE user_progress SET updated_at = COALESCE(completed_at, :now) "
+                    "WHERE id IN (SELECT id FROM user_progress WHERE updated_at IS NULL LIMIT :limit)"
+                ), {"now": now, "limit": batch_size}).rowcount
+            if not batch:
+                break
+            filled += batch
+            logger.info("user_progress: updated_at filled for %d rows", filled)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ALTER TABLE user_progress ALTER COLUMN updated_at SET NOT NULL")
+
+    with engine.begin() as conn:
+        for fk in foreign_keys:
+            if (fk["options"].get("ondelete") or "").upper() == "CASCADE":
+                continue
+            conn.exec_driver_sql(
+                f"ALTER TABLE user_progress DROP CONSTRAINT {fk['name']}, "
+                f"ADD CONSTRAINT {fk['name']} FOREIGN KEY ({', '.join(fk['constrained_columns'])}) "
+                f"REFERENCES {fk['referred_table']} ({', '.join(fk['referred_columns'])}) ON DELETE CASCADE"
+            )
+
+
+def rebuild_user_progress(engine: Engine, batch_size: int):
+    """user_progress с ON DELETE CASCADE и updated_at (раньше — migrate_db.py cascade и progress_updated_at)."""
+    if not _is_sqlite(engine):
+        _alter_user_progress(engine, batch_size)
+        return
+    table = models.UserProgress.__table__
+    with engine.connect() as conn:
+        columns = {column["name"] for column in inspect(conn).get_columns(table.name)}
+        foreign_keys = inspect(conn).get_foreign_keys(table.name)
+    cascades = len(foreign_keys) == len(table.foreign_keys) and all(
+        (fk["options"].get("ondelete") or "").upper() == "CASCADE" for fk in foreign_keys
+    )
+    if "updated_at" in columns and cascades:
+        return
+    copied = rebuild_table(engine, table, batch_size, fill={
+        # Тот же формат, в котором SQLAlchemy хранит DateTime в SQLite
+        "updated_at": "COALESCE({row}completed_at, strftime('%Y-%m-%d %H:%M:%f000', 'now'))",
+    })
+    logger.info("user_progress rebuilt, %d rows", copied)
+
+
+def dedup_progress(engine: Engine, batch_size: int):
+    """
+    Схлопывает дубли (user_id, workout_id) в user_progress и создает уникальный индекс.
+
+    Список дублей читается без блокировки записи, затем группы схлопываются
+    порциями по batch_size в порядке id оставляемой записи, каждая порция в
+    своей короткой транзакции.
+    """
+    index = next(index for index in models.UserProgress.__table__.indexes if index.name == "uq_user_progress_user_workout")
+    with engine.connect() as conn:
+        if index.name in {existing["name"] for existing in inspect(conn).get_indexes("user_progress")}:
+            return
+        groups = conn.exec_driver_sql("""
+            SELECT user_id, workout_id FROM user_progress
+            GROUP BY user_id, workout_id
+            HAVING COUNT(*) > 1
+            ORDER BY MIN(id)
+        """).all()
+
+    group = "user_id = :user_id AND workout_id = :workout_id"
+    # Остается запись с наименьшим id; день выполнен, если выполнен хоть в одном дубле
+    merge = text(f"""
+        UPDATE user_progress SET
+            -- MAX по boolean в PostgreSQL нет
+            is_completed = (SELECT MAX(CASE WHEN is_completed THEN 1 ELSE 0 END) = 1 FROM user_progress WHERE {group}),
+            completed_at = (SELECT MIN(CASE WHEN is_completed THEN completed_at END) FROM user_progress WHERE {group}),
+            updated_at = (SELECT MAX(updated_at) FROM user_progress WHERE {group})
+        WHERE id = (SELECT MIN(id) FROM user_progress WHERE {group})
+    """)
+    prune = text(f"DELETE FROM user_progress WHERE {group} AND id > (SELECT MIN(id) FROM user_progress WHERE {group})")
+    removed = 0
+    for start in range(0, len(groups), batch_size):
+        batch = [{"user_id": user_id, "workout_id": workout_id} for user_id, workout_id in groups[start:start + batch_size]]
+        with engine.begin() as conn:
+            conn.execute(merge, batch)
+            removed += conn.execute(prune, batch).rowcount
+        logger.info("user_progress: %d duplicate groups merged", start + len(batch))
+
+    with engine.begin() as conn:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+    logger.info("user_progress duplicates removed: %d", removed)
+
+
+def create_program_search(engine: Engine, batch_size: int):
+    """FTS5-индекс по названиям программ с заполнением по существующим данным."""
+    if not _is_sqlite(engine):
+        return
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        created = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'workout_programs_fts'"
+        ).first() is None
+        for statement in models._program_search_ddl:
+            conn.exec_driver_sql(statement)
+        if created:
+            conn.exec_driver_sql("INSERT INTO workout_programs_fts(workout_programs_fts) VALUES ('rebuild')")
+        conn.commit()
+
+
+def create_indexes(engine: Engine, batch_size: int):
+    """
+    Индексы из models.py, которых еще нет в базе, и статистика для планировщика.
+    Индекс по колонке, которую добавляет более поздняя миграция, создаст она сама.
+    """
+    with engine.connect() as conn:
+        if _is_sqlite(engine):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        inspector = inspect(conn)
+        # Заменен покрывающим ix_user_progress_user_program_updated
+        conn.exec_driver_sql("DROP INDEX IF EXISTS ix_user_progress_user_program")
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for index in table.indexes:
+                if all(column.name in existing for column in index.columns):
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+        conn.commit()
+        conn.exec_driver_sql("ANALYZE")
+        conn.commit()
+
+
+def backfill_program_stats(engine: Engine, batch_size: int):
+    """user_program_stats для пар (пользователь, программа) с прогрессом, но без сводки — порциями."""
+    progress, stats = models.UserProgress, models.UserProgramStats
+    with Session(engine) as db:
+        pairs = db.execute(
+            select(progress.user_id, progress.program_id).distinct().where(
+                ~exists().where(stats.user_id == progress.user_id, stats.program_id == progress.program_id)
+            )
+        ).all()
+        for start in range(0, len(pairs), batch_size):
+            crud.refresh_program_stats(db, pairs[start:start + batch_size])
+            db.commit()
+    logger.info("user_program_stats backfilled for %d pairs", len(pairs))
+
+
+def add_progress_revisions(engine: Engine, batch_size: int):
+    """Ревизии прогресса (курсор вместо updated_at) и покрывающий индекс user_progress с ними."""
+    columns = {
+        models.UserProgress.__tablename__: ("revision",),
+        models.UserProgramStats.__tablename__: ("revision", "reset_revision"),
+    }
+    index = next(
+        index for index in models.UserProgress.__table__.indexes
+        if index.name == "ix_user_progress_user_program_updated"
+    )
+    with engine.connect() as conn:
+        if _is_sqlite(engine):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        inspector = inspect(conn)
+        for table, names in columns.items():
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            for name in names:
+                if name not in existing:
+                    # Строки до миграции получают ревизию 0 — их вернет любой полный запрос
+                    conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0")
+        indexed = {
+            existing["name"]: existing["column_names"] for existing in inspector.get_indexes(models.UserProgress.__tablename__)
+        }
+        if indexed.get(index.name) != [column.name for column in index.columns]:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+            conn.execute(CreateIndex(index))
+        conn.commit()
+
+
+def create_job_leases(engine: Engine, batch_size: int):
+    """Аренды периодических задач (плановое обновление аналитики в одном воркере)."""
+    Base.metadata.create_all(bind=engine, tables=[models.JobLease.__table__])
+
+
+def create_catalog_revisions(engine: Engine, batch_size: int):
+    """Ревизии каталога в БД: по ним воркеры сверяют кэш и ETag (cache.py)."""
+    Base.metadata.create_all(bind=engine, tables=[models.CatalogRevision.__table__])
+
+
+def create_progress_cascade_indexes(engine: Engine, batch_size: int):
+    """Индексы прогресса и его сводки по дню и программе для каскадного удаления дней и программ."""
+    names = {"ix_user_progress_workout", "ix_user_progress_program", "ix_user_program_stats_program"}
+    with engine.begin() as conn:
+        for table in (models.UserProgress.__table__, models.UserProgramStats.__table__):
+            for index in table.indexes:
+                if index.name in names:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+MIGRATIONS = [
+    Migration(1, "baseline", create_missing_tables),
+    Migration(2, "progress_rebuild", rebuild_user_progress),
+    Migration(3, "progress_dedup", dedup_progress),
+    Migration(4, "program_search", create_program_search),
+    Migration(5, "indexes", create_indexes),
+    Migration(6, "progress_stats", backfill_program_stats),
+    Migration(7, "progress_revisions", add_progress_revisions),
+    Migration(8, "job_leases", create_job_leases),
+    Migration(9, "catalog_revisions", create_catalog_revisions),
+    Migration(10, "progress_cascade_indexes", create_progress_cascade_indexes),
+]
+
+HEAD = MIGRATIONS[-1].version
+
+
+# --- Применение ---
+
+def applied_versions(engine: Engine) -> Set[int]:
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(models.SchemaMigration.__tablename__):
+            return set()
+        return set(conn.scalars(select(models.SchemaMigration.version)))
+
+
+def pending(engine: Engine) -> List[Migration]:
+    applied = applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def _record(engine: Engine, migrations: List[Migration], duration_ms: float = 0.0):
+    with engine.begin() as conn:
+        conn.execute(insert(models.SchemaMigration.__table__), [
+            {
+                "version": migration.version, "name": migration.name,
+                "applied_at": datetime.utcnow(), "duration_ms": round(duration_ms, 3),
+            }
+            for migration in migrations
+        ])
+
+
+def create_schema(engine: Engine):
+    """Создает схему в пустой базе сразу в актуальном виде и помечает все миграции примененными."""
+    Base.metadata.create_all(bind=engine)
+    _record(engine, MIGRATIONS)
+
+
+def upgrade(engine: Engine, batch_size: int = MIGRATION_BATCH_SIZE) -> List[Migration]:
+    """Применяет недостающие миграции по порядку; возвращает примененные."""
+    with engine.connect() as conn:
+        empty = not inspect(conn).get_table_names()
+    if empty:
+        create_schema(engine)
+        logger.info("Created schema at version %d", HEAD)
+        return list(MIGRATIONS)
+
+    applied = []
+    for migration in pending(engine):
+        logger.info("Applying migration %d %s", migration.version, migration.name)
+        started = time.perf_counter()
+        migration.apply(engine, batch_size)
+        _record(engine, [migration], (time.perf_counter() - started) * 1000)
+        applied.append(migration)
+    return applied
+
+
+def ensure_current(engine: Engine):
+    """Проверка при старте приложения: схема должна быть на последней версии."""
+    missing = pending(engine)
+    if missing:
+        names = ", ".join(f"{migration.version} {migration.name}" for migration in missing)
+        raise SchemaOutdated(f"Database schema is missing migrations: {names}. Run: python migrate_db.py")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, Boolean, Float, Text, DDL, Index, event, column, table
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -27,6 +27,41 @@ class WorkoutProgram(Base):
     workouts = relationship("Workout", back_populates="program", cascade="all, delete-orphan")
     user_progress = relationship("UserProgress", back_populates="program", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Фильтр подбора программы в онбординге и каталоге
+        Index("ix_workout_programs_filters", "difficulty", "goal", "location"),
+    )
+
+
+# Полнотекстовый индекс по названиям программ (SQLite FTS5, триграммы —
+# поиск по подстроке без учёта регистра, в том числе для кириллицы).
+# Таблица внешнего содержимого синхронизируется триггерами.
+program_search = table("workout_programs_fts", column("rowid"), column("name"))
+
+_program_search_ddl = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS workout_programs_fts USING fts5(
+        name, content='workout_programs', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS workout_programs_fts_ai AFTER INSERT ON workout_programs BEGIN
+        INSERT INTO workout_programs_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS workout_programs_fts_ad AFTER DELETE ON workout_programs BEGIN
+        INSERT INTO workout_programs_fts(workout_programs_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS workout_programs_fts_au AFTER UPDATE OF name ON workout_programs BEGIN
+        INSERT INTO workout_programs_fts(workout_programs_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO workout_programs_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+]
+
+for _statement in _program_search_ddl:
+    event.listen(WorkoutProgram.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(
+    WorkoutProgram.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS workout_programs_fts").execute_if(dialect="sqlite"),
+)
+
 
 class Workout(Base):
     __tablename__ = "workouts"
@@ -41,12 +76,16 @@ class Workout(Base):
     exercises = relationship("Exercise", back_populates="workout", cascade="all, delete-orphan")
     user_progress = relationship("UserProgress", back_populates="workout", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_workouts_program_day", "program_id", "day_number"),
+    )
+
 
 class Exercise(Base):
     __tablename__ = "exercises"
 
     id = Column(Integer, primary_key=True, index=True)
-    workout_id = Column(Integer, ForeignKey("workouts.id"), nullable=False)
+    workout_id = Column(Integer, ForeignKey("workouts.id"), nullable=False, index=True)
     name = Column(String, nullable=False)
     sets = Column(Integer, nullable=False)
     reps = Column(String, nullable=False)
@@ -65,7 +104,116 @@ class UserProgress(Base):
     workout_id = Column(Integer, ForeignKey("workouts.id", ondelete="CASCADE"), nullable=False)
     is_completed = Column(Boolean, default=False)
     completed_at = Column(DateTime, nullable=True)
+    # Время последнего изменения записи
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Ревизия пары (user_id, program_id), в которой запись менялась последней, —
+    # курсор для выборки "изменения с" (см. UserProgramStats.revision)
+    revision = Column(Integer, nullable=False, server_default="0")
 
     user = relationship("User", back_populates="progress")
     program = relationship("WorkoutProgram", back_populates="user_progress")
     workout = relationship("Workout", back_populates="user_progress")
+
+    __table_args__ = (
+        # Покрывает выборку по user_id, по паре (user_id, program_id) и
+        # прогресс программы целиком, без обращения к самой таблице
+        Index(
+            "ix_user_progress_user_program_updated",
+            "user_id", "program_id", "updated_at", "workout_id", "is_completed", "revision",
+        ),
+        # Одна запись на день пользователя: цель для INSERT ... ON CONFLICT
+        Index("uq_user_progress_user_workout", "user_id", "workout_id", unique=True),
+        # Каскадное удаление дня или программы и поиск затронутых пользователей без полного скана
+        Index("ix_user_progress_workout", "workout_id"),
+        Index("ix_user_progress_program", "program_id"),
+    )
+
+
+class UserProgramStats(Base):
+    """
+    Сводка прогресса пользователя по программе. Пересчитывается в той же
+    транзакции, что и изменение user_progress этой пары, поэтому чтение
+    статистики — поиск одной строки по первичному ключу.
+    """
+    __tablename__ = "user_program_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    program_id = Column(Integer, ForeignKey("workout_programs.id", ondelete="CASCADE"), primary_key=True)
+    completed_days = Column(Integer, nullable=False, default=0)
+    # Серия подряд идущих дат (UTC) с тренировками, заканчивающаяся last_completed_at
+    streak_days = Column(Integer, nullable=False, default=0)
+    longest_streak = Column(Integer, nullable=False, default=0)
+    last_completed_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Счетчик изменений прогресса пары: растет в порядке коммитов, в отличие от
+    # времени, которое пишущий запрос берет до получения блокировки
+    revision = Column(Integer, nullable=False, server_default="0")
+    # Ревизия последнего удаления записей пары: курсор старше нее получает полное состояние
+    reset_revision = Column(Integer, nullable=False, server_default="0")
+
+    __table_args__ = (
+        # Каскадное удаление программы: первичный ключ начинается с user_id
+        Index("ix_user_program_stats_program", "program_id"),
+    )
+
+
+# Сводные таблицы аналитики админки. Полностью пересобираются analytics.refresh_analytics
+# по расписанию; дашборд читает только их, не затрагивая user_progress.
+
+class AnalyticsProgramSummary(Base):
+    __tablename__ = "analytics_program_summary"
+
+    program_id = Column(Integer, primary_key=True)
+    total_days = Column(Integer, nullable=False)
+    users_started = Column(Integer, nullable=False)
+    users_completed = Column(Integer, nullable=False)
+    completed_workouts = Column(Integer, nullable=False)
+    refreshed_at = Column(DateTime, nullable=False)
+
+
+class AnalyticsDayFunnel(Base):
+    __tablename__ = "analytics_day_funnel"
+
+    program_id = Column(Integer, primary_key=True)
+    workout_id = Column(Integer, primary_key=True)
+    day_number = Column(Integer, nullable=False)
+    completed_users = Column(Integer, nullable=False)
+
+
+class AnalyticsDailyActive(Base):
+    __tablename__ = "analytics_daily_active"
+
+    day = Column(Date, primary_key=True)
+    active_users = Column(Integer, nullable=False)
+    completions = Column(Integer, nullable=False)
+
+
+class JobLease(Base):
+    """Аренда периодической задачи: ее выполняет только владелец, пока не истек срок."""
+    __tablename__ = "job_leases"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class CatalogRevision(Base):
+    """
+    Ревизии каталога в БД (cache.catalog_cache сверяет с ними кэш и ETag).
+    scope 0 — каталог целиком, иначе id программы; программа получает
+    ревизию каталога, при которой она изменилась в последний раз.
+    """
+    __tablename__ = "catalog_revisions"
+
+    scope = Column(Integer, primary_key=True)
+    revision = Column(Integer, nullable=False, index=True)
+
+
+class SchemaMigration(Base):
+    """Примененные миграции схемы (migrations.py)."""
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, nullable=False)
+    duration_ms = Column(Float, nullable=False, default=0)
@@ -0,0 +1,183 @@
+"""
+Профилирование отдельного запроса по требованию (cProfile).
+
+Включается переменной PROFILING_TOKEN; без нее middleware не подключается и
+накладных расходов нет. Запрос с заголовком X-Profile-Token: <токен>
+выполняется под cProfile, ответ получает заголовок X-Profile-Id, а результат
+хранится в памяти (последние PROFILE_KEEP):
+  GET /profiles                  — список профилей
+  GET /profiles/{id}             — файл .prof для pstats/snakeviz
+  GET /profiles/{id}?format=text — функции по cumulative time
+Эти эндпоинты требуют тот же заголовок.
+
+cProfile видит только свой поток. Функции crud, которые AsyncDB.run выполняет
+в пуле потоков, профилируются отдельно (call_profiled) и сливаются в общий
+результат. В профиль потока event loop попадают и запросы, которые идут
+одновременно с профилируемым, поэтому профилировать лучше в спокойный момент.
+Одновременно профилируется один запрос, остальные с заголовком выполняются
+как обычно.
+"""
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+# Запросы к самим профилям не профилируются
+PROFILES_PATH = "/profiles"
+
+
+def is_authorized(value: Optional[str], token: str = PROFILING_TOKEN) -> bool:
+    return bool(token) and value is not None and hmac.compare_digest(value.encode(), token.encode())
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.created_at = datetime.utcnow()
+        self.status: Optional[int] = None
+        self.duration_ms: Optional[float] = None
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add(self, profile: cProfile.Profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def stats(self, stream=None) -> pstats.Stats:
+        with self._lock:
+            first, *rest = self._profiles
+            stats = pstats.Stats(first, stream=stream)
+            for profile in rest:
+                stats.add(profile)
+        return stats
+
+    def dump(self) -> bytes:
+        # Тот же формат, что пишет pstats.Stats.dump_stats
+        return marshal.dumps(self.stats().stats)
+
+    def text(self, limit: int = 60) -> str:
+        stream = io.StringIO()
+        self.stats(stream=stream).sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "threads": len(self._profiles),
+            "created_at": self.created_at.isoformat(),
+        }
+
+
+class ProfileStore:
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+
+    def add(self, request_profile: RequestProfile):
+        with self._lock:
+            self._profiles[request_profile.id] = request_profile
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [request_profile.summary() for request_profile in reversed(profiles)]
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+profile_store = ProfileStore()
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def call_profiled(fn, *args, **kwargs):
+    """Вызывает fn; внутри профилируемого запроса — под отдельным cProfile этого потока."""
+    request_profile = _current.get()
+    if request_profile is None:
+        return fn(*args, **kwargs)
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:  # в потоке уже работает другой профилировщик
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.disable()
+        request_profile.add(profile)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: запрос с верным X-Profile-Token выполняется под cProfile."""
+
+    def __init__(self, app, token: str = PROFILING_TOKEN, store: ProfileStore = profile_store):
+        self.app = app
+        self.token = token
+        self.store = store
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self._busy
+            or scope["path"].startswith(PROFILES_PATH)
+            or not is_authorized(Headers(scope=scope).get("x-profile-token"), self.token)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request_profile = RequestProfile(scope["method"], scope["path"])
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # в потоке event loop уже работает другой профилировщик
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                request_profile.status = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", request_profile.id)
+            await send(message)
+
+        self._busy = True
+        token = _current.set(request_profile)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.disable()
+            _current.reset(token)
+            self._busy = False
+            request_profile.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            request_profile.add(profile)
+            self.store.add(request_profile)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 
 class ExerciseBase(BaseModel):
@@ -72,6 +72,53 @@ class WorkoutProgram(WorkoutProgramBase):
         from_attributes = True
 
 
+class WorkoutProgramSummary(WorkoutProgramBase):
+    id: int
+    days_count: int = 0
+    exercises_count: int = 0
+    total_sets: int = 0
+
+    class Config:
+        from_attributes = True
+
+
+class ProgramMatch(BaseModel):
+    program: WorkoutProgramSummary
+    # Доля веса совпавших фасетов: 1.0 — совпало все запрошенное
+    score: float
+    matched: List[str]
+
+
+class WorkoutWithExercisesCreate(BaseModel):
+    day_number: int
+    title: str
+    description: Optional[str] = None
+    exercises: List[ExerciseBase] = []
+
+
+class WorkoutProgramFullCreate(WorkoutProgramBase):
+    """Программа целиком: дни и упражнения создаются одной транзакцией."""
+    workouts: List[WorkoutWithExercisesCreate] = []
+
+
+class ExerciseDocument(ExerciseBase):
+    id: Optional[int] = None
+
+
+class WorkoutDocument(BaseModel):
+    id: Optional[int] = None
+    day_number: int
+    title: str
+    description: Optional[str] = None
+    exercises: List[ExerciseDocument] = []
+
+
+class WorkoutProgramDocument(WorkoutProgramBase):
+    """Строка NDJSON при экспорте/импорте каталога; id необязательны."""
+    id: Optional[int] = None
+    workouts: List[WorkoutDocument] = []
+
+
 class UserBase(BaseModel):
     telegram_id: str
 
@@ -96,7 +143,8 @@ class UserProgressBase(BaseModel):
 
 
 class UserProgressCreate(UserProgressBase):
-    pass
+    # None — не менять отметку существующей записи (новая создается невыполненной)
+    is_completed: Optional[bool] = None
 
 class CompletionStatus(BaseModel):
     is_completed: bool
@@ -108,3 +156,79 @@ class UserProgress(UserProgressBase):
 
     class Config:
         from_attributes = True
+
+
+class ProgramProgress(BaseModel):
+    """
+    Компактный прогресс пользователя по одной программе. Без since списки
+    полные, с since — только дни, изменившиеся после курсора. full=True —
+    списки полные и заменяют известное клиенту состояние, а не дополняют его.
+    """
+    program_id: int
+    completed_workout_ids: List[int]
+    uncompleted_workout_ids: List[int]
+    completed_count: int
+    total_workouts: int
+    cursor: Optional[int] = None
+    full: bool = True
+
+
+class ProgramStats(BaseModel):
+    user_id: int
+    program_id: int
+    completed_days: int
+    total_days: int
+    current_streak: int
+    longest_streak: int
+    last_completed_at: Optional[datetime] = None
+
+
+class ProgramAnalytics(BaseModel):
+    program_id: int
+    name: str
+    total_days: int
+    users_started: int
+    users_completed: int
+    completed_workouts: int
+    completion_rate: float
+
+
+class DayFunnelStep(BaseModel):
+    day_number: int
+    workout_id: int
+    completed_users: int
+    # Доля от начавших программу
+    rate: float
+
+
+class DailyActive(BaseModel):
+    day: date
+    active_users: int
+    completions: int
+
+
+class AnalyticsReport(BaseModel):
+    refreshed_at: Optional[datetime] = None
+    programs: List[ProgramAnalytics]
+
+
+class ProgramFunnel(BaseModel):
+    refreshed_at: Optional[datetime] = None
+    program_id: int
+    users_started: int
+    days: List[DayFunnelStep]
+
+
+class DailyActiveReport(BaseModel):
+    refreshed_at: Optional[datetime] = None
+    days: List[DailyActive]
+
+
+class Bootstrap(BaseModel):
+    """Все, что нужно мини-приложению для первого экрана, одним ответом."""
+    user: User
+    program: Optional[WorkoutProgramSummary] = None
+    workouts: List[Workout] = []
+    progress: Optional[ProgramProgress] = None
+    # Части, не уложившиеся в бюджет времени; клиент догружает их отдельно
+    partial: List[str] = []
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import analytics
+import models
+
+
+@pytest.fixture
+def usage(db, make_catalog):
+    """Три пользователя в программе из трех дней: один прошел всё, один — первый день, один только начал."""
+    program, untouched = make_catalog(programs=2, days=3)
+    users = [models.User(telegram_id=str(n)) for n in range(3)]
+    db.add_all(users)
+    db.flush()
+
+    now = datetime.utcnow()
+    rows = [(users[0], w, True, now - timedelta(days=2 - i)) for i, w in enumerate(program.workouts)]
+    rows += [(users[1], program.workouts[0], True, now), (users[2], program.workouts[0], False, None)]
+    db.add_all([
+        models.UserProgress(
+            user_id=user.id, program_id=program.id, workout_id=workout.id,
+            is_completed=is_completed, completed_at=completed_at,
+        )
+        for user, workout, is_completed, completed_at in rows
+    ])
+    db.commit()
+    return program, untouched
+
+
+def test_refresh_aggregates_progress(db, usage):
+    program, untouched = usage
+    analytics.refresh_analytics(db)
+
+    report = {p.program_id: p for p in analytics.get_program_report(db).programs}
+    stats = report[program.id]
+    assert (stats.total_days, stats.users_started, stats.users_completed, stats.completed_workouts) == (3, 3, 1, 4)
+    assert stats.completion_rate == pytest.approx(1 / 3, abs=1e-4)
+    assert (report[untouched.id].users_started, report[untouched.id].completion_rate) == (0, 0.0)
+
+    funnel = analytics.get_program_funnel(db, program.id)
+    assert [(d.day_number, d.completed_users) for d in funnel.days] == [(1, 2), (2, 1), (3, 1)]
+
+    daily = analytics.get_daily_active(db, 7).days
+    assert [(d.active_users, d.completions) for d in daily] == [(1, 1), (1, 1), (2, 2)]
+
+
+def test_dashboard_reads_only_summary_tables(client, usage, count_statements):
+    program, _ = usage
+    assert client.get("/analytics/programs").json()["programs"] == []
+    assert client.post("/analytics/refresh").status_code == 403
+    assert client.post("/analytics/refresh", headers={"X-Analytics-Token": "wrong"}).status_code == 403
+    assert client.post("/analytics/refresh", headers={"X-Analytics-Token": "test-analytics-token"}).status_code == 200
+
+    before = count_statements.count
+    client.get("/analytics/programs")
+    client.get(f"/analytics/programs/{program.id}/funnel")
+    client.get("/analytics/daily-active", params={"days": 7})
+    statements = count_statements.statements[before:]
+    assert statements
+    assert not any("user_progress" in statement for statement in statements)
+
+    assert client.get(f"/analytics/programs/{program.id}/funnel").json()["users_started"] == 3
+    assert client.get("/analytics/programs/999/funnel").status_code == 404
+
+
+def test_refresh_reads_before_taking_the_write_lock(db, usage, count_statements):
+    before = count_statements.count
+    analytics.refresh_analytics(db)
+    statements = [statement.split(None, 1)[0].upper() for statement in count_statements.statements[before:]]
+    # Полные агрегаты — до первой записи; под блокировкой только DELETE и INSERT готовых строк
+    first_write = next(i for i, verb in enumerate(statements) if verb != "SELECT")
+    assert statements[:first_write] == ["SELECT"] * 3
+    assert set(statements[first_write:]) == {"DELETE", "INSERT"}
+
+
+def test_refresh_lease_has_one_owner(db):
+    assert analytics.claim_lease(db, "job", "worker-1", ttl=60)
+    assert not analytics.claim_lease(db, "job", "worker-2", ttl=60)
+    assert analytics.claim_lease(db, "job", "worker-1", ttl=60)  # владелец продлевает
+
+    # Владелец пропал: по истечении срока аренду забирает другой
+    db.query(models.JobLease).filter_by(name="job").update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert analytics.claim_lease(db, "job", "worker-2", ttl=60)
+    assert not analytics.claim_lease(db, "job", "worker-1", ttl=60)
+
+
+def test_periodic_refresh_runs_only_in_lease_owner(db, usage):
+    import asyncio
+
+    leader, follower = analytics.AnalyticsRefresher(interval=60), analytics.AnalyticsRefresher(interval=60)
+
+    async def scenario():
+        return await leader.refresh_if_leader(), await follower.refresh_if_leader()
+
+    refreshed, skipped = asyncio.run(scenario())
+    assert refreshed is not None and skipped is None
+    assert db.query(models.AnalyticsProgramSummary).count() == 2
@@ -0,0 +1,51 @@
+import pytest
+
+from database import to_async_url
+
+
+def test_to_async_url():
+    assert to_async_url("sqlite:///./data/workout_app.db") == "sqlite+aiosqlite:///./data/workout_app.db"
+    assert to_async_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert to_async_url("postgres://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+
+
+@pytest.mark.parametrize("mode", ["client", "async_client"])
+def test_api_flow_in_both_db_modes(request, mode):
+    client = request.getfixturevalue(mode)
+
+    program = client.post("/programs", json={
+        "difficulty": "beginner", "goal": "weight_loss", "location": "home", "name": "Async",
+    }).json()
+    assert program["workouts"] == []
+
+    workout = client.post("/workouts", json={"program_id": program["id"], "day_number": 1, "title": "День 1"}).json()
+    assert workout["exercises"] == []
+
+    exercise = client.post("/exercises", json={
+        "workout_id": workout["id"], "name": "Присед", "sets": 3, "reps": "12", "rest_time": 60,
+    }).json()
+    updated = client.put(f"/exercises/{exercise['id']}", json={
+        "workout_id": workout["id"], "name": "Присед", "sets": 4, "reps": "12", "rest_time": 60,
+    })
+    assert updated.json()["sets"] == 4
+
+    tree = client.get(f"/programs/{program['id']}").json()
+    assert tree["workouts"][0]["exercises"][0]["sets"] == 4
+    assert client.get(f"/workouts/single/{workout['id']}").json()["title"] == "День 1"
+    assert client.get("/programs/summary").json()[0]["total_sets"] == 4
+
+    user = client.post("/users", json={"telegram_id": "42"}).json()
+    progress = client.post("/progress", json={
+        "user_id": user["id"], "program_id": program["id"], "workout_id": workout["id"],
+    }).json()
+    completed = client.patch(f"/progress/{progress['id']}/complete", json={"is_completed": True}).json()
+    assert completed["is_completed"] and completed["completed_at"]
+    assert len(client.get(f"/users/{user['id']}/progress").json()) == 1
+
+    assert client.put(f"/programs/{program['id']}", json={
+        "name": "Async 2", "difficulty": "beginner", "goal": "weight_loss", "location": "home",
+    }).json()["workouts"][0]["id"] == workout["id"]
+    assert client.delete(f"/exercises/{exercise['id']}").status_code == 200
+    assert client.delete(f"/workouts/{workout['id']}").status_code == 200
+    assert client.delete(f"/programs/{program['id']}").status_code == 200
+    assert client.get(f"/programs/{program['id']}").status_code == 404
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import select
+
+import main
+import schemas
+
+
+@pytest.mark.parametrize("mode", ["client", "async_client"])
+def test_bootstrap_returns_everything_for_first_paint(request, mode, make_catalog):
+    client = request.getfixturevalue(mode)
+    program = make_catalog(programs=2, days=3, exercises=2)[1]
+
+    fresh = client.get("/bootstrap", params={"telegram_id": "boot"}).json()
+    assert fresh["user"]["telegram_id"] == "boot"
+    assert (fresh["program"], fresh["workouts"], fresh["progress"]) == (None, [], None)
+
+    user_id = fresh["user"]["id"]
+    client.post("/progress", json={
+        "user_id": user_id, "program_id": program.id, "workout_id": program.workouts[1].id, "is_completed": True,
+    })
+
+    # Без program_id берется программа, в которой пользователь отмечался последним
+    data = schemas.Bootstrap.model_validate(client.get("/bootstrap", params={"telegram_id": "boot"}).json())
+    assert data.user.id == user_id
+    assert (data.program.id, data.program.days_count, data.program.exercises_count) == (program.id, 3, 6)
+    assert [w.day_number for w in data.workouts] == [1, 2, 3]
+    assert data.progress.completed_workout_ids == [program.workouts[1].id]
+    assert data.partial == []
+
+    assert client.get("/bootstrap", params={"telegram_id": "boot", "program_id": 999}).status_code == 404
+
+
+def test_bootstrap_serves_catalog_parts_from_cache(client, make_catalog, count_statements):
+    program = make_catalog(programs=1, days=2)[0]
+    params = {"telegram_id": "cached", "program_id": program.id}
+    client.get("/bootstrap", params=params)
+
+    before = count_statements.count
+    client.get("/bootstrap", params=params)
+    # Пользователь и каталог из памяти, из БД читается только прогресс
+    assert count_statements.count - before == 2
+
+
+def test_bootstrap_marks_slow_progress_as_partial(client, make_catalog, monkeypatch):
+    import crud
+    from database import engine
+
+    program = make_catalog(programs=1, days=2)[0]
+    get_progress = crud.get_user_program_progress
+    released, finished = threading.Event(), threading.Event()
+    seen = {}
+
+    def slow_progress(db, user_id, program_id):
+        # Настоящий запрос в сессии run_in_session, которая остается занятой после ответа
+        connection = db.connection()
+        db.execute(select(1))
+        released.wait(5)
+        try:
+            seen["closed_while_running"] = connection.closed
+            seen["result"] = get_progress(db, user_id, program_id)
+        finally:
+            finished.set()
+
+    monkeypatch.setattr(main, "BOOTSTRAP_BUDGET_MS", 50)
+    monkeypatch.setattr(crud, "get_user_program_progress", slow_progress)
+
+    data = client.get("/bootstrap", params={"telegram_id": "slow", "program_id": program.id}).json()
+    assert len(data["workouts"]) == 2
+    assert data["progress"] is None
+    assert data["partial"] == ["progress"]
+
+    # Ответ ушел, а запрос прогресса еще работает: его сессию никто не закрыл
+    assert engine.pool.checkedout() >= 1
+    released.set()
+    assert finished.wait(5)
+    assert seen["closed_while_running"] is False
+    assert seen["result"].program_id == program.id
+    for _ in range(100):
+        if not main._abandoned_parts:
+            break
+        time.sleep(0.01)
+    assert not main._abandoned_parts
@@ -0,0 +1,77 @@
+import pytest
+
+
+def program_document(days=3, exercises=4):
+    return {
+        "difficulty": "beginner", "goal": "weight_loss", "location": "home", "name": "Полная программа",
+        "workouts": [
+            {
+                "day_number": d + 1,
+                "title": f"День {d + 1}",
+                "exercises": [
+                    {"name": f"Упражнение {e + 1}", "sets": 3, "reps": "10", "rest_time": 60}
+                    for e in range(exercises)
+                ],
+            }
+            for d in range(days)
+        ],
+    }
+
+
+@pytest.mark.parametrize("mode", ["client", "async_client"])
+def test_create_program_full(request, mode, count_statements):
+    client = request.getfixturevalue(mode)
+    small = count_statements.count
+    client.post("/programs/full", json=program_document(days=1, exercises=1))
+    small = count_statements.count - small
+
+    before = count_statements.count
+    response = client.post("/programs/full", json=program_document(days=30, exercises=8))
+    large = count_statements.count - before
+
+    assert response.status_code == 200
+    program = response.json()
+    assert [w["day_number"] for w in program["workouts"]] == list(range(1, 31))
+    assert all(len(w["exercises"]) == 8 for w in program["workouts"])
+    # Число запросов не зависит от размера программы (executemany батчится драйвером)
+    assert large <= small + 2
+
+
+def test_bulk_workouts_and_exercises(client, count_statements):
+    program_id = client.post("/programs/full", json=program_document(days=0)).json()["id"]
+    etag = client.get(f"/programs/{program_id}").headers["etag"]
+
+    before = count_statements.count
+    workouts = client.post("/workouts/bulk", json=[
+        {"program_id": program_id, "day_number": d, "title": f"День {d}"} for d in range(1, 21)
+    ])
+    assert workouts.status_code == 200
+    assert [w["day_number"] for w in workouts.json()] == list(range(1, 21))
+    assert all(w["exercises"] == [] for w in workouts.json())
+    # Проверка программ, вставка, ревизия каталога (каталог и программа) и ее сверка кэшем
+    assert count_statements.count - before <= 5
+
+    exercises = client.post("/exercises/bulk", json=[
+        {"workout_id": w["id"], "name": "Присед", "sets": 4, "reps": "12", "rest_time": 90}
+        for w in workouts.json()
+    ])
+    assert exercises.status_code == 200
+    assert len({e["id"] for e in exercises.json()}) == 20
+
+    response = client.get(f"/programs/{program_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert sum(len(w["exercises"]) for w in response.json()["workouts"]) == 20
+
+
+def test_bulk_rejects_unknown_parents(client):
+    program_id = client.post("/programs/full", json=program_document(days=1)).json()["id"]
+
+    response = client.post("/workouts/bulk", json=[
+        {"program_id": program_id, "day_number": 2, "title": "ok"},
+        {"program_id": 999, "day_number": 1, "title": "missing"},
+    ])
+    assert response.status_code == 404
+    assert client.post("/exercises/bulk", json=[
+        {"workout_id": 999, "name": "x", "sets": 1, "reps": "1", "rest_time": 0},
+    ]).status_code == 404
+    assert len(client.get(f"/programs/{program_id}").json()["workouts"]) == 1
@@ -0,0 +1,147 @@
+import time
+
+from cache import CachedBody, CatalogCache
+
+
+def test_lru_eviction_and_ttl():
+    cache = CatalogCache(max_entries=2, ttl=60)
+    cache.set("a", CachedBody(b"1"))
+    cache.set("b", CachedBody(b"2"))
+    assert cache.get("a").body == b"1"  # "a" становится самым свежим
+    cache.set("c", CachedBody(b"3"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+    expiring = CatalogCache(max_entries=2, ttl=0.01)
+    expiring.set("a", CachedBody(b"1"))
+    time.sleep(0.02)
+    assert expiring.get("a") is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = CatalogCache(max_entries=0)
+    cache.set("a", CachedBody(b"1"))
+    assert cache.get("a") is None
+
+
+def test_program_invalidation_is_scoped():
+    cache = CatalogCache()
+    catalog, first, second = cache.catalog_revision(), cache.program_revision(1), cache.program_revision(2)
+    cache.invalidate_program(1)
+    assert cache.catalog_revision() == catalog + 1
+    assert cache.program_revision(1) == first + 1
+    assert cache.program_revision(2) == second
+
+
+def test_stored_revisions_invalidate_changed_scopes():
+    cache = CatalogCache()
+    catalog, first, second = cache.catalog_revision(), cache.program_revision(1), cache.program_revision(2)
+    cache.apply_revisions([(0, 3), (1, 3)])
+    assert cache.stored_revision() == 3
+    assert cache.catalog_revision() > catalog
+    assert cache.program_revision(1) == first + 1
+    assert cache.program_revision(2) == second
+
+    # Запоздавший результат более раннего чтения ничего не меняет
+    catalog = cache.catalog_revision()
+    cache.apply_revisions([(0, 2), (1, 2)])
+    assert (cache.stored_revision(), cache.catalog_revision(), cache.program_revision(1)) == (3, catalog, first + 1)
+
+
+def test_catalog_changes_outside_this_process_are_picked_up(client, make_catalog, db):
+    import json
+
+    import catalog_io
+    from cache import catalog_revision_poller
+
+    program_id = make_catalog(programs=1)[0].id
+    url = f"/programs/{program_id}"
+    etag = client.get(url).headers["etag"]
+
+    # Так пишут другой воркер или catalog_cli.py import: мимо кэша этого процесса
+    document = json.loads(next(catalog_io.export_catalog(db)))
+    document["name"] = "Обновлена импортом"
+    catalog_io.import_batch(db, [document])
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    client.portal.call(catalog_revision_poller.poll)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Обновлена импортом"
+    assert client.get(url, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+
+def test_catalog_responses_are_served_from_cache(client, make_catalog, count_statements):
+    first, second = make_catalog(programs=2, days=2, exercises=1)
+    first_id, second_id = first.id, second.id
+
+    for url in ["/programs", "/programs/summary", f"/programs/{first_id}", f"/programs/{first_id}/workouts",
+                f"/workouts/{first_id}", f"/programs/{second_id}"]:
+        response = client.get(url)
+        assert response.status_code == 200
+        before = count_statements.count
+        assert client.get(url).content == response.content
+        assert count_statements.count == before, url
+
+    workout = client.get(f"/programs/{first_id}/workouts").json()[0]
+    assert client.get(f"/workouts/single/{workout['id']}").status_code == 200
+    before = count_statements.count
+    client.get(f"/workouts/single/{workout['id']}")
+    assert count_statements.count == before
+
+
+def test_exercise_mutation_invalidates_only_its_program(client, make_catalog, count_statements):
+    first, second = make_catalog(programs=2, days=1, exercises=1)
+    first_id, second_id = first.id, second.id
+    client.get(f"/programs/{first_id}")
+    client.get(f"/programs/{second_id}")
+
+    workout_id = client.get(f"/programs/{first_id}").json()["workouts"][0]["id"]
+    response = client.post("/exercises", json={
+        "workout_id": workout_id, "name": "Бёрпи", "sets": 4, "reps": "10", "rest_time": 30,
+    })
+    assert response.status_code == 200
+
+    exercises = client.get(f"/programs/{first_id}").json()["workouts"][0]["exercises"]
+    assert [e["name"] for e in exercises][-1] == "Бёрпи"
+    assert client.get("/programs/summary").json()[0]["exercises_count"] == 2
+
+    before = count_statements.count
+    client.get(f"/programs/{second_id}")
+    assert count_statements.count == before
+
+
+def test_conditional_get_returns_304_without_queries(client, make_catalog, count_statements):
+    program_id = make_catalog(programs=1, days=2, exercises=1)[0].id
+    workout_id = client.get(f"/programs/{program_id}").json()["workouts"][0]["id"]
+
+    urls = ["/programs", "/programs/summary?limit=10", f"/programs/{program_id}",
+            f"/programs/{program_id}/workouts", f"/workouts/{program_id}", f"/workouts/single/{workout_id}"]
+    etags = {}
+    for url in urls:
+        response = client.get(url)
+        etags[url] = response.headers["etag"]
+
+        before = count_statements.count
+        response = client.get(url, headers={"If-None-Match": etags[url]})
+        assert response.status_code == 304, url
+        assert response.content == b""
+        assert count_statements.count == before, url
+
+    client.put(f"/programs/{program_id}", json={
+        "name": "Новое название", "difficulty": "beginner", "goal": "weight_loss", "location": "home",
+    })
+    for url in urls:
+        response = client.get(url, headers={"If-None-Match": etags[url]})
+        assert response.status_code == 200, url
+        assert response.headers["etag"] != etags[url]
+
+
+def test_etag_is_scoped_to_program(client, make_catalog):
+    first, second = make_catalog(programs=2, days=1)
+    first_id, second_id = first.id, second.id
+    etag = client.get(f"/programs/{second_id}").headers["etag"]
+
+    client.delete(f"/workouts/{client.get(f'/programs/{first_id}').json()['workouts'][0]['id']}")
+
+    assert client.get(f"/programs/{second_id}", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+import catalog_io
+import models
+
+
+def _without_ids(value):
+    if isinstance(value, list):
+        return [_without_ids(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _without_ids(item) for key, item in value.items() if key not in ("id", "program_id", "workout_id")}
+    return value
+
+
+def _tree(client):
+    return _without_ids(client.get("/programs").json())
+
+
+def test_export_is_batched_and_round_trips(db, make_catalog, count_statements):
+    make_catalog(programs=7, days=3, exercises=2)
+
+    before = count_statements.count
+    lines = list(catalog_io.export_catalog(db, batch_size=3))
+    # На каждый батч: дни и упражнения; программы читаются одним курсором
+    assert count_statements.count - before <= 1 + 3 * 2
+
+    documents = [json.loads(line) for line in lines]
+    assert [d["id"] for d in documents] == list(range(1, 8))
+    assert all(len(d["workouts"]) == 3 for d in documents)
+    assert all(len(w["exercises"]) == 2 for d in documents for w in d["workouts"])
+
+    # Повторный импорт с теми же id обновляет записи, а не дублирует их
+    documents[0]["name"] = "Переименована"
+    chunks = [b"".join(json.dumps(d).encode() + b"\n" for d in documents)]
+    totals = catalog_io.import_catalog(db, chunks, batch_size=2)
+    assert totals == {"programs": 7, "workouts": 21, "exercises": 42}
+    assert db.query(models.WorkoutProgram).count() == 7
+    assert db.query(models.Exercise).count() == 42
+    assert db.get(models.WorkoutProgram, 1).name == "Переименована"
+
+
+def test_import_without_ids_creates_new_rows(db, make_catalog):
+    make_catalog(programs=2, days=2, exercises=3)
+    lines = list(catalog_io.export_catalog(db, program_ids=[2]))
+    # Нарезка потока не совпадает с границами строк
+    data = b"".join(lines) * 3
+    chunks = [data[i:i + 7] for i in range(0, len(data), 7)]
+
+    totals = catalog_io.import_catalog(db, chunks, keep_ids=False)
+    assert totals == {"programs": 3, "workouts": 6, "exercises": 18}
+    assert db.query(models.WorkoutProgram).count() == 5
+    for program in db.query(models.WorkoutProgram).filter(models.WorkoutProgram.id > 2):
+        assert [w.day_number for w in program.workouts] == [1, 2]
+        assert all(len(w.exercises) == 3 for w in program.workouts)
+
+
+def test_import_reports_bad_line(db):
+    with pytest.raises(catalog_io.CatalogFormatError, match="line 2"):
+        catalog_io.import_catalog(db, [b'{"difficulty": "a", "goal": "b", "location": "c", "name": "ok"}\n{"name": 1}\n'])
+
+
+@pytest.mark.parametrize("mode", ["client", "async_client"])
+def test_export_import_endpoints(request, mode, make_catalog):
+    client = request.getfixturevalue(mode)
+    make_catalog(programs=3, days=2, exercises=2)
+    expected = _tree(client)
+
+    response = client.get("/programs/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(response.content.splitlines()) == 3
+    assert len(client.get("/programs/export", params={"program_id": [1, 3]}).content.splitlines()) == 2
+
+    imported = client.post("/programs/import", params={"keep_ids": "false"}, content=response.content)
+    assert imported.json() == {"programs": 3, "workouts": 6, "exercises": 12}
+    # Кэш каталога сброшен: новые программы видны сразу
+    assert _tree(client) == expected + expected
+
+    assert client.post("/programs/import", content=b'{"name": "x"}\n').status_code == 400
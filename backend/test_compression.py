@@ -0,0 +1,110 @@
+import pytest
+
+import compression
+from compression import PayloadStats, negotiate
+
+
+@pytest.fixture
+def stats():
+    compression.payload_stats.reset()
+    yield compression.payload_stats
+    compression.payload_stats.reset()
+
+
+def test_negotiate_follows_server_preference_and_quality():
+    assert negotiate("gzip, deflate, br", ["br", "gzip"]) == "br"
+    assert negotiate("gzip, br;q=0", ["br", "gzip"]) == "gzip"
+    assert negotiate("*", ["gzip"]) == "gzip"
+    assert negotiate("identity", ["br", "gzip"]) is None
+    assert negotiate(None, ["gzip"]) is None
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_catalog_response_is_compressed_once(client, make_catalog, stats, monkeypatch, encoding):
+    program_id = make_catalog(programs=1, days=10, exercises=5)[0].id
+    url = f"/programs/{program_id}"
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+    calls = []
+    real_compress = compression.compress
+    monkeypatch.setattr(compression, "compress", lambda body, enc: calls.append(enc) or real_compress(body, enc))
+
+    for _ in range(3):
+        response = client.get(url, headers={"Accept-Encoding": encoding})
+        assert response.headers["content-encoding"] == encoding
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert int(response.headers["content-length"]) < len(plain.content)
+        # httpx распаковывает тело сам
+        assert response.content == plain.content
+    assert calls == [encoding]
+
+    entry = stats.stats()["routes"]["/programs/{program_id}"]
+    assert entry["responses"] == 4
+    assert entry["compressed"] == 3
+    assert entry["raw_bytes"] == 4 * len(plain.content)
+    assert entry["sent_bytes"] < entry["raw_bytes"]
+
+
+def test_each_encoding_has_its_own_etag(client, make_catalog):
+    program_id = make_catalog(programs=1, days=10, exercises=5)[0].id
+    url = f"/programs/{program_id}"
+    etags = {
+        encoding: client.get(url, headers={"Accept-Encoding": encoding}).headers["etag"]
+        for encoding in ("identity", "gzip", "br")
+    }
+    assert len(set(etags.values())) == 3
+    assert etags["gzip"] == etags["identity"][:-1] + '-gzip"'
+
+    # Любой из вариантов подтверждается 304 со своим же тегом
+    for encoding, etag in etags.items():
+        response = client.get(url, headers={"Accept-Encoding": encoding, "If-None-Match": etag})
+        assert (response.status_code, response.headers["etag"]) == (304, etag)
+
+
+def test_bootstrap_entry_is_compressed_once_for_workouts(client, make_catalog, monkeypatch):
+    program_id = make_catalog(programs=1, days=10, exercises=5)[0].id
+    # /bootstrap первым кладет в кэш дни программы под тем же ключом, что и /workouts
+    client.get("/bootstrap", params={"telegram_id": "compress", "program_id": program_id})
+
+    calls = []
+    real_compress = compression.compress
+    monkeypatch.setattr(compression, "compress", lambda body, enc: calls.append(enc) or real_compress(body, enc))
+    for _ in range(3):
+        response = client.get(f"/workouts/{program_id}", headers={"Accept-Encoding": "br"})
+        assert response.headers["content-encoding"] == "br"
+    assert calls == ["br"]
+
+
+def test_small_and_uncached_responses(client, make_catalog, stats):
+    response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+    make_catalog(programs=30, days=1, exercises=1)
+    # Ответ не из кэша каталога сжимает middleware
+    response = client.get("/programs/match", params={"limit": 30}, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 30
+
+    routes = client.get("/metrics/payloads").json()["routes"]
+    assert routes["/health"]["compressed"] == 0
+    assert routes["/programs/match"]["compressed"] == 1
+
+
+def test_streaming_export_is_compressed(client, make_catalog, stats):
+    make_catalog(programs=3, days=2, exercises=2)
+    plain = client.get("/programs/export", headers={"Accept-Encoding": "identity"})
+    response = client.get("/programs/export", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == plain.content
+    assert len(plain.content.splitlines()) == 3
+
+
+def test_payload_budget_is_counted():
+    budgeted = PayloadStats(budget_bytes=100)
+    budgeted.record("/programs", 1000, 80, "gzip")
+    budgeted.record("/programs", 1000, 120, "gzip")
+    entry = budgeted.stats()["routes"]["/programs"]
+    assert entry["over_budget"] == 1
+    assert entry["max_sent_bytes"] == 120
+    assert entry["compression_ratio"] == 0.1
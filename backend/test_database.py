@@ -0,0 +1,27 @@
+from sqlalchemy import delete, text
+
+from database import engine
+import models
+
+
+def test_sqlite_pragmas_are_applied_to_pool_connections(db):
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA foreign_keys")).scalar() == 1
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA temp_store")).scalar() == 2  # MEMORY
+
+
+def test_user_progress_cascades_on_user_delete(db, make_catalog):
+    program = make_catalog(programs=1, days=1)[0]
+    user = models.User(telegram_id="1")
+    db.add(user)
+    db.flush()
+    db.add(models.UserProgress(user_id=user.id, program_id=program.id, workout_id=program.workouts[0].id))
+    db.commit()
+
+    # Удаление в обход ORM: каскад выполняет сама SQLite
+    db.execute(delete(models.User).where(models.User.id == user.id))
+    db.commit()
+    assert db.query(models.UserProgress).count() == 0
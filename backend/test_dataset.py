@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import inspect, select
+
+import crud
+import dataset
+import models
+from database import Base, engine
+
+CONFIG = dataset.DatasetConfig(programs=6, days=5, exercises=3, users=150, seed=3, until=datetime(2025, 3, 1), batch_size=40)
+
+
+def _dump(db):
+    return {
+        model.__tablename__: db.execute(select(model.__table__).order_by(*model.__table__.primary_key.columns)).all()
+        for model in (
+            models.WorkoutProgram, models.Workout, models.Exercise, models.User,
+            models.UserProgress, models.UserProgramStats,
+        )
+    }
+
+
+def _regenerate(db, config):
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return dataset.generate(db, config)
+
+
+def test_generation_is_deterministic_per_seed(db):
+    counts = dataset.generate(db, CONFIG)
+    first = _dump(db)
+    assert _regenerate(db, CONFIG) == counts
+    assert _dump(db) == first
+
+    _regenerate(db, CONFIG._replace(seed=4))
+    assert _dump(db)["user_progress"] != first["user_progress"]
+
+    assert counts["workout_programs"] == 6
+    assert counts["workouts"] == 30
+    assert counts["exercises"] == 90
+    assert counts["users"] == 150
+    assert counts["user_progress"] == len(first["user_progress"]) > 150
+
+
+def test_generated_progress_is_consistent(db):
+    dataset.generate(db, CONFIG)
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("user_progress")}
+    assert {"ix_user_progress_user_program_updated", "uq_user_progress_user_workout"} <= indexes
+
+    rows = db.scalars(select(models.UserProgress)).all()
+    assert all(row.completed_at <= CONFIG.until for row in rows if row.is_completed)
+    assert all(row.completed_at is None for row in rows if not row.is_completed)
+    workouts = {workout.id: workout.program_id for workout in db.scalars(select(models.Workout))}
+    assert all(workouts[row.workout_id] == row.program_id for row in rows)
+
+    # Сводка совпадает с той, что посчитал бы crud при записи прогресса
+    columns = ("user_id", "program_id", "completed_days", "streak_days", "longest_streak", "last_completed_at")
+    stats_table = models.UserProgramStats.__table__
+    generated = db.execute(select(*(stats_table.c[name] for name in columns))).all()
+    crud.refresh_program_stats(db, [(row.user_id, row.program_id) for row in generated])
+    db.commit()
+    assert db.execute(select(*(stats_table.c[name] for name in columns))).all() == generated
+
+    user = db.scalars(select(models.User).where(models.User.telegram_id == dataset.telegram_id(1))).one()
+    assert user.id == 1
+
+
+def test_generation_requires_empty_database(db, make_catalog):
+    make_catalog(programs=1)
+    with pytest.raises(dataset.DatasetError):
+        dataset.generate(db, CONFIG)
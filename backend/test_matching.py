@@ -0,0 +1,58 @@
+def _ids(response):
+    return [match["program"]["id"] for match in response.json()]
+
+
+def test_match_ranks_full_then_partial(client, make_catalog):
+    full = make_catalog(programs=2, difficulty="beginner", goal="weight_loss", location="home")
+    goal_only = make_catalog(programs=1, difficulty="advanced", goal="weight_loss", location="gym")
+    level_and_place = make_catalog(programs=1, difficulty="beginner", goal="muscle_gain", location="home")
+    make_catalog(programs=1, difficulty="advanced", goal="endurance", location="gym")
+
+    response = client.get("/programs/match", params={"difficulty": "Beginner", "goal": "weight_loss", "location": "home"})
+    assert response.status_code == 200
+    matches = response.json()
+    # При равном весе выше программа, совпавшая по большему числу фасетов
+    assert _ids(response) == [p.id for p in full] + [level_and_place[0].id, goal_only[0].id]
+    assert [m["score"] for m in matches] == [1.0, 1.0, 0.5, 0.5]
+    assert matches[3]["matched"] == ["goal"]
+    assert matches[0]["program"]["days_count"] == 3
+
+    assert len(client.get("/programs/match", params={"goal": "weight_loss", "limit": 2}).json()) == 2
+    assert len(client.get("/programs/match").json()) == 5
+
+
+def test_match_uses_memory_until_catalog_changes(client, make_catalog, count_statements):
+    make_catalog(programs=3)
+    params = {"goal": "weight_loss"}
+    assert len(client.get("/programs/match", params=params).json()) == 3
+
+    before = count_statements.count
+    client.get("/programs/match", params=params)
+    assert count_statements.count == before
+
+    client.post("/programs", json={"difficulty": "beginner", "goal": "weight_loss", "location": "gym", "name": "Новая"})
+    assert len(client.get("/programs/match", params=params).json()) == 4
+
+
+def test_concurrent_rebuild_in_async_mode(async_client, make_catalog):
+    import asyncio
+
+    import httpx
+
+    import main
+    from cache import catalog_cache
+
+    make_catalog(programs=3)
+    catalog_cache.invalidate_catalog()
+
+    async def match_concurrently():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            responses = await asyncio.gather(*(
+                http.get("/programs/match", params={"goal": "weight_loss"}) for _ in range(5)
+            ))
+        return [len(response.json()) for response in responses]
+
+    # Пока первый запрос ждет БД внутри run_sync, остальные не должны блокировать поток event loop
+    future = async_client.portal.start_task_soon(match_concurrently)
+    assert future.result(timeout=10) == [3] * 5
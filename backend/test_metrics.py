@@ -0,0 +1,88 @@
+import pytest
+
+import metrics
+from database import engine
+from metrics import RequestMetrics, RequestTimings, parse_server_timing
+
+
+@pytest.fixture
+def request_metrics():
+    metrics.request_metrics.reset()
+    yield metrics.request_metrics
+    metrics.request_metrics.reset()
+
+
+def _samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_server_timing_reports_sql_of_the_request(client, make_catalog, count_statements):
+    program_id = make_catalog(programs=1, days=3, exercises=2)[0].id
+    user_id = client.post("/users", json={"telegram_id": "timing"}).json()["id"]
+
+    count_statements.executed.clear()
+    response = client.get(f"/users/{user_id}/programs/{program_id}/progress")
+    timing = parse_server_timing(response.headers["server-timing"])
+    assert set(timing) == {"app", "db", "pool"}
+    assert timing["db"]["desc"] == f"queries: {count_statements.count}"
+    assert count_statements.count > 0
+    assert 0 < timing["db"]["dur"] <= timing["app"]["dur"]
+
+
+def test_metrics_are_aggregated_per_route_template(client, make_catalog, request_metrics):
+    programs = make_catalog(programs=2, days=2, exercises=1)
+    sent = 0
+    for program in programs:
+        response = client.get(f"/programs/{program.id}", headers={"Accept-Encoding": "identity"})
+        sent += len(response.content)
+    assert client.get("/programs/999999").status_code == 404
+
+    samples = _samples(client.get("/metrics").text)
+    route = 'method="GET",route="/programs/{program_id}"'
+    assert samples[f'http_requests_total{{{route},status="200"}}'] == 2
+    assert samples[f'http_requests_total{{{route},status="404"}}'] == 1
+    assert samples[f'http_request_duration_seconds_count{{{route}}}'] == 3
+    assert samples[f'http_request_duration_seconds_bucket{{{route},le="+Inf"}}'] == 3
+    # Первое чтение каждой программы идет в базу, повторные отдает кэш
+    assert samples[f'http_request_sql_statements_bucket{{{route},le="0.0"}}'] == 0
+    assert samples[f'http_request_sql_statements_sum{{{route}}}'] >= 3
+    assert samples[f'http_request_sql_seconds_total{{{route}}}'] > 0
+    assert samples[f'http_response_bytes_total{{{route}}}'] >= sent
+
+
+def test_statements_outside_requests_are_not_attributed(db):
+    timings = RequestTimings()
+    token = metrics._current.set(timings)
+    try:
+        db.connection().exec_driver_sql("SELECT 1")
+    finally:
+        metrics._current.reset(token)
+    db.connection().exec_driver_sql("SELECT 1")
+    assert timings.sql_count == 1
+
+
+def test_pool_timing_survives_dispose(db):
+    metrics.instrument_engine(engine)
+    engine.dispose()
+    assert type(engine.pool).__name__.startswith("Timed")
+    timings = RequestTimings()
+    token = metrics._current.set(timings)
+    try:
+        with engine.connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        metrics._current.reset(token)
+    assert timings.pool_wait_seconds > 0
+
+
+def test_prometheus_labels_are_escaped():
+    stats = RequestMetrics()
+    stats.record("GET", 'a"b\\c', 200, 0.01, RequestTimings(), 10)
+    text = stats.render()
+    assert 'route="a\\"b\\\\c"' in text
+    assert text.endswith("\n")
@@ -0,0 +1,220 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+
+import migrations
+import models
+from database import apply_sqlite_pragmas
+
+# user_progress в том виде, в каком ее создавали первые версии приложения:
+# без ON DELETE CASCADE и без updated_at
+LEGACY_PROGRESS = """
+    CREATE TABLE user_progress (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        program_id INTEGER NOT NULL REFERENCES workout_programs(id),
+        workout_id INTEGER NOT NULL REFERENCES workouts(id),
+        is_completed BOOLEAN DEFAULT 0,
+        completed_at DATETIME
+    )
+"""
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    apply_sqlite_pragmas(engine)
+    tables = [models.User.__table__, models.WorkoutProgram.__table__, models.Workout.__table__]
+    models.Base.metadata.create_all(bind=engine, tables=tables)
+    with engine.begin() as conn:
+        # Поиска по названиям тогда тоже не было
+        for trigger in ("ai", "ad", "au"):
+            conn.exec_driver_sql(f"DROP TRIGGER workout_programs_fts_{trigger}")
+        conn.exec_driver_sql("DROP TABLE workout_programs_fts")
+        conn.exec_driver_sql(LEGACY_PROGRESS)
+        conn.exec_driver_sql("INSERT INTO users (id, telegram_id) VALUES (1, 'a'), (2, 'b')")
+        conn.exec_driver_sql(
+            "INSERT INTO workout_programs (id, difficulty, goal, location, name) VALUES (1, 'b', 'g', 'l', 'Кардио')"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO workouts (id, program_id, day_number, title) VALUES (1, 1, 1, 'Д1'), (2, 1, 2, 'Д2')"
+        )
+    with engine.connect() as conn:
+        # Тогда SQLite не проверял внешние ключи, и прогресс удаленных дней оставался
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        for row in [
+            (1, 1, 1, 1, 1, "2024-01-01 10:00:00.000000"),
+            (2, 1, 1, 2, 0, None),
+            (3, 2, 1, 1, 0, None),
+            (4, 2, 1, 1, 1, "2024-01-03 10:00:00.000000"),  # дубль (2, 1)
+            (5, 1, 1, 99, 1, "2024-01-05 10:00:00.000000"),  # день давно удален
+        ]:
+            conn.exec_driver_sql("INSERT INTO user_progress VALUES (?, ?, ?, ?, ?, ?)", row)
+        conn.commit()
+        conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+    yield engine
+    engine.dispose()
+
+
+def test_empty_database_is_created_at_head(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    try:
+        applied = migrations.upgrade(engine)
+        assert [m.version for m in applied] == [m.version for m in migrations.MIGRATIONS]
+        assert migrations.applied_versions(engine) == {m.version for m in migrations.MIGRATIONS}
+        assert "user_program_stats" in inspect(engine).get_table_names()
+        migrations.ensure_current(engine)
+        assert migrations.upgrade(engine) == []
+    finally:
+        engine.dispose()
+
+
+def test_legacy_database_is_upgraded(legacy_engine):
+    with pytest.raises(migrations.SchemaOutdated):
+        migrations.ensure_current(legacy_engine)
+
+    migrations.upgrade(legacy_engine, batch_size=2)
+    migrations.ensure_current(legacy_engine)
+
+    inspector = inspect(legacy_engine)
+    foreign_keys = inspector.get_foreign_keys("user_progress")
+    assert {fk["options"].get("ondelete") for fk in foreign_keys} == {"CASCADE"}
+    assert "revision" in {column["name"] for column in inspector.get_columns("user_progress")}
+    assert "reset_revision" in {column["name"] for column in inspector.get_columns("user_program_stats")}
+    assert {index["name"] for index in inspector.get_indexes("user_progress")} == {
+        "ix_user_progress_id", "ix_user_progress_user_program_updated", "uq_user_progress_user_workout",
+        "ix_user_progress_workout", "ix_user_progress_program",
+    }
+    with legacy_engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT id, user_id, workout_id, is_completed, completed_at, updated_at FROM user_progress ORDER BY id"
+        ).all()
+        assert [row[:4] for row in rows] == [(1, 1, 1, 1), (2, 1, 2, 0), (3, 2, 1, 1)]
+        # updated_at заполнен из completed_at, для невыполненных — временем миграции
+        assert rows[0].updated_at == "2024-01-01 10:00:00.000000"
+        assert len(rows[1].updated_at) == len("2024-01-01 10:00:00.000000")
+        assert rows[2].completed_at == "2024-01-03 10:00:00.000000"
+
+        stats = conn.exec_driver_sql(
+            "SELECT user_id, completed_days FROM user_program_stats ORDER BY user_id"
+        ).all()
+        assert stats == [(1, 1), (2, 1)]
+        assert conn.exec_driver_sql(
+            "SELECT rowid FROM workout_programs_fts WHERE name MATCH 'ард'"
+        ).scalars().all() == [1]
+
+        conn.exec_driver_sql("DELETE FROM workouts WHERE id = 1")
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM user_progress").scalar() == 1
+
+
+def test_rebuild_keeps_writes_made_during_copy(legacy_engine, monkeypatch):
+    copy_batch = migrations._copy_batch
+    calls = []
+
+    def copy_and_write(engine, *args):
+        result = copy_batch(engine, *args)
+        if not calls:
+            # Приложение пишет в старую таблицу между порциями
+            with engine.begin() as conn:
+                conn.exec_driver_sql("UPDATE user_progress SET is_completed = 1 WHERE id = 2")
+                conn.exec_driver_sql("DELETE FROM user_progress WHERE id = 1")
+                conn.exec_driver_sql("INSERT INTO user_progress VALUES (6, 1, 1, 2, 0, NULL)")
+        calls.append(result)
+        return result
+
+    monkeypatch.setattr(migrations, "_copy_batch", copy_and_write)
+    migrations.rebuild_user_progress(legacy_engine, batch_size=2)
+
+    # Порции по id: 1-2, 3-4, затем остаток, где строка 6 уже перенесена триггером, а 5 — сирота
+    assert calls == [(2, 2), (4, 2), (6, 0), (None, 0)]
+    with legacy_engine.connect() as conn:
+        rows = conn.exec_driver_sql("SELECT id, is_completed FROM user_progress ORDER BY id").all()
+        triggers = conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger'").scalars().all()
+    assert rows == [(2, 1), (3, 0), (4, 1), (6, 0)]
+    assert not any(name.startswith("user_progress__rebuild") for name in triggers)
+
+
+def test_progress_is_altered_in_place_without_rebuild(tmp_path, monkeypatch):
+    from sqlalchemy import event
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'altered.db'}")
+    apply_sqlite_pragmas(engine)
+    tables = [models.User.__table__, models.WorkoutProgram.__table__, models.Workout.__table__]
+    models.Base.metadata.create_all(bind=engine, tables=tables)
+    with engine.begin() as conn:
+        # Внешние ключи уже с каскадом, но ни updated_at, ни revision еще нет
+        conn.exec_driver_sql("""
+            CREATE TABLE user_progress (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                program_id INTEGER NOT NULL,
+                workout_id INTEGER NOT NULL,
+                is_completed BOOLEAN DEFAULT 0,
+                completed_at DATETIME,
+                FOREIGN KEY(user_id) REFERENCES users (id) ON DELETE CASCADE,
+                FOREIGN KEY(program_id) REFERENCES workout_programs (id) ON DELETE CASCADE,
+                FOREIGN KEY(workout_id) REFERENCES workouts (id) ON DELETE CASCADE
+            )
+        """)
+        conn.exec_driver_sql("INSERT INTO users (id, telegram_id) VALUES (1, 'a')")
+        conn.exec_driver_sql(
+            "INSERT INTO workout_programs (id, difficulty, goal, location, name) VALUES (1, 'b', 'g', 'l', 'Кардио')"
+        )
+        conn.exec_driver_sql("INSERT INTO workouts (id, program_id, day_number, title) VALUES (1, 1, 1, 'Д1')")
+        conn.exec_driver_sql(
+            "INSERT INTO user_progress VALUES (1, 1, 1, 1, 1, '2024-01-01 10:00:00.000000'), (2, 1, 1, 1, 0, NULL)"
+        )
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def skip_not_null(conn, cursor, statement, parameters, context, executemany):
+        # SQLite не умеет ALTER COLUMN; остальной путь PostgreSQL выполняется как есть
+        if "SET NOT NULL" in statement:
+            return "SELECT 1", ()
+        return statement, parameters
+
+    monkeypatch.setattr(migrations, "_is_sqlite", lambda engine: False)
+    monkeypatch.setattr(migrations, "rebuild_table", None)
+    try:
+        migrations.upgrade(engine, batch_size=1)
+        migrations.ensure_current(engine)
+        inspector = inspect(engine)
+        assert {"updated_at", "revision"} <= {column["name"] for column in inspector.get_columns("user_progress")}
+        indexes = {index["name"]: index["column_names"] for index in inspector.get_indexes("user_progress")}
+        assert indexes["ix_user_progress_user_program_updated"][-1] == "revision"
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(
+                "SELECT id, is_completed, completed_at, updated_at, revision FROM user_progress"
+            ).all()
+        assert [(row.id, row.is_completed, row.revision) for row in rows] == [(1, 1, 0)]
+        # Дубль без отметки получил updated_at временем миграции, и оно новее
+        assert rows[0].completed_at == "2024-01-01 10:00:00.000000"
+        assert rows[0].updated_at > rows[0].completed_at
+    finally:
+        engine.dispose()
+
+
+def test_dedup_merges_groups_in_batches(legacy_engine, caplog):
+    migrations.rebuild_user_progress(legacy_engine, batch_size=100)
+    with legacy_engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO user_progress (id, user_id, program_id, workout_id, is_completed, completed_at, updated_at) "
+            "VALUES (6, 1, 1, 2, 1, '2024-01-07 10:00:00.000000', '2024-01-07 10:00:00.000000'), "
+            "(7, 1, 1, 2, 0, NULL, '2024-01-08 10:00:00.000000')"
+        )
+
+    with caplog.at_level("INFO", logger="migrations"):
+        migrations.dedup_progress(legacy_engine, batch_size=1)
+
+    # Две группы дублей — две порции, каждая в своей транзакции
+    assert [r.getMessage() for r in caplog.records if "groups merged" in r.getMessage()] == [
+        "user_progress: 1 duplicate groups merged", "user_progress: 2 duplicate groups merged",
+    ]
+    assert "user_progress duplicates removed: 3" in caplog.messages
+    with legacy_engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT id, user_id, workout_id, is_completed, completed_at, updated_at FROM user_progress ORDER BY id"
+        ).all()
+    assert [row[:4] for row in rows] == [(1, 1, 1, 1), (2, 1, 2, 1), (3, 2, 1, 1)]
+    assert rows[1].completed_at == "2024-01-07 10:00:00.000000"
+    assert rows[1].updated_at > "2024-01-08 10:00:00.000000"
+    assert rows[2].completed_at == "2024-01-03 10:00:00.000000"
+    assert "uq_user_progress_user_workout" in {index["name"] for index in inspect(legacy_engine).get_indexes("user_progress")}
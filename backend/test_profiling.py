@@ -0,0 +1,64 @@
+import marshal
+
+import pytest
+
+import metrics
+import profiling
+
+TOKEN = {"X-Profile-Token": "test-profiling-token"}
+
+
+@pytest.fixture
+def profiles():
+    profiling.profile_store.clear()
+    yield profiling.profile_store
+    profiling.profile_store.clear()
+
+
+def test_request_is_profiled_only_with_token(client, make_catalog, profiles):
+    other_id, program_id = (program.id for program in make_catalog(programs=2))
+    assert "x-profile-id" not in client.get(f"/programs/{other_id}/workouts").headers
+    assert "x-profile-id" not in client.get(
+        f"/programs/{other_id}/workouts", headers={"X-Profile-Token": "wrong"}
+    ).headers
+    assert client.get("/profiles").status_code == 403
+
+    response = client.get(f"/programs/{program_id}/workouts", headers=TOKEN)
+    profile_id = response.headers["x-profile-id"]
+    [summary] = client.get("/profiles", headers=TOKEN).json()
+    assert (summary["id"], summary["path"], summary["status"]) == (profile_id, f"/programs/{program_id}/workouts", 200)
+    # Поток event loop и поток пула, где выполнялся crud (ответ еще не в кэше)
+    assert summary["threads"] >= 2
+
+    text = client.get(f"/profiles/{profile_id}", params={"format": "text"}, headers=TOKEN).text
+    assert "get_program_workout_documents" in text
+
+    download = client.get(f"/profiles/{profile_id}", headers=TOKEN)
+    assert download.headers["content-disposition"] == f'attachment; filename="profile-{profile_id}.prof"'
+    functions = marshal.loads(download.content)
+    assert any(name == "get_program_workout_documents" for _, _, name in functions)
+
+    assert client.get("/profiles/missing", headers=TOKEN).status_code == 404
+
+
+def test_slow_queries_are_logged_with_route_and_plan(client, make_catalog, monkeypatch):
+    program_id = make_catalog(programs=1)[0].id
+    monkeypatch.setattr(metrics.slow_queries, "threshold_ms", 0.000001)
+    metrics.slow_queries.reset()
+    try:
+        client.get(f"/programs/{program_id}/workouts")
+        entries = client.get("/metrics/slow-queries").json()["queries"]
+    finally:
+        metrics.slow_queries.reset()
+
+    entry = next(entry for entry in entries if "FROM workouts" in entry["statement"])
+    assert entry["route"] == "/programs/{program_id}/workouts"
+    assert entry["duration_ms"] > 0
+    assert "int" in str(entry["parameters"]) and str(program_id) not in str(entry["parameters"])
+    assert any("workouts" in line for line in entry["plan"])
+
+
+def test_parameters_shape_hides_values():
+    assert metrics.parameters_shape({"id": 5, "name": "secret"}) == {"id": "int", "name": "str"}
+    assert metrics.parameters_shape((5, None)) == ["int", "NoneType"]
+    assert metrics.parameters_shape([(1, "a"), (2, "b")], executemany=True) == {"rows": 2, "first": ["int", "str"]}
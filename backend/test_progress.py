@@ -0,0 +1,241 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import crud
+import models
+
+
+@pytest.fixture
+def tracker(client, make_catalog):
+    program = make_catalog(programs=1, days=4, exercises=1)[0]
+    other = make_catalog(programs=1, days=2, exercises=1)[0]
+    user_id = client.post("/users", json={"telegram_id": "tracker"}).json()["id"]
+
+    def complete(program_id, workout_id, is_completed=True):
+        progress = client.post("/progress", json={
+            "user_id": user_id, "program_id": program_id, "workout_id": workout_id,
+        }).json()
+        client.patch(f"/progress/{progress['id']}/complete", json={"is_completed": is_completed})
+        return progress["id"]
+
+    workout_ids = [w.id for w in program.workouts]
+    return user_id, program.id, workout_ids, other, complete
+
+
+@pytest.mark.parametrize("mode", ["client", "async_client"])
+def test_program_progress_and_changes_since(request, mode, tracker, count_statements):
+    client = request.getfixturevalue(mode)
+    user_id, program_id, workout_ids, other, complete = tracker
+    url = f"/users/{user_id}/programs/{program_id}/progress"
+
+    complete(program_id, workout_ids[0])
+    complete(program_id, workout_ids[1])
+    complete(other.id, other.workouts[0].id)  # другая программа в ответ не попадает
+
+    before = count_statements.count
+    full = client.get(url).json()
+    if mode == "client":  # счётчик подключён только к синхронному движку
+        assert count_statements.count - before == 2
+    assert sorted(full["completed_workout_ids"]) == workout_ids[:2]
+    assert (full["completed_count"], full["total_workouts"]) == (2, 4)
+
+    # Без изменений — пустая дельта и тот же курсор
+    unchanged = client.get(url, params={"since": full["cursor"]}).json()
+    assert unchanged["completed_workout_ids"] == unchanged["uncompleted_workout_ids"] == []
+    assert unchanged["cursor"] == full["cursor"] and not unchanged["full"]
+
+    progress_id = complete(program_id, workout_ids[2])
+    changed = client.get(url, params={"since": full["cursor"]}).json()
+    assert changed["completed_workout_ids"] == [workout_ids[2]]
+    assert changed["completed_count"] == 3
+
+    client.patch(f"/progress/{progress_id}/complete", json={"is_completed": False})
+    reset = client.get(url, params={"since": changed["cursor"]}).json()
+    assert reset["uncompleted_workout_ids"] == [workout_ids[2]]
+    assert reset["completed_workout_ids"] == []
+    assert reset["completed_count"] == 2
+
+
+def test_program_progress_cursor_does_not_depend_on_write_time(client, tracker, db):
+    user_id, program_id, workout_ids, other, complete = tracker
+    url = f"/users/{user_id}/programs/{program_id}/progress"
+
+    complete(program_id, workout_ids[0])
+    cursor = client.get(url).json()["cursor"]
+
+    # Запись получила время до блокировки и закоммитилась позже выданного курсора
+    progress_id = complete(program_id, workout_ids[1])
+    db.query(models.UserProgress).filter_by(id=progress_id).update({"updated_at": datetime(2000, 1, 1)})
+    db.commit()
+
+    changed = client.get(url, params={"since": cursor}).json()
+    assert changed["completed_workout_ids"] == [workout_ids[1]]
+    assert not changed["full"] and changed["cursor"] > cursor
+
+
+def test_program_progress_after_deleted_day_is_full(client, tracker):
+    user_id, program_id, workout_ids, other, complete = tracker
+    url = f"/users/{user_id}/programs/{program_id}/progress"
+
+    complete(program_id, workout_ids[0])
+    complete(program_id, workout_ids[1])
+    cursor = client.get(url).json()["cursor"]
+
+    assert client.delete(f"/workouts/{workout_ids[1]}").status_code == 200
+    after_delete = client.get(url, params={"since": cursor}).json()
+    assert after_delete["full"]
+    assert after_delete["completed_workout_ids"] == [workout_ids[0]]
+    assert (after_delete["completed_count"], after_delete["total_workouts"]) == (1, 3)
+
+    # Курсор из полного ответа снова дает дельты
+    unchanged = client.get(url, params={"since": after_delete["cursor"]}).json()
+    assert not unchanged["full"] and unchanged["completed_workout_ids"] == []
+
+    # Программа удалена целиком: курсор больше ни к чему не относится
+    assert client.delete(f"/programs/{program_id}").status_code == 200
+    gone = client.get(url, params={"since": cursor}).json()
+    assert gone["full"] and gone["completed_workout_ids"] == [] and gone["cursor"] is None
+
+
+def test_program_progress_for_unknown_user_is_empty(client, make_catalog):
+    program = make_catalog(programs=1, days=3)[0]
+    progress = client.get(f"/users/999/programs/{program.id}/progress").json()
+    assert progress["completed_workout_ids"] == []
+    assert (progress["completed_count"], progress["total_workouts"], progress["cursor"]) == (0, 3, None)
+
+
+@pytest.mark.parametrize("mode", ["client", "async_client"])
+def test_progress_upsert_is_idempotent(request, mode, make_catalog, count_statements):
+    client = request.getfixturevalue(mode)
+    program = make_catalog(programs=1, days=2)[0]
+    user_id = client.post("/users", json={"telegram_id": "upsert"}).json()["id"]
+    body = {"user_id": user_id, "program_id": program.id, "workout_id": program.workouts[0].id}
+
+    created = client.post("/progress", json=body).json()
+    before = count_statements.count
+    completed = client.post("/progress", json={**body, "is_completed": True}).json()
+    if mode == "client":  # программа дня, ревизия пары, upsert, затем пересчет сводки: выборка дат и upsert строки
+        assert count_statements.count - before == 5
+    assert completed["id"] == created["id"]
+    assert completed["is_completed"] and completed["completed_at"]
+
+    # Повторная отметка не сдвигает время выполнения
+    again = client.post("/progress", json={**body, "is_completed": True}).json()
+    assert again["completed_at"] == completed["completed_at"]
+
+    reset = client.post("/progress", json={**body, "is_completed": False}).json()
+    assert (reset["is_completed"], reset["completed_at"]) == (False, None)
+    assert len(client.get(f"/users/{user_id}/progress").json()) == 1
+
+
+def test_progress_create_without_status_keeps_completion(client, make_catalog):
+    program = make_catalog(programs=1, days=2)[0]
+    user_id = client.post("/users", json={"telegram_id": "onboarding"}).json()["id"]
+    body = {"user_id": user_id, "program_id": program.id, "workout_id": program.workouts[0].id}
+
+    created = client.post("/progress", json=body).json()
+    assert (created["is_completed"], created["completed_at"]) == (False, None)
+    completed = client.post("/progress", json={**body, "is_completed": True}).json()
+
+    # Повторный онбординг в ту же программу создает запись первого дня без отметки
+    again = client.post("/progress", json=body).json()
+    assert again["id"] == completed["id"]
+    assert (again["is_completed"], again["completed_at"]) == (True, completed["completed_at"])
+    stats = client.get(f"/users/{user_id}/programs/{program.id}/stats").json()
+    assert stats["completed_days"] == 1
+
+
+def test_progress_upsert_rejects_unknown_references(client, make_catalog):
+    program = make_catalog(programs=1, days=1)[0]
+    user_id = client.post("/users", json={"telegram_id": "fk"}).json()["id"]
+    body = {"user_id": user_id, "program_id": program.id, "workout_id": program.workouts[0].id}
+
+    assert client.post("/progress", json={**body, "user_id": 999}).status_code == 404
+    assert client.post("/progress", json={**body, "program_id": 999}).status_code == 404
+    assert client.post("/progress", json={**body, "workout_id": 999}).status_code == 404
+    assert client.post("/progress", json=body).status_code == 200
+
+
+def test_progress_upsert_rejects_workout_from_another_program(client, make_catalog):
+    first, second = make_catalog(programs=2, days=1)
+    user_id = client.post("/users", json={"telegram_id": "moved"}).json()["id"]
+    body = {"user_id": user_id, "program_id": first.id, "workout_id": first.workouts[0].id, "is_completed": True}
+    client.post("/progress", json=body)
+
+    # Запись не должна переехать к паре (user, second), оставив сводку first устаревшей
+    response = client.post("/progress", json={**body, "program_id": second.id})
+    assert response.status_code == 404
+    assert [p["program_id"] for p in client.get(f"/users/{user_id}/progress").json()] == [first.id]
+    assert client.get(f"/users/{user_id}/programs/{first.id}/stats").json()["completed_days"] == 1
+    assert client.get(f"/users/{user_id}/programs/{second.id}/progress").json()["completed_count"] == 0
+
+
+def test_dedup_migration(db, make_catalog):
+    import migrations
+    from database import engine
+
+    program = make_catalog(programs=1, days=2)[0]
+    user = models.User(telegram_id="dup")
+    db.add(user)
+    db.commit()
+    first, second = [w.id for w in program.workouts]
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX uq_user_progress_user_workout")
+        for workout_id, is_completed, completed_at in [
+            (first, 0, None), (first, 1, "2024-01-02 00:00:00.000000"), (first, 1, "2024-01-03 00:00:00.000000"),
+            (second, 0, None),
+        ]:
+            conn.exec_driver_sql(
+                "INSERT INTO user_progress (user_id, program_id, workout_id, is_completed, completed_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, '2024-01-04 00:00:00.000000')",
+                (user.id, program.id, workout_id, is_completed, completed_at),
+            )
+
+    migrations.dedup_progress(engine, batch_size=2)
+
+    rows = db.query(models.UserProgress).order_by(models.UserProgress.workout_id).all()
+    assert [(r.workout_id, r.is_completed) for r in rows] == [(first, True), (second, False)]
+    assert rows[0].completed_at.day == 2
+
+
+def test_program_stats(client, make_catalog, db):
+    program = make_catalog(programs=1, days=5)[0]
+    user_id = client.post("/users", json={"telegram_id": "stats"}).json()["id"]
+    url = f"/users/{user_id}/programs/{program.id}/stats"
+
+    empty = client.get(url).json()
+    assert (empty["completed_days"], empty["total_days"], empty["current_streak"]) == (0, 5, 0)
+    assert client.get(f"/users/{user_id}/programs/999/stats").status_code == 404
+
+    progress_ids = [
+        client.post("/progress", json={
+            "user_id": user_id, "program_id": program.id, "workout_id": w.id, "is_completed": True,
+        }).json()["id"]
+        for w in program.workouts[:4]
+    ]
+    today = client.get(url).json()
+    assert (today["completed_days"], today["current_streak"], today["longest_streak"]) == (4, 1, 1)
+
+    # История: три дня подряд неделю назад, затем вчера и сегодня
+    now = datetime.utcnow()
+    for progress_id, days_ago in zip(progress_ids, [8, 7, 6, 1]):
+        db.query(models.UserProgress).filter_by(id=progress_id).update({"completed_at": now - timedelta(days=days_ago)})
+    db.commit()
+    crud.refresh_program_stats(db, [(user_id, program.id)])
+    db.commit()
+
+    stats = client.get(url).json()
+    assert (stats["completed_days"], stats["current_streak"], stats["longest_streak"]) == (4, 1, 3)
+
+    client.patch(f"/progress/{progress_ids[1]}/complete", json={"is_completed": False})
+    client.post("/progress", json={
+        "user_id": user_id, "program_id": program.id, "workout_id": program.workouts[4].id, "is_completed": True,
+    })
+    stats = client.get(url).json()
+    assert (stats["completed_days"], stats["current_streak"], stats["longest_streak"]) == (4, 2, 2)
+
+    client.delete(f"/workouts/{program.workouts[4].id}")
+    stats = client.get(url).json()
+    assert (stats["completed_days"], stats["total_days"], stats["current_streak"]) == (3, 4, 1)
@@ -0,0 +1,177 @@
+from typing import List
+
+import orjson
+import pytest
+from pydantic import TypeAdapter
+
+from database import engine
+
+import crud
+import models
+import schemas
+
+
+def _serialize_programs(programs):
+    return TypeAdapter(List[schemas.WorkoutProgram]).dump_python(programs)
+
+
+def _statements_for(db, count_statements, fn):
+    db.expire_all()
+    before = count_statements.count
+    fn()
+    return count_statements.count - before
+
+
+def test_get_programs_statement_count_is_constant(db, make_catalog, count_statements):
+    make_catalog(programs=1, days=2, exercises=2)
+    small = _statements_for(db, count_statements, lambda: _serialize_programs(crud.get_programs(db)))
+
+    make_catalog(programs=20, days=5, exercises=4)
+    large = _statements_for(db, count_statements, lambda: _serialize_programs(crud.get_programs(db)))
+
+    assert small == large == 3
+
+
+def test_get_program_statement_count_is_constant(db, make_catalog, count_statements):
+    small_id = make_catalog(programs=1, days=1, exercises=1)[0].id
+    large_id = make_catalog(programs=1, days=30, exercises=8)[0].id
+
+    def load(program_id):
+        program = crud.get_program(db, program_id)
+        return schemas.WorkoutProgram.model_validate(program)
+
+    small = _statements_for(db, count_statements, lambda: load(small_id))
+    large = _statements_for(db, count_statements, lambda: load(large_id))
+
+    assert small == large == 3
+
+
+def test_get_program_workouts_statement_count_is_constant(db, make_catalog, count_statements):
+    small_id = make_catalog(programs=1, days=1)[0].id
+    large_id = make_catalog(programs=1, days=30, exercises=8)[0].id
+
+    def load(program_id):
+        workouts = crud.get_program_workouts(db, program_id)
+        return TypeAdapter(List[schemas.Workout]).dump_python(workouts)
+
+    small = _statements_for(db, count_statements, lambda: load(small_id))
+    large = _statements_for(db, count_statements, lambda: load(large_id))
+
+    assert small == large == 2
+    assert [w["day_number"] for w in load(large_id)] == list(range(1, 31))
+
+
+def test_program_summaries_counts(db, make_catalog, count_statements):
+    make_catalog(programs=1, days=3, exercises=2)
+    make_catalog(programs=1, days=0)
+    db.expire_all()
+
+    before = count_statements.count
+    summaries = crud.get_program_summaries(db)
+    assert count_statements.count - before == 1
+
+    first, empty = [schemas.WorkoutProgramSummary.model_validate(row) for row in summaries]
+    assert (first.days_count, first.exercises_count, first.total_sets) == (3, 6, 18)
+    assert (empty.days_count, empty.exercises_count, empty.total_sets) == (0, 0, 0)
+
+
+def test_documents_serialize_exactly_like_schemas(db, make_catalog):
+    make_catalog(programs=3, days=3, exercises=2)
+    make_catalog(programs=1, days=0)
+
+    def dump(schema, data):
+        adapter = TypeAdapter(schema)
+        return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+    assert orjson.dumps(crud.get_program_documents(db)) == dump(List[schemas.WorkoutProgram], crud.get_programs(db))
+    assert orjson.dumps(crud.get_program_documents(db, after_id=1, limit=2)) == dump(
+        List[schemas.WorkoutProgram], crud.get_programs(db, after_id=1, limit=2)
+    )
+    assert orjson.dumps(crud.get_program_document(db, 2)) == dump(schemas.WorkoutProgram, crud.get_program(db, 2))
+    assert orjson.dumps(crud.get_program_workout_documents(db, 2)) == dump(
+        List[schemas.Workout], crud.get_program_workouts(db, 2)
+    )
+    assert orjson.dumps(crud.get_workout_document(db, 4)) == dump(schemas.Workout, crud.get_workout(db, 4))
+    assert orjson.dumps(crud.get_program_summary_documents(db)) == dump(
+        List[schemas.WorkoutProgramSummary], crud.get_program_summaries(db)
+    )
+    assert crud.get_program_document(db, 999) is None
+    assert crud.get_workout_document(db, 999) is None
+
+
+def test_program_documents_statement_count_is_constant(db, make_catalog, count_statements, monkeypatch):
+    monkeypatch.setattr(crud, "IN_BATCH_SIZE", 10)
+    make_catalog(programs=1, days=2, exercises=2)
+    small = _statements_for(db, count_statements, lambda: crud.get_program_documents(db, limit=10))
+
+    make_catalog(programs=20, days=5, exercises=4)
+    large = _statements_for(db, count_statements, lambda: crud.get_program_documents(db, limit=10))
+    # Дней у 10 программ 46 — упражнения грузятся пятью порциями IN по 10
+    assert small == 3
+    assert large == 1 + 1 + 5
+    assert len(crud.get_program_documents(db)) == 21
+
+
+def test_program_search_and_keyset_pagination(db, make_catalog):
+    make_catalog(programs=5)
+    db.query(models.WorkoutProgram).filter_by(id=3).update({"name": "Силовая для НАЧИНАЮЩИХ"})
+    db.commit()
+
+    assert [p.id for p in crud.get_programs(db, search="начинающих")] == [3]
+    assert [p.id for p in crud.get_program_summaries(db, search="сил")] == [3]
+    assert crud.get_programs(db, search="нет такой") == []
+    # Короткие запросы идут мимо FTS: регистр кириллицы складывается так же
+    assert [p.id for p in crud.get_programs(db, search="си")] == [3]
+    assert [p.id for p in crud.get_programs(db, search="нА")] == [3]
+
+    db.query(models.WorkoutProgram).filter_by(id=4).update({"name": "100% кардио"})
+    db.commit()
+    assert [p.id for p in crud.get_programs(db, search="%")] == [4]
+    assert crud.get_programs(db, search="_") == []
+
+    first_page = crud.get_program_summaries(db, limit=2)
+    second_page = crud.get_program_summaries(db, after_id=first_page[-1].id, limit=2)
+    assert [p.id for p in first_page] == [1, 2]
+    assert [p.id for p in second_page] == [3, 4]
+
+
+def _query_plan(statement, parameters):
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+
+
+def _is_scan(detail):
+    # Поиск по FTS5 отображается как SCAN виртуальной таблицы с MATCH-индексом
+    return detail.startswith("SCAN ") and "VIRTUAL TABLE INDEX" not in detail
+
+
+@pytest.mark.parametrize("name, call", [
+    ("get_programs_filtered", lambda db: crud.get_programs(db, difficulty="beginner", goal="weight_loss", location="home")),
+    ("get_programs_search", lambda db: crud.get_programs(db, search="Программа")),
+    ("get_program", lambda db: crud.get_program(db, 1)),
+    ("get_program_workouts", lambda db: crud.get_program_workouts(db, 1)),
+    ("get_program_documents", lambda db: crud.get_program_documents(db, after_id=0, limit=20)),
+    ("get_program_workout_documents", lambda db: crud.get_program_workout_documents(db, 1)),
+    ("get_workout_document", lambda db: crud.get_workout_document(db, 1)),
+    ("get_program_summaries_page", lambda db: crud.get_program_summaries(db, after_id=0, limit=20)),
+    ("get_program_summaries_filtered", lambda db: crud.get_program_summaries(db, difficulty="beginner", goal="weight_loss", location="home")),
+    ("get_user_progress", lambda db: crud.get_user_progress(db, 1)),
+    ("get_user_progress_documents", lambda db: crud.get_user_progress_documents(db, 1)),
+    ("get_user_program_progress", lambda db: crud.get_user_program_progress(db, 1, 1)),
+    ("get_program_stats", lambda db: crud.get_program_stats(db, 1, 1)),
+    ("get_user_program_progress_since", lambda db: crud.get_user_program_progress(db, 1, 1, since=0)),
+    ("delete_workout", lambda db: crud.delete_workout(db, 1)),
+    ("delete_program", lambda db: crud.delete_program(db, 2)),
+])
+def test_hot_paths_use_indexes(db, make_catalog, count_statements, name, call):
+    make_catalog(programs=3, days=2, exercises=2)
+
+    before = count_statements.count
+    call(db)
+    executed = count_statements.executed[before:]
+    assert executed
+
+    for statement, parameters in executed:
+        plan = _query_plan(statement, parameters)
+        scans = [detail for detail in plan if _is_scan(detail)]
+        assert not scans, f"{name}: full scan in plan {plan} for {statement}"
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cache import UserCache
+import models
+
+
+def test_user_cache_is_bounded_lru():
+    cache = UserCache(max_entries=2)
+    cache.set("1", "a")
+    cache.set("2", "b")
+    assert cache.get("1") == "a"
+    cache.set("3", "c")
+    assert cache.get("2") is None
+    assert len(cache) == 2
+
+
+@pytest.mark.parametrize("mode", ["client", "async_client"])
+def test_resolve_creates_once_then_serves_from_memory(request, mode, count_statements):
+    client = request.getfixturevalue(mode)
+
+    created = client.post("/users/resolve", json={"telegram_id": "777"})
+    assert created.status_code == 200
+
+    before = count_statements.count
+    again = client.post("/users/resolve", json={"telegram_id": "777"}).json()
+    assert client.get("/users/777").json() == again == created.json()
+    assert count_statements.count == before
+
+
+def test_concurrent_resolve_creates_single_user(client, db):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(
+            lambda _: client.post("/users/resolve", json={"telegram_id": "race"}), range(16)
+        ))
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert db.query(models.User).filter_by(telegram_id="race").count() == 1
+
+
+def test_create_user_still_rejects_duplicates(client):
+    assert client.post("/users", json={"telegram_id": "dup"}).status_code == 200
+    assert client.post("/users", json={"telegram_id": "dup"}).status_code == 400
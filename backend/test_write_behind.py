@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+
+from write_behind import ProgressNotFlushed, ProgressWriteBehind, write_completions
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_events_are_grouped_into_batches():
+    batches = []
+
+    async def writer(batch):
+        batches.append([event.progress_id for event in batch])
+
+    async def scenario():
+        queue = ProgressWriteBehind(enabled=True, interval_ms=20, max_events=3, writer=writer)
+        queue.start()
+        for progress_id in range(1, 5):
+            queue.submit(progress_id, user_id=1, is_completed=True)
+        await asyncio.sleep(0.05)
+        stats = queue.stats()
+        await queue.close()
+        return stats
+
+    stats = run(scenario())
+    # Три события записываются сразу по лимиту, оставшееся — по таймеру
+    assert batches == [[1, 2, 3], [4]]
+    assert (stats["flushes"], stats["events_flushed"], stats["queue_depth"]) == (2, 4, 0)
+
+
+def test_wait_for_user_flushes_immediately_and_close_drains():
+    batches = []
+
+    async def writer(batch):
+        batches.append([(event.user_id, event.progress_id) for event in batch])
+
+    async def scenario():
+        queue = ProgressWriteBehind(enabled=True, interval_ms=10_000, max_events=100, writer=writer)
+        queue.start()
+        queue.submit(1, user_id=1, is_completed=True)
+        await asyncio.wait_for(queue.wait_for_user(1), 1)
+        flushed_for_user = list(batches)
+        queue.submit(2, user_id=2, is_completed=False)
+        await queue.close()
+        return flushed_for_user
+
+    assert run(scenario()) == [[(1, 1)]]
+    assert batches == [[(1, 1)], [(2, 2)]]
+
+
+def test_failed_flush_is_retried():
+    attempts = []
+
+    async def writer(batch):
+        attempts.append(len(batch))
+        if len(attempts) == 1:
+            raise RuntimeError("database is locked")
+
+    async def scenario():
+        queue = ProgressWriteBehind(enabled=True, interval_ms=5, max_events=10, writer=writer)
+        queue.start()
+        queue.submit(1, user_id=1, is_completed=True)
+        queue.submit(2, user_id=1, is_completed=True)
+        await asyncio.wait_for(queue.wait_for_user(1), 1)
+        stats = queue.stats()
+        await queue.close()
+        return stats
+
+    stats = run(scenario())
+    assert attempts == [2, 2]
+    assert (stats["errors"], stats["events_flushed"]) == (1, 2)
+
+
+def test_wait_for_user_gives_up_when_flushes_keep_failing():
+    async def writer(batch):
+        raise RuntimeError("database is locked")
+
+    async def scenario():
+        queue = ProgressWriteBehind(enabled=True, interval_ms=5, max_events=10, writer=writer, read_timeout_ms=50)
+        queue.start()
+        queue.submit(1, user_id=1, is_completed=True)
+        with pytest.raises(ProgressNotFlushed):
+            await asyncio.wait_for(queue.wait_for_user(1), 1)
+        await queue.wait_for_user(2)  # у других пользователей ждать нечего
+        stats = queue.stats()
+        queue._events.clear()  # иначе close повторял бы запись
+        await queue.close()
+        return stats
+
+    stats = run(scenario())
+    assert stats["read_timeouts"] == 1 and stats["errors"] >= 1 and stats["queue_depth"] == 1
+
+
+@pytest.fixture
+def write_behind_client(db, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from cache import catalog_cache, user_cache
+    import main
+
+    monkeypatch.setattr(main.progress_writer, "enabled", True)
+    monkeypatch.setattr(main.progress_writer, "interval", 60)  # только по запросу чтения или при остановке
+    catalog_cache.clear()
+    user_cache.clear()
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def test_completion_is_visible_to_the_same_user(write_behind_client, make_catalog, db):
+    import models
+
+    client = write_behind_client
+    program = make_catalog(programs=1, days=2)[0]
+    user_id = client.post("/users", json={"telegram_id": "wb"}).json()["id"]
+    progress_ids = [
+        client.post("/progress", json={"user_id": user_id, "program_id": program.id, "workout_id": w.id}).json()["id"]
+        for w in program.workouts
+    ]
+
+    for progress_id in progress_ids:
+        response = client.patch(f"/progress/{progress_id}/complete", json={"is_completed": True})
+        assert response.json()["is_completed"] and response.json()["completed_at"]
+    assert client.patch("/progress/999/complete", json={"is_completed": True}).status_code == 404
+
+    metrics = client.get("/metrics/progress-writer").json()
+    assert (metrics["queue_depth"], metrics["flushes"]) == (2, 0)
+    assert db.query(models.UserProgress).filter_by(is_completed=True).count() == 0
+
+    progress = client.get(f"/users/{user_id}/programs/{program.id}/progress").json()
+    assert progress["completed_count"] == 2
+    metrics = client.get("/metrics/progress-writer").json()
+    assert (metrics["queue_depth"], metrics["flushes"], metrics["events_flushed"]) == (0, 1, 2)
+
+
+def test_progress_read_is_503_while_flush_fails(write_behind_client, make_catalog, monkeypatch):
+    import main
+
+    async def failing_writer(batch):
+        raise RuntimeError("database is locked")
+
+    client = write_behind_client
+    program = make_catalog(programs=1, days=1)[0]
+    user_id = client.post("/users", json={"telegram_id": "wb-fail"}).json()["id"]
+    progress_id = client.post(
+        "/progress", json={"user_id": user_id, "program_id": program.id, "workout_id": program.workouts[0].id}
+    ).json()["id"]
+
+    monkeypatch.setattr(main.progress_writer, "writer", failing_writer)
+    monkeypatch.setattr(main.progress_writer, "read_timeout", 0.05)
+    client.patch(f"/progress/{progress_id}/complete", json={"is_completed": True})
+
+    response = client.get(f"/users/{user_id}/programs/{program.id}/progress")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert client.get("/metrics/progress-writer").json()["read_timeouts"] == 1
+
+    # При остановке очередь записывается обычным способом
+    monkeypatch.setattr(main.progress_writer, "writer", write_completions)
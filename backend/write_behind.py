@@ -0,0 +1,207 @@
+"""
+Отложенная запись отметок выполнения тренировок (write-behind).
+
+В режиме PROGRESS_WRITE_BEHIND=1 обработчик PATCH /progress/{id}/complete не
+коммитит изменение сам: событие попадает в очередь процесса, а фоновая задача
+записывает накопившиеся события одной транзакцией каждые
+PROGRESS_FLUSH_INTERVAL_MS миллисекунд или сразу по набору
+PROGRESS_FLUSH_MAX_EVENTS событий.
+
+Чтение прогресса пользователя сначала дожидается записи его событий
+(wait_for_user), поэтому пользователь всегда видит свои изменения. Ожидание
+ограничено PROGRESS_READ_TIMEOUT_MS: если запись не удается (база
+заблокирована, ошибки повторяются), чтение получает 503, а не висит. При
+остановке приложения очередь записывается целиком. Ошибка записи возвращает
+батч в начало очереди: UPDATE по id с абсолютными значениями можно безопасно
+повторить.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import suppress
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_WRITE_BEHIND = os.getenv("PROGRESS_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+PROGRESS_FLUSH_INTERVAL_MS = float(os.getenv("PROGRESS_FLUSH_INTERVAL_MS", "50"))
+PROGRESS_FLUSH_MAX_EVENTS = int(os.getenv("PROGRESS_FLUSH_MAX_EVENTS", "200"))
+PROGRESS_READ_TIMEOUT_MS = float(os.getenv("PROGRESS_READ_TIMEOUT_MS", "2000"))
+
+
+class ProgressNotFlushed(asyncio.TimeoutError):
+    """События пользователя не записаны в БД за PROGRESS_READ_TIMEOUT_MS."""
+
+
+class CompletionEvent(NamedTuple):
+    seq: int
+    progress_id: int
+    user_id: int
+    is_completed: bool
+    completed_at: Optional[datetime]
+    updated_at: datetime
+
+
+async def write_completions(events: List[CompletionEvent]):
+    """Запись батча через ту же сессию, что и у обработчиков (sync или async режим)."""
+    from database import run_in_session
+    import crud
+
+    await run_in_session(crud.apply_progress_completions, [event._asdict() for event in events])
+
+
+class ProgressWriteBehind:
+    def __init__(
+        self,
+        enabled: bool = PROGRESS_WRITE_BEHIND,
+        interval_ms: float = PROGRESS_FLUSH_INTERVAL_MS,
+        max_events: int = PROGRESS_FLUSH_MAX_EVENTS,
+        writer: Callable[[List[CompletionEvent]], Awaitable[None]] = write_completions,
+        read_timeout_ms: float = PROGRESS_READ_TIMEOUT_MS,
+    ):
+        self.enabled = enabled
+        self.interval = interval_ms / 1000
+        self.max_events = max_events
+        self.read_timeout = read_timeout_ms / 1000
+        self.writer = writer
+        self._events: Deque[CompletionEvent] = deque()
+        self._seq = 0
+        self._flushed_seq = 0
+        # user_id -> seq последнего события пользователя, еще не записанного в БД
+        self._user_seq: Dict[int, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.flushes = 0
+        self.events_flushed = 0
+        self.errors = 0
+        self.read_timeouts = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        # Примитивы asyncio создаются в цикле событий приложения
+        self._has_events = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._flushed = asyncio.Condition()
+        if self._events:
+            self._has_events.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Останавливает фоновую задачу и записывает все оставшиеся события."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        while self._events:
+            if not await self._flush_once():
+                logger.error("Progress write-behind: %d events lost on shutdown", len(self._events))
+                self._events.clear()
+                self._user_seq.clear()
+
+    def submit(self, progress_id: int, user_id: int, is_completed: bool) -> CompletionEvent:
+        now = datetime.utcnow()
+        self._seq += 1
+        event = CompletionEvent(self._seq, progress_id, user_id, is_completed, now if is_completed else None, now)
+        self._events.append(event)
+        self._user_seq[user_id] = event.seq
+        self._has_events.set()
+        if len(self._events) >= self.max_events:
+            self._flush_now.set()
+        return event
+
+    async def wait_for_user(self, user_id: int):
+        """
+        Ждет, пока события пользователя окажутся в БД (read-your-writes).
+        Не дождавшись за read_timeout, бросает ProgressNotFlushed.
+        """
+        target = self._user_seq.get(user_id)
+        if target is None or not self.running:
+            return
+        self._flush_now.set()
+
+        async def flushed():
+            async with self._flushed:
+                await self._flushed.wait_for(lambda: self._flushed_seq >= target)
+
+        try:
+            await asyncio.wait_for(flushed(), self.read_timeout)
+        except asyncio.TimeoutError:
+            self.read_timeouts += 1
+            raise ProgressNotFlushed(f"Progress of user {user_id} is not written yet") from None
+
+    async def _run(self):
+        while True:
+            await self._has_events.wait()
+            if not self._flush_now.is_set():
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._flush_now.wait(), self.interval)
+            if not await self._flush_once():
+                await asyncio.sleep(self.interval)
+
+    async def _flush_once(self) -> bool:
+        self._flush_now.clear()
+        batch = [self._events.popleft() for _ in range(min(self.max_events, len(self._events)))]
+        if not self._events:
+            self._has_events.clear()
+        elif len(self._events) >= self.max_events:
+            self._flush_now.set()
+        if not batch:
+            return True
+
+        started = time.perf_counter()
+        try:
+            await self.writer(batch)
+        except BaseException as e:
+            self._events.extendleft(reversed(batch))
+            self._has_events.set()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.errors += 1
+            logger.exception("Progress write-behind flush of %d events failed", len(batch))
+            return False
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.events_flushed += len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+        async with self._flushed:
+            self._flushed_seq = batch[-1].seq
+            for event in batch:
+                if self._user_seq.get(event.user_id, 0) <= self._flushed_seq:
+                    self._user_seq.pop(event.user_id, None)
+            self._flushed.notify_all()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queue_depth": len(self._events),
+            "pending_users": len(self._user_seq),
+            "flushes": self.flushes,
+            "events_flushed": self.events_flushed,
+            "errors": self.errors,
+            "read_timeouts": self.read_timeouts,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_batch_size": round(self.events_flushed / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+
+progress_writer = ProgressWriteBehind()
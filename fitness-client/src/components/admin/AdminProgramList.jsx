@@ -7,12 +7,16 @@ import Loader from '../ui/Loader';
 import './AdminForms.css';
 import './AdminProgramList.css';
 
+const PAGE_SIZE = 50;
+
 const AdminProgramList = () => {
   const navigate = useNavigate();
   const [searchParams, setSearchParams] = useSearchParams();
 
   // --- Состояния данных ---
   const [programs, setPrograms] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
@@ -46,24 +50,31 @@ const AdminProgramList = () => {
   };
 
   // --- Загрузка данных ---
+  // Поиск и фильтрация выполняются на сервере, список загружается страницами
+  const fetchPage = async (afterId = null) => {
+    const params = { limit: PAGE_SIZE };
+    if (search) params.search = search;
+    if (difficulty) params.difficulty = difficulty;
+    if (goal) params.goal = goal;
+    if (location) params.location = location;
+    if (afterId) params.after_id = afterId;
+
+    const response = await api.get('/programs/summary', { params });
+
+    // Предполагаем, что бэкенд возвращает массив
+    let data = response.data;
+    if (!Array.isArray(data)) data = [];
+
+    return { data, cursor: response.headers['x-next-cursor'] || null };
+  };
+
   useEffect(() => {
     const fetchPrograms = async () => {
       setLoading(true);
       try {
-        // Собираем параметры для запроса
-        const params = {};
-        if (search) params.search = search;
-        if (difficulty) params.difficulty = difficulty;
-        if (goal) params.goal = goal;
-        if (location) params.location = location;
-
-        const response = await api.get('/programs', { params });
-        
-        // Предполагаем, что бэкенд возвращает массив
-        let data = response.data;
-        if (!Array.isArray(data)) data = [];
-
+        const { data, cursor } = await fetchPage();
         setPrograms(data);
+        setNextCursor(cursor);
         setError(null);
       } catch (err) {
         console.error(err);
@@ -73,13 +84,27 @@ const AdminProgramList = () => {
       }
     };
 
-    // Небольшая задержка для поиска (debounce эффект можно сделать через setTimeout, но здесь упростим)
-    // Для реального debounce лучше вынести в отдельную логику
+    // Небольшая задержка, чтобы не отправлять запрос на каждое нажатие клавиши
     const timer = setTimeout(fetchPrograms, 300); 
     
     return () => clearTimeout(timer);
   }, [search, difficulty, goal, location]);
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const { data, cursor } = await fetchPage(nextCursor);
+      setPrograms((prev) => [...prev, ...data]);
+      setNextCursor(cursor);
+    } catch (err) {
+      console.error(err);
+      setError('Не удалось загрузить программы');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // --- Обработчики фильтров ---
   const updateFilters = (key, value) => {
     // Обновляем локальный стейт
@@ -133,11 +158,7 @@ const AdminProgramList = () => {
 
   // --- Вычисляемые значения для статистики ---
   const getStats = (program) => {
-    const daysCount = program.workouts ? program.workouts.length : 0;
-    const exCount = program.workouts
-      ? program.workouts.reduce((acc, day) => acc + (day.exercises ? day.exercises.length : 0), 0)
-      : 0;
-    return `${daysCount} дн. • ${exCount} упр.`;
+    return `${program.days_count || 0} дн. • ${program.exercises_count || 0} упр.`;
   };
 
   if (loading) return <Loader />;
@@ -285,6 +306,14 @@ const AdminProgramList = () => {
         </div>
       )}
 
+      {nextCursor && (
+        <div className="filters-actions">
+          <Button variant="secondary" onClick={loadMore} isLoading={loadingMore}>
+            Показать ещё
+          </Button>
+        </div>
+      )}
+
       {/* Модальное окно подтверждения удаления */}
       {deleteModal.isOpen && (
         <div className="modal-overlay" onClick={() => setDeleteModal({ isOpen: false, program: null })}>
@@ -128,13 +128,8 @@ const OnboardingForm = () => {
     localStorage.setItem('onboardingFormData', JSON.stringify(formData));
 
     try {
-      // 2. Вызов API (GET /programs с параметрами фильтрации)
-      // Ваш api.js настроен так, что matchProgram делает запрос к '/programs'
-      const response = await matchProgram(formData);
-      
-      // 3. Логика обработки ответа от бэкенда
-      // Ожидаем, что бэкенд вернет массив программ: [ {id: 1, ...}, {id: 2, ...} ]
-      const programs = response.data || response; // axios обычно кладет данные в .data, но для надежности проверим оба варианта
+      // 2. Подбор программы на бэкенде (GET /programs/match)
+      const programs = await matchProgram(formData);
       
       console.log('Matched programs:', programs);
 
@@ -146,13 +141,17 @@ const OnboardingForm = () => {
         // Создаем запись прогресса для пользователя
         if (currentUser) {
           try {
-            // Создаем пустую запись прогресса для выбранной программы
-            await api.post('/progress', {
-              user_id: currentUser.id,
-              program_id: programId,
-              workout_id: selectedProgram.workouts?.[0]?.id || 1, // Первая тренировка или дефолтная
-              is_completed: false
-            });
+            // Создаем пустую запись прогресса для первого дня выбранной программы.
+            // is_completed не передаем: при повторном онбординге отметка дня сохранится
+            const workoutsResponse = await api.get(`/workouts/${programId}`);
+            const firstWorkout = [...workoutsResponse.data].sort((a, b) => a.day_number - b.day_number)[0];
+            if (firstWorkout) {
+              await api.post('/progress', {
+                user_id: currentUser.id,
+                program_id: programId,
+                workout_id: firstWorkout.id
+              });
+            }
             console.log('Progress record created for user:', currentUser.id);
           } catch (progressErr) {
             // Игнорируем ошибку если запись уже существует
@@ -11,14 +11,13 @@ const api = axios.create({
   },
 });
 
-// Эндпоинт для подбора программы (предполагаемая логика бэкенда)
-export const matchProgram = async (params) => {
-  // Примечание: На бэкенде эндпоинт должен фильтровать программы по этим параметрам
-  // и возвращать наиболее подходящую ID или сам объект программы.
-  const response = await api.get('/programs', { params }); 
-  // Для примера вернем первую найденную программу, удовлетворяющую условиям,
-  // или список программ. В реальном приложении здесь должна быть сложная логика.
-  return response.data;
+// Подбор программы на бэкенде: полные совпадения по difficulty/goal/location,
+// затем частичные по убыванию score. Возвращает список программ, лучшие первыми.
+export const matchProgram = async ({ difficulty, goal, location }) => {
+  const response = await api.get('/programs/match', {
+    params: { difficulty, goal, location },
+  });
+  return response.data.map(match => match.program);
 };
 
 export default api;
\ No newline at end of file
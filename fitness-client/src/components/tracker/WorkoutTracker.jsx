@@ -1,6 +1,7 @@
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
 import { useParams, useNavigate, useLocation } from 'react-router-dom';
 import api from '../services/api';
+import { useTelegramAuth } from '../../context/TelegramAuthContext';
 import Card from '../ui/Card';
 import Loader from '../ui/Loader';
 import DayCard from './DayCard';
@@ -12,6 +13,8 @@ const WorkoutTracker = () => {
   const { programId } = useParams();
   const navigate = useNavigate();
   const location = useLocation(); // Нужно, чтобы отследить возврат со страницы деталей
+  const { takeBootstrap, currentUser } = useTelegramAuth();
+  const userId = currentUser?.id ?? CURRENT_USER_ID;
   
   const [workouts, setWorkouts] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -20,23 +23,31 @@ const WorkoutTracker = () => {
   // Состояние для выполненных дней (хранит список ID тренировок)
   const [completedWorkouts, setCompletedWorkouts] = useState([]);
 
+  // Курсор последнего ответа: повторные запросы получают только изменившиеся дни
+  const progressCursor = useRef(null);
+
   // Функция загрузки прогресса
   const loadProgress = async () => {
     try {
-      // Запрашиваем прогресс у сервера
-      const response = await api.get(`/users/${CURRENT_USER_ID}/progress`);
-      const progressList = response.data;
-      
-      // Фильтруем только те записи, которые относятся к ТЕКУЩЕЙ программе
-      // (Вдруг у пользователя есть прогресс в других программах)
-      const relevantProgress = progressList.filter(p => p.program_id === parseInt(programId));
-      
-      // Создаем массив просто из ID выполненных тренировок
-      const completedIds = relevantProgress
-        .filter(p => p.is_completed)
-        .map(p => p.workout_id);
-        
-      setCompletedWorkouts(completedIds);
+      // Сервер сам отбирает записи ТЕКУЩЕЙ программы и возвращает только id дней
+      const params = progressCursor.current != null ? { since: progressCursor.current } : {};
+      const response = await api.get(
+        `/users/${userId}/programs/${programId}/progress`,
+        { params }
+      );
+      const { completed_workout_ids, uncompleted_workout_ids, cursor, full } = response.data;
+
+      if (full) {
+        // Полное состояние (например, после удаления дней) заменяет известное
+        setCompletedWorkouts(completed_workout_ids);
+      } else {
+        // Применяем дельту к уже известному списку
+        setCompletedWorkouts(prev => [
+          ...prev.filter(id => !uncompleted_workout_ids.includes(id) && !completed_workout_ids.includes(id)),
+          ...completed_workout_ids,
+        ]);
+      }
+      progressCursor.current = cursor;
     } catch (err) {
       console.error("Не удалось загрузить прогресс", err);
     }
@@ -45,6 +56,17 @@ const WorkoutTracker = () => {
   // Основная загрузка данных (тренировки + прогресс)
   useEffect(() => {
     const loadData = async () => {
+      // Дни и прогресс этой программы уже пришли в /bootstrap при запуске —
+      // только для первого открытия, дальше трекер загружает их сам
+      const bootstrap = takeBootstrap(parseInt(programId));
+      if (bootstrap) {
+        setWorkouts([...bootstrap.workouts].sort((a, b) => a.day_number - b.day_number));
+        setCompletedWorkouts(bootstrap.progress.completed_workout_ids);
+        progressCursor.current = bootstrap.progress.cursor;
+        setLoading(false);
+        return;
+      }
+
       try {
         setLoading(true);
 
@@ -62,7 +84,8 @@ const WorkoutTracker = () => {
         const sortedWorkouts = data.sort((a, b) => a.day_number - b.day_number);
         setWorkouts(sortedWorkouts);
         
-        // 2. Загружаем прогресс
+        // 2. Загружаем прогресс (для новой программы — полностью)
+        progressCursor.current = null;
         await loadProgress();
         
       } catch (err) {
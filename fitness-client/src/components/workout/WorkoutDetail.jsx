@@ -1,14 +1,20 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate, useLocation } from 'react-router-dom'; // <--- Добавляем useLocation
 import api from '../services/api';
+import { useTelegramAuth } from '../../context/TelegramAuthContext';
 import ExerciseItem from './ExerciseItem';
 import Loader from '../ui/Loader';
 import './WorkoutDetail.css';
 
+const CURRENT_USER_ID = 1; // Заглушка ID пользователя
+
 const WorkoutDetail = () => {
   const { workoutId } = useParams(); 
   const navigate = useNavigate();
   const location = useLocation(); // <--- Хук для доступа к переданному состоянию
+  const { currentUser } = useTelegramAuth();
+  // Тот же пользователь, что и в трекере, иначе отметки уходят чужому прогрессу
+  const userId = currentUser?.id ?? CURRENT_USER_ID;
 
   // Сразу пробуем получить данные из состояния (переданы из Tracker)
   const initialData = location.state?.workoutData;
@@ -19,8 +25,6 @@ const WorkoutDetail = () => {
   const [isLoading, setIsLoading] = useState(!initialData); // Если данных нет, показываем лоадер
   const [isSaving, setIsSaving] = useState(false);
   const [error, setError] = useState(null);
-  
-  const CURRENT_USER_ID = 1;
 
   useEffect(() => {
     // Если данные пришли из Tracker, дополнительные запросы не нужны, 
@@ -33,11 +37,11 @@ const WorkoutDetail = () => {
     // Если данных нет (например, прямой переход по ссылке или F5),
     // пробуем загрузить с сервера (fallback логика)
     fetchWorkoutDetails();
-  }, [workoutId]);
+  }, [workoutId, userId]);
 
   const checkProgressStatus = async () => {
     try {
-      const progressRes = await api.get(`/users/${CURRENT_USER_ID}/progress`);
+      const progressRes = await api.get(`/users/${userId}/progress`);
       const progressList = progressRes.data;
       const existingProgress = progressList.find(p => p.workout_id === parseInt(workoutId));
       
@@ -96,44 +100,16 @@ const WorkoutDetail = () => {
     const newStatus = !isCompleted;
 
     try {
-      // 1. Загружаем текущий прогресс, чтобы найти ID записи
-      const progressRes = await api.get(`/users/${CURRENT_USER_ID}/progress`);
-      const progressList = progressRes.data;
-      const existingProgress = progressList.find(p => p.workout_id === parseInt(workoutId));
-
-      if (existingProgress) {
-        // 2. Если запись есть - обновляем её (теперь можно и True, и False)
-        await api.patch(`/progress/${existingProgress.id}/complete`, {
-            is_completed: newStatus // <--- Отправляем новое значение
-        });
-        
-        // Обновляем локальный стейт
-        setIsCompleted(newStatus);
-
-      } else {
-        // 3. Если записи нет - создаем новую
-        // ВАЖНО: Мы создаем запись с is_completed: false, а затем сразу обновляем её
-        // Это нужно, чтобы получить ID для обновления. 
-        // Если ваш POST на бэкенде умеет принимать is_completed: true сразу, можно упростить.
-        
-        const newProgressData = {
-            user_id: CURRENT_USER_ID,
-            program_id: workout.program_id,
-            workout_id: parseInt(workoutId),
-            is_completed: false // Создаем "пустую" запись
-        };
-        
-        const postRes = await api.post(`/progress`, newProgressData);
-        const createdId = postRes.data.id;
-
-        // Сразу же ставим нужный статус (создание прошло успешно)
-        await api.patch(`/progress/${createdId}/complete`, {
-            is_completed: newStatus
-        });
-        
-        // Обновляем локальный стейт
-        setIsCompleted(newStatus);
-      }
+      // Сервер создает запись или обновляет существующую для этого дня
+      await api.post(`/progress`, {
+          user_id: userId,
+          program_id: workout.program_id,
+          workout_id: parseInt(workoutId),
+          is_completed: newStatus
+      });
+
+      // Обновляем локальный стейт
+      setIsCompleted(newStatus);
 
     } catch (err) {
       console.error('Ошибка сохранения:', err);
@@ -1,4 +1,4 @@
-import React, { createContext, useContext, useState, useEffect } from 'react';
+import React, { createContext, useContext, useState, useEffect, useRef } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
 import { useTelegram } from '../hooks/useTelegram';
 import api from '../components/services/api';
@@ -19,6 +19,9 @@ export const TelegramAuthProvider = ({ children }) => {
   const [currentUser, setCurrentUser] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
+  // Ответ /bootstrap: трекер берет из него дни и прогресс для первого экрана.
+  // Данные одноразовые (см. takeBootstrap), поэтому хранятся в ref, а не в state
+  const bootstrapRef = useRef(null);
   const navigate = useNavigate();
   const location = useLocation();
 
@@ -30,43 +33,23 @@ export const TelegramAuthProvider = ({ children }) => {
         setIsLoading(true);
         setError(null);
 
-        // 1. Проверяем существует ли пользователь
-        let user = null;
-        try {
-          const response = await api.get(`/users/${telegramUser.id}`);
-          user = response.data;
-          console.log('Existing user found:', user);
-        } catch (err) {
-          if (err.response?.status === 404) {
-            // Пользователь не найден - создаем нового
-            console.log('User not found, creating new user...');
-            const createResponse = await api.post('/users', {
-              telegram_id: String(telegramUser.id),
-            });
-            user = createResponse.data;
-            console.log('New user created:', user);
-          } else {
-            throw err;
-          }
-        }
+        // Один запрос вместо цепочки: пользователь (создается при первом входе),
+        // его текущая программа, дни и прогресс
+        const response = await api.get('/bootstrap', {
+          params: { telegram_id: String(telegramUser.id) },
+        });
+        const { user, program } = response.data;
+        console.log('Bootstrap:', response.data);
 
         setCurrentUser(user);
+        bootstrapRef.current = response.data;
 
-        // 2. Проверяем есть ли у пользователя активная программа
-        const progressResponse = await api.get(`/users/${user.id}/progress`);
-        const userProgress = progressResponse.data;
-
-        console.log('User progress:', userProgress);
-
-        // Если есть программы в прогрессе
-        if (userProgress && userProgress.length > 0) {
-          // Берем первую активную программу (можно выбрать последнюю или по другой логике)
-          const activeProgram = userProgress[0];
-
+        // Если у пользователя есть программа в прогрессе
+        if (program) {
           // Проверяем, не находимся ли мы уже на нужном роуте
-          const targetPath = `/tracker/${activeProgram.program_id}`;
+          const targetPath = `/tracker/${program.id}`;
           if (location.pathname !== targetPath && location.pathname === '/') {
-            console.log('Redirecting to active program:', activeProgram.program_id);
+            console.log('Redirecting to active program:', program.id);
             navigate(targetPath, { replace: true });
           }
         } else {
@@ -87,6 +70,15 @@ export const TelegramAuthProvider = ({ children }) => {
     initUser();
   }, [isReady, telegramUser, navigate, location.pathname]);
 
+  // Отдает данные /bootstrap для программы один раз: при следующем открытии
+  // трекера они уже устарели, и он загружает дни и прогресс сам
+  const takeBootstrap = (programId) => {
+    const data = bootstrapRef.current;
+    if (data?.program?.id !== programId || !data.progress) return null;
+    bootstrapRef.current = null;
+    return data;
+  };
+
   if (isLoading) {
     return (
       <div style={{
@@ -122,7 +114,7 @@ export const TelegramAuthProvider = ({ children }) => {
   }
 
   return (
-    <TelegramAuthContext.Provider value={{ currentUser, telegramUser, setCurrentUser }}>
+    <TelegramAuthContext.Provider value={{ currentUser, telegramUser, setCurrentUser, takeBootstrap }}>
       {children}
     </TelegramAuthContext.Provider>
   );